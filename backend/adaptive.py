@@ -0,0 +1,127 @@
+# adaptive.py (early-stopping sweep: successive halving over grid cells by aggregate_score)
+import os
+from typing import List, Dict, Any, Callable, Optional
+
+import live_scoring
+import telemetry
+from metrics import analyze_response_batch
+from providers import generate
+
+MAX_ARMS = int(os.getenv("ADAPTIVE_MAX_ARMS", "256"))
+DEFAULT_ETA = int(os.getenv("ADAPTIVE_ETA", "2"))
+DEFAULT_MARGIN = float(os.getenv("ADAPTIVE_MARGIN", "0.05"))
+
+log = telemetry.get_logger("adaptive")
+
+
+def _arm_key(p: Dict[str, Any]):
+    return tuple(sorted((k, v) for k, v in p.items() if k != "n"))
+
+
+def arms_from(param_sets) -> List[Dict[str, Any]]:
+    """Candidate param sets; n is dropped since the search decides how often each is sampled."""
+    out, seen = [], set()
+    for p in param_sets:
+        arm = {k: v for k, v in p.items() if k != "n" and v is not None}
+        k = _arm_key(arm)
+        if k not in seen:
+            seen.add(k)
+            out.append(arm)
+        if len(out) > MAX_ARMS:
+            raise ValueError(f"adaptive search supports at most {MAX_ARMS} parameter combinations")
+    return out
+
+
+def plan_rounds(num_arms: int, eta: int) -> int:
+    """Rounds until halving leaves a single arm."""
+    rounds = 1
+    while num_arms > eta:
+        num_arms //= eta
+        rounds += 1
+    return rounds
+
+
+def run(
+    provider: str, model: str, prompt: str, arms: List[Dict[str, Any]], budget: int,
+    eta: int = DEFAULT_ETA, margin: float = DEFAULT_MARGIN, min_samples: int = 1, use_cache: bool = True,
+    on_round: Optional[Callable[[List[Dict[str, Any]], int, Dict[str, Any]], None]] = None,
+    metrics: Optional[List[str]] = None, live: Optional[live_scoring.Limits] = None,
+) -> Dict[str, Any]:
+    """
+    Successive halving: every round spends ~budget/rounds provider calls spread evenly
+    over the surviving arms, then keeps the top 1/eta by mean aggregate_score. Stops
+    when one arm is left, the leader is `margin` ahead of the runner-up, or the budget
+    is spent. on_round(enriched_responses, calls_so_far, summary) is called after each
+    round so callers can persist responses and progress. metrics limits scoring to a
+    subset; aggregate_score is always added since arms are ranked by it. live limits cut
+    degenerate streamed samples short; they are scored on their partial text like any other.
+    """
+    scored = None if metrics is None else list(metrics) + ["aggregate_score"]
+    eta = max(2, int(eta))
+    survivors = list(range(len(arms)))
+    sums = [0.0] * len(arms)
+    counts = [0] * len(arms)
+    rounds_left = plan_rounds(len(arms), eta)
+    calls = 0
+    history: List[Dict[str, Any]] = []
+    stop_reason = "budget"
+    leader: Optional[int] = None
+
+    def _mean(i: int) -> float:
+        return sums[i] / counts[i] if counts[i] else 0.0
+
+    while survivors and calls < budget:
+        # survivors are ranked after the first round, so a short budget keeps the best of them
+        survivors = survivors[:budget - calls]
+        per_round = (budget - calls) // max(1, rounds_left)
+        k = max(min_samples, per_round // len(survivors), 1)
+        k = min(k, (budget - calls) // len(survivors))
+        sets = [{**arms[i], "n": k} for i in survivors]
+        # repeated pulls of an arm need fresh samples, so only the first round may use the cache
+        raw = generate(provider, prompt, sets, model, use_cache=use_cache and not history, live=live)
+        enriched = analyze_response_batch(prompt, raw, scored)
+        for pos, r in enumerate(enriched):
+            i = survivors[pos // k]
+            sums[i] += float(r["metrics"].get("aggregate_score", 0.0))
+            counts[i] += 1
+        calls += len(enriched)
+        rounds_left -= 1
+
+        ranked = sorted(survivors, key=_mean, reverse=True)
+        leader = ranked[0]
+        summary = {
+            "round": len(history) + 1,
+            "arms": len(survivors),
+            "samples_per_arm": k,
+            "best": {**arms[ranked[0]], "mean_score": round(_mean(ranked[0]), 4), "samples": counts[ranked[0]]},
+        }
+        history.append(summary)
+        if on_round:
+            on_round(enriched, calls, summary)
+
+        if len(ranked) == 1:
+            stop_reason = "single_arm"
+            break
+        if _mean(ranked[0]) - _mean(ranked[1]) >= margin and counts[ranked[0]] >= 2 * min_samples:
+            stop_reason = "converged"
+            break
+        survivors = ranked[:max(1, len(ranked) // eta)]
+        if len(survivors) == 1:
+            stop_reason = "single_arm"
+            break
+        log.info("Adaptive round %s: %s arms left, best %.4f", summary["round"], len(survivors), _mean(ranked[0]))
+
+    # the answer is the last round's leader, not a lucky arm that was dropped after one sample
+    best = leader
+    return {
+        "best_param_set": arms[best] if best is not None else None,
+        "best_score": round(_mean(best), 4) if best is not None else None,
+        "calls": calls,
+        "budget": budget,
+        "stop_reason": stop_reason,
+        "rounds": history,
+        "leaderboard": [
+            {**arms[i], "mean_score": round(_mean(i), 4), "samples": counts[i]}
+            for i in sorted((i for i in range(len(arms)) if counts[i]), key=_mean, reverse=True)[:10]
+        ],
+    }
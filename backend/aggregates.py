@@ -0,0 +1,134 @@
+# aggregates.py (running per-experiment / per-param-cell metric statistics)
+import os
+import json
+import math
+import hashlib
+from typing import List, Dict, Any, Optional
+
+# fixed-width histogram over [0, 1] (every metric is normalized to that range) doubles
+# as the quantile sketch: mergeable by adding bins, error <= half a bin width
+HIST_BINS = int(os.getenv("AGG_HIST_BINS", "50"))
+EXPERIMENT_CELL = "*"
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def cell_key(param_set: Optional[Dict[str, Any]]) -> str:
+    canon = json.dumps({k: v for k, v in (param_set or {}).items() if v is not None}, sort_keys=True, default=str)
+    return hashlib.sha1(canon.encode("utf-8")).hexdigest()[:20]
+
+
+def _bin(v: float) -> int:
+    return min(HIST_BINS - 1, max(0, int(v * HIST_BINS)))
+
+
+def empty() -> Dict[str, Any]:
+    return {"count": 0, "sum": 0.0, "sumsq": 0.0, "min": None, "max": None, "hist": [0] * HIST_BINS}
+
+
+def add(stats: Dict[str, Any], v: float) -> None:
+    stats["count"] += 1
+    stats["sum"] += v
+    stats["sumsq"] += v * v
+    stats["min"] = v if stats["min"] is None else min(stats["min"], v)
+    stats["max"] = v if stats["max"] is None else max(stats["max"], v)
+    stats["hist"][_bin(v)] += 1
+
+
+def merge(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    hist_a = a.get("hist") or [0] * HIST_BINS
+    hist_b = b.get("hist") or [0] * HIST_BINS
+    if len(hist_a) != len(hist_b):
+        # AGG_HIST_BINS changed since the row was written: keep the newer layout
+        hist_a = [0] * len(hist_b)
+    mins = [x for x in (a.get("min"), b.get("min")) if x is not None]
+    maxs = [x for x in (a.get("max"), b.get("max")) if x is not None]
+    return {
+        "count": (a.get("count") or 0) + (b.get("count") or 0),
+        "sum": (a.get("sum") or 0.0) + (b.get("sum") or 0.0),
+        "sumsq": (a.get("sumsq") or 0.0) + (b.get("sumsq") or 0.0),
+        "min": min(mins) if mins else None,
+        "max": max(maxs) if maxs else None,
+        "hist": [x + y for x, y in zip(hist_a, hist_b)],
+    }
+
+
+def fold(enriched: List[Dict[str, Any]]) -> Dict[tuple, Dict[str, Any]]:
+    """
+    Partial aggregates of one add_responses batch, keyed by (cell, metric); the
+    experiment-wide cell is EXPERIMENT_CELL. Each value also carries the param_set.
+    """
+    out: Dict[tuple, Dict[str, Any]] = {}
+    for r in enriched:
+        p = r.get("param_set") or {}
+        cell = cell_key(p)
+        for metric, v in (r.get("metrics") or {}).items():
+            if not isinstance(v, (int, float)) or isinstance(v, bool) or math.isnan(v):
+                continue
+            for key, ps in (((EXPERIMENT_CELL, metric), None), ((cell, metric), p)):
+                st = out.get(key)
+                if st is None:
+                    st = out[key] = {**empty(), "param_set": ps}
+                add(st, float(v))
+    return out
+
+
+def combine(into: Dict[tuple, Dict[str, Any]], partial: Dict[tuple, Dict[str, Any]]) -> None:
+    """Merge one fold() result into another in place."""
+    for key, st in partial.items():
+        prev = into.get(key)
+        into[key] = st if prev is None else {**merge(prev, st), "param_set": st["param_set"]}
+
+
+def _quantile(hist: List[int], count: int, q: float, lo: Optional[float], hi: Optional[float]) -> Optional[float]:
+    if not count:
+        return None
+    target = q * count
+    seen = 0
+    for i, c in enumerate(hist):
+        if c and seen + c >= target:
+            # linear interpolation inside the bin, clamped to the observed range
+            v = (i + (target - seen) / c) / len(hist)
+            if lo is not None:
+                v = max(lo, v)
+            if hi is not None:
+                v = min(hi, v)
+            return round(v, 4)
+        seen += c
+    return hi
+
+
+def summarize(stats: Dict[str, Any]) -> Dict[str, Any]:
+    n = int(stats.get("count") or 0)
+    if not n:
+        return {"count": 0}
+    mean = stats["sum"] / n
+    var = max(0.0, stats["sumsq"] / n - mean * mean)
+    out = {
+        "count": n,
+        "mean": round(mean, 4),
+        "std": round(math.sqrt(var), 4),
+        "min": round(stats["min"], 4) if stats.get("min") is not None else None,
+        "max": round(stats["max"], 4) if stats.get("max") is not None else None,
+    }
+    for q in QUANTILES:
+        out[f"p{round(q * 100)}"] = _quantile(stats.get("hist") or [], n, q, stats.get("min"), stats.get("max"))
+    return out
+
+
+def build_summary(exp_id: str, rows: List[Dict[str, Any]], include_cells: bool = True) -> Dict[str, Any]:
+    """rows: stored aggregates {"cell", "metric", "param_set", count/sum/sumsq/min/max/hist}."""
+    overall: Dict[str, Any] = {}
+    cells: Dict[str, Dict[str, Any]] = {}
+    for r in rows:
+        if r["cell"] == EXPERIMENT_CELL:
+            overall[r["metric"]] = summarize(r)
+        elif include_cells:
+            c = cells.setdefault(r["cell"], {"cell": r["cell"], "param_set": r.get("param_set") or {}, "metrics": {}})
+            c["metrics"][r["metric"]] = summarize(r)
+    count = max((m["count"] for m in overall.values()), default=0)
+    out: Dict[str, Any] = {"experiment_id": exp_id, "count": count, "metrics": overall}
+    if include_cells:
+        for c in cells.values():
+            c["count"] = max((m["count"] for m in c["metrics"].values()), default=0)
+        out["cells"] = sorted(cells.values(), key=lambda c: -(c["metrics"].get("aggregate_score", {}).get("mean") or 0.0))
+    return out
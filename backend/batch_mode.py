@@ -0,0 +1,177 @@
+# batch_mode.py (provider batch APIs for large offline sweeps, POST /experiments mode=batch)
+import os
+import json
+import time
+import logging
+from typing import List, Dict, Any, Callable, Optional
+
+import response_cache
+
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "30"))
+BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
+BATCH_MAX_WAIT_SECONDS = float(os.getenv("BATCH_MAX_WAIT_SECONDS", str(26 * 3600)))
+
+# OpenAI and Groq share the same files + batches API shape; chat completions is the
+# endpoint both accept, so one request format covers them. Point OPENAI_BASE_URL /
+# GROQ_BASE_URL (read by the SDKs) at a local stand-in to exercise this offline.
+BATCH_ENDPOINT = "/v1/chat/completions"
+_TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchError(Exception):
+    pass
+
+
+def _openai_client():
+    from openai_client import _make_client
+    return _make_client()
+
+
+def _groq_client():
+    from groq_client import _client
+    return _client()
+
+
+_CLIENTS: Dict[str, Callable[[], Any]] = {"openai": _openai_client, "groq": _groq_client}
+
+
+def supports_batch(provider: str) -> bool:
+    return provider in _CLIENTS
+
+
+def _n(p: Dict[str, Any]) -> int:
+    return int(p.get("n", 1) or 1)
+
+
+def _custom_id(set_index: int, k: int) -> str:
+    return f"set-{set_index}-{k}"
+
+
+def build_jsonl(prompt: str, param_sets: List[Dict[str, Any]], indices: List[int], model: str) -> bytes:
+    """One request line per (param set, n) cell of the given param-set indices."""
+    lines = []
+    for i in indices:
+        p = param_sets[i]
+        body: Dict[str, Any] = {
+            "model": model,
+            "messages": [{"role": "user", "content": p.get("prompt_override") or prompt}],
+            "temperature": p.get("temperature", 0.7),
+            "top_p": p.get("top_p", 1.0),
+        }
+        if p.get("max_tokens"):
+            body["max_tokens"] = p["max_tokens"]
+        for k in range(_n(p)):
+            lines.append(json.dumps({"custom_id": _custom_id(i, k), "method": "POST",
+                                     "url": BATCH_ENDPOINT, "body": body}))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def submit(provider: str, model: str, prompt: str, param_sets: List[Dict[str, Any]], indices: List[int]) -> str:
+    client = _CLIENTS[provider]()
+    f = client.files.create(file=("batch.jsonl", build_jsonl(prompt, param_sets, indices, model)), purpose="batch")
+    batch = client.batches.create(input_file_id=f.id, endpoint=BATCH_ENDPOINT,
+                                  completion_window=BATCH_COMPLETION_WINDOW)
+    logging.info("Submitted %s batch %s (%d param sets)", provider, batch.id, len(indices))
+    return batch.id
+
+
+def wait(provider: str, batch_id: str, poll_seconds: Optional[float] = None,
+         max_wait: Optional[float] = None) -> Any:
+    """Poll until the batch reaches a terminal status; returns the batch object."""
+    poll_seconds = BATCH_POLL_SECONDS if poll_seconds is None else poll_seconds
+    max_wait = BATCH_MAX_WAIT_SECONDS if max_wait is None else max_wait
+    client = _CLIENTS[provider]()
+    deadline = time.monotonic() + max_wait
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in _TERMINAL:
+            return batch
+        if time.monotonic() > deadline:
+            raise BatchError(f"batch {batch_id} still {batch.status} after {int(max_wait)}s")
+        time.sleep(poll_seconds)
+
+
+def _read_lines(client: Any, file_id: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    if not file_id:
+        return {}
+    out: Dict[str, Dict[str, Any]] = {}
+    for line in client.files.content(file_id).read().decode("utf-8").splitlines():
+        if line.strip():
+            row = json.loads(line)
+            out[row.get("custom_id")] = row
+    return out
+
+
+def _text_or_error(row: Optional[Dict[str, Any]]):
+    if row is None:
+        return None, "missing from batch output"
+    resp = row.get("response") or {}
+    if row.get("error") or resp.get("status_code", 200) != 200:
+        err = row.get("error") or (resp.get("body") or {}).get("error") or f"status {resp.get('status_code')}"
+        return None, err.get("message", str(err)) if isinstance(err, dict) else str(err)
+    try:
+        return resp["body"]["choices"][0]["message"]["content"] or "", None
+    except (KeyError, IndexError, TypeError) as e:
+        return None, f"unexpected batch output: {e}"
+
+
+def collect(provider: str, batch: Any) -> Dict[str, Dict[str, Any]]:
+    """custom_id -> output line; failed requests (error file) are merged in."""
+    if batch.status != "completed" and not getattr(batch, "output_file_id", None):
+        raise BatchError(f"batch {batch.id} {batch.status}: {getattr(batch, 'errors', None)}")
+    client = _CLIENTS[provider]()
+    rows = _read_lines(client, getattr(batch, "error_file_id", None))
+    rows.update(_read_lines(client, getattr(batch, "output_file_id", None)))
+    return rows
+
+
+def generate_batch(
+    provider: str, prompt: str, param_sets: List[Dict[str, Any]], model: str,
+    use_cache: bool = True, batch_id: Optional[str] = None, batch_indices: Optional[List[int]] = None,
+    on_submit: Optional[Callable[[str, List[int]], None]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Same contract as providers.generate (one result per cell, in order), but the cache
+    misses go out as a single provider batch; on_submit(batch_id, indices) gets the batch
+    and the param-set indices in it. Pass both back as batch_id / batch_indices to resume
+    polling that batch from another process instead of submitting again: its custom_ids
+    refer to those indices, whatever the response cache holds by then. Cells outside the
+    batch that have since dropped out of the cache are generated the regular way.
+    """
+    by_set: Dict[int, List[Dict[str, Any]]] = {}
+    misses = list(range(len(param_sets)))
+    if use_cache:
+        by_set, misses = response_cache.lookup(provider, model, prompt, param_sets)
+    if batch_id and batch_indices is None:
+        # jobs submitted before the indices were stored: the cache is the only record left
+        logging.warning("Batch %s has no stored param-set indices; assuming the current cache misses", batch_id)
+    elif batch_id:
+        in_batch = set(batch_indices)
+        outside = [i for i in misses if i not in in_batch]
+        if outside:
+            from providers import generate
+            results = generate(provider, prompt, [param_sets[i] for i in outside], model, use_cache=use_cache)
+            pos = 0
+            for i in outside:
+                by_set[i] = results[pos:pos + _n(param_sets[i])]
+                pos += _n(param_sets[i])
+        misses = sorted(in_batch)
+    if misses:
+        if not batch_id:
+            batch_id = submit(provider, model, prompt, param_sets, misses)
+            if on_submit:
+                on_submit(batch_id, misses)
+        rows = collect(provider, wait(provider, batch_id))
+        for i in misses:
+            results = []
+            for k in range(_n(param_sets[i])):
+                text, err = _text_or_error(rows.get(_custom_id(i, k)))
+                if err:
+                    logging.warning("Batch %s cell %s-%s failed: %s", batch_id, i, k, err)
+                    results.append({"param_set": param_sets[i], "text": "", "error": err})
+                else:
+                    results.append({"param_set": param_sets[i], "text": text})
+            by_set[i] = results
+            if use_cache:
+                response_cache.store(provider, model, prompt, param_sets[i], results)
+    return [r for i in range(len(param_sets)) for r in by_set[i]]
@@ -0,0 +1,329 @@
+# bench.py (benchmarks for the generation, scoring, storage and export paths; not a test)
+#
+#   python bench.py --out bench.json                       # everything
+#   python bench.py --only api,scoring --quick             # a subset, smaller sizes
+#   python bench.py --stub-latency-ms 300 --concurrency 1,8,32
+#
+# Runs against a throwaway SQLite file (never llmlab.db). Providers: "mock" (_mock_generate,
+# in process) and "stub", a local HTTP server speaking the OpenAI Responses API with injected
+# latency, reached through the real openai client / rate limiter / connection pool.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+import tracemalloc
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Callable
+
+WORDS = ("the model answer explains light energy plants water carbon dioxide glucose oxygen process cells "
+         "chlorophyll leaves sun reaction produce because therefore however example first second finally "
+         "important result data quality response summary clear structure detail").split()
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    xs = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(1000 * xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))], 3)
+
+    return {"p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": round(1000 * xs[-1], 3),
+            "mean_ms": round(1000 * sum(xs) / len(xs), 3)}
+
+
+def _text(rng: random.Random, words: int) -> str:
+    out, line = [], []
+    for i in range(words):
+        line.append(rng.choice(WORDS))
+        if len(line) >= rng.randint(8, 16) or i == words - 1:
+            out.append(" ".join(line).capitalize() + ".")
+            line = []
+    return " ".join(out)
+
+
+def _enriched(rng: random.Random, n: int, words: int) -> List[Dict[str, Any]]:
+    from metrics import METRIC_KEYS
+    return [{"param_set": {"temperature": round(rng.random(), 2), "top_p": 1.0, "max_tokens": 150, "n": 1},
+             "text": _text(rng, words), "metrics": {k: round(rng.random(), 4) for k in METRIC_KEYS}}
+            for _ in range(n)]
+
+
+# ---------------- latency-injecting stub provider ----------------
+
+class _StubHandler(BaseHTTPRequestHandler):
+    latency_ms = 200.0
+    jitter = 0.3
+    words = 120
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        rng = random.Random()
+        time.sleep(max(0.0, rng.gauss(self.latency_ms, self.latency_ms * self.jitter)) / 1000.0)
+        text = _text(rng, self.words)
+        payload = {
+            "id": f"resp_{rng.getrandbits(48):x}", "object": "response", "created_at": int(time.time()),
+            "status": "completed", "model": body.get("model", "stub"),
+            "output": [{"type": "message", "id": "msg_stub", "role": "assistant", "status": "completed",
+                        "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+            "usage": {"input_tokens": 20, "output_tokens": self.words, "total_tokens": 20 + self.words},
+        }
+        raw = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(latency_ms: float) -> str:
+    _StubHandler.latency_ms = latency_ms
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+# ---------------- benchmarks ----------------
+
+def bench_api(providers: List[str], concurrency: List[int], requests_per_level: int, param_sets: int) -> List[Dict[str, Any]]:
+    """End-to-end POST /experiments through the app (sync mode): generate, score, store."""
+    from fastapi.testclient import TestClient
+    import main
+
+    out = []
+    body_sets = [{"temperature": round(0.1 + 0.8 * i / max(1, param_sets - 1), 2)} for i in range(param_sets)]
+    with TestClient(main.app) as client:
+        for provider in providers:
+            # stub goes through the openai adapter, pointed at the local server
+            api_provider = "openai" if provider == "stub" else provider
+            for conc in concurrency:
+                payload = {"prompt": "Explain photosynthesis to a ten year old.", "provider": api_provider,
+                           "param_sets": body_sets, "use_cache": False, "mode": "sync"}
+                latencies: List[float] = []
+                errors = 0
+
+                def one(_i: int) -> None:
+                    nonlocal errors
+                    t0 = time.perf_counter()
+                    r = client.post("/experiments", json=payload)
+                    latencies.append(time.perf_counter() - t0)
+                    if r.status_code != 200:
+                        errors += 1
+
+                t0 = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=conc) as pool:
+                    list(pool.map(one, range(requests_per_level)))
+                wall = time.perf_counter() - t0
+                row = {"provider": provider, "concurrency": conc, "requests": requests_per_level,
+                       "param_sets": param_sets, "errors": errors, "seconds": round(wall, 3),
+                       "requests_per_s": round(requests_per_level / wall, 2), **_percentiles(latencies)}
+                _log(f"api {provider} c={conc}: {row['requests_per_s']} req/s p50={row.get('p50_ms')}ms p99={row.get('p99_ms')}ms")
+                out.append(row)
+    return out
+
+
+def bench_scoring(lengths: List[int], batch_sizes: List[int], min_seconds: float) -> List[Dict[str, Any]]:
+    from metrics import analyze_response_batch
+
+    rng = random.Random(7)
+    prompt = "Explain photosynthesis and why plants need light, water and carbon dioxide."
+    out = []
+    for words in lengths:
+        for size in batch_sizes:
+            raw = [{"param_set": {"temperature": 0.7}, "text": _text(rng, words)} for _ in range(size)]
+            analyze_response_batch(prompt, raw[:1])  # warm up (lazy imports, nltk data)
+            runs, t0 = 0, time.perf_counter()
+            while True:
+                analyze_response_batch(prompt, raw)
+                runs += 1
+                elapsed = time.perf_counter() - t0
+                if elapsed >= min_seconds:
+                    break
+            n = runs * size
+            row = {"words": words, "batch_size": size, "responses": n, "seconds": round(elapsed, 3),
+                   "responses_per_s": round(n / elapsed, 1), "words_per_s": round(n * words / elapsed)}
+            _log(f"scoring {words}w x{size}: {row['responses_per_s']} resp/s")
+            out.append(row)
+    return out
+
+
+def bench_storage(sizes: List[int], words: int, repeats: int) -> List[Dict[str, Any]]:
+    import storage
+
+    rng = random.Random(11)
+    out = []
+    for size in sizes:
+        rows = _enriched(rng, size, words)
+        adds, gets, gets_metrics = [], [], []
+        for _ in range(repeats):
+            exp_id = storage.create_experiment("bench", "bench prompt", "bench-model")
+            t0 = time.perf_counter()
+            storage.add_responses(exp_id, rows)
+            adds.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            n = len(storage.get_experiment(exp_id)["responses"])
+            gets.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            storage.get_experiment(exp_id, fields=("param_set", "metrics"))
+            gets_metrics.append(time.perf_counter() - t0)
+            assert n == size
+        best = lambda xs: min(xs)  # noqa: E731 - least noisy of the repeats
+        row = {"rows": size, "words": words, "repeats": repeats,
+               "add_responses_ms": round(1000 * best(adds), 2), "add_rows_per_s": round(size / best(adds)),
+               "get_experiment_ms": round(1000 * best(gets), 2), "get_rows_per_s": round(size / best(gets)),
+               "get_experiment_metrics_only_ms": round(1000 * best(gets_metrics), 2)}
+        _log(f"storage {size} rows: add {row['add_responses_ms']}ms, get {row['get_experiment_ms']}ms")
+        out.append(row)
+    return out
+
+
+def _measure(fn: Callable[[], int]) -> Dict[str, Any]:
+    # timed run first, then a second one under tracemalloc (which slows allocation) for the peak
+    t0 = time.perf_counter()
+    size = fn()
+    seconds = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    _cur, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(seconds, 3), "bytes": size, "peak_mb": round(peak / 1e6, 2)}
+
+
+def bench_export(rows: int, words: int, formats: List[str]) -> List[Dict[str, Any]]:
+    from fastapi.testclient import TestClient
+    import main
+    import storage
+
+    rng = random.Random(13)
+    exp_id = storage.create_experiment("bench export", "bench prompt", "bench-model")
+    for i in range(0, rows, 5000):
+        storage.add_responses(exp_id, _enriched(rng, min(5000, rows - i), words))
+    out = []
+    with TestClient(main.app) as client:
+        for fmt in formats:
+            def run() -> int:
+                total = 0
+                with client.stream("GET", f"/experiments/{exp_id}/export/{fmt}") as r:
+                    r.raise_for_status()
+                    for chunk in r.iter_bytes():
+                        total += len(chunk)
+                return total
+            try:
+                row = {"format": fmt, "rows": rows, **_measure(run)}
+            except Exception as e:  # e.g. parquet without pyarrow
+                row = {"format": fmt, "rows": rows, "error": str(e)}
+            else:
+                row["rows_per_s"] = round(rows / row["seconds"]) if row["seconds"] else None
+            _log(f"export {fmt}: {row}")
+            out.append(row)
+    return out
+
+
+# ---------------- driver ----------------
+
+def _log(msg: str) -> None:
+    print(msg, file=sys.stderr, flush=True)
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return ""
+
+
+def _ints(s: str) -> List[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+SECTIONS = ("api", "scoring", "storage", "export")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark the generation, scoring, storage and export paths.")
+    ap.add_argument("--out", default="bench.json", help="results file (JSON)")
+    ap.add_argument("--only", default=",".join(SECTIONS), help=f"comma-separated subset of {','.join(SECTIONS)}")
+    ap.add_argument("--quick", action="store_true", help="small sizes, for a smoke run")
+    ap.add_argument("--providers", default="mock,stub")
+    ap.add_argument("--concurrency", default="1,4,16")
+    ap.add_argument("--requests", type=int, default=None, help="POST /experiments per concurrency level")
+    ap.add_argument("--param-sets", type=int, default=5)
+    ap.add_argument("--stub-latency-ms", type=float, default=200.0)
+    ap.add_argument("--text-lengths", default="50,200,1000", help="words per response for scoring")
+    ap.add_argument("--batch-sizes", default="1,10,100")
+    ap.add_argument("--storage-sizes", default=None)
+    ap.add_argument("--export-rows", type=int, default=None)
+    ap.add_argument("--export-formats", default="json,ndjson,csv,parquet")
+    args = ap.parse_args()
+
+    sections = [s for s in args.only.split(",") if s]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        ap.error(f"unknown sections: {', '.join(sorted(unknown))}")
+    requests_per_level = args.requests or (20 if args.quick else 200)
+    storage_sizes = _ints(args.storage_sizes) if args.storage_sizes else ([100, 1000] if args.quick else [100, 1000, 10000])
+    export_rows = args.export_rows or (2000 if args.quick else 50000)
+
+    # settings have to be in place before the app modules are imported
+    workdir = tempfile.mkdtemp(prefix="llmlab-bench-")
+    os.environ["DB_KIND"] = "sql"
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["RESPONSE_CACHE_ENABLED"] = "0"
+    os.environ.setdefault("RATE_LIMIT_RPM", "1000000")
+    os.environ.setdefault("RATE_LIMIT_TPM", "1000000000")
+    providers = [p for p in args.providers.split(",") if p]
+    if "stub" in providers:
+        os.environ["OPENAI_BASE_URL"] = start_stub(args.stub_latency_ms)
+        os.environ["OPENAI_API_KEY"] = "bench"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import storage
+    storage.init_storage()
+
+    results: Dict[str, Any] = {}
+    t0 = time.time()
+    # the mock provider and the request logging print per call; keep that out of the timings
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if "scoring" in sections:
+            results["scoring"] = bench_scoring(_ints(args.text_lengths), _ints(args.batch_sizes),
+                                               min_seconds=0.2 if args.quick else 1.0)
+        if "storage" in sections:
+            results["storage"] = bench_storage(storage_sizes, words=150, repeats=2 if args.quick else 3)
+        if "api" in sections:
+            results["api"] = bench_api(providers, _ints(args.concurrency), requests_per_level, args.param_sets)
+        if "export" in sections:
+            results["export"] = bench_export(export_rows, words=150, formats=args.export_formats.split(","))
+
+    report = {
+        "meta": {
+            "started_at": datetime.datetime.utcfromtimestamp(t0).isoformat() + "Z",
+            "seconds": round(time.time() - t0, 2),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out} ({', '.join(results)}) in {report['meta']['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
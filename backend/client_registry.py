@@ -0,0 +1,81 @@
+# client_registry.py (process-wide provider SDK clients with pooled HTTP connections)
+import os
+import hashlib
+import logging
+import weakref
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+import httpx
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))
+
+_clients: Dict[Tuple[str, str], Tuple[Any, httpx.Client]] = {}  # key -> (SDK client, its httpx client)
+_lock = threading.Lock()
+
+
+def http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def http_client() -> httpx.Client:
+    """A keep-alive httpx client sized by HTTP_MAX_CONNECTIONS / HTTP_MAX_KEEPALIVE."""
+    return httpx.Client(limits=http_limits(), timeout=HTTP_TIMEOUT)
+
+
+def _fingerprint(api_key: str) -> str:
+    # never keep raw keys as dict keys / in stats
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def get_client(provider: str, api_key: str, factory: Callable[[str, httpx.Client], Any]) -> Any:
+    """
+    Return the shared client for (provider, api_key), building it once with
+    factory(api_key, http) where http is a pooled client from http_client().
+    """
+    key = (provider, _fingerprint(api_key))
+    entry = _clients.get(key)
+    if entry is not None:
+        return entry[0]
+    with _lock:
+        entry = _clients.get(key)
+        if entry is None:
+            http = http_client()
+            entry = _clients[key] = (factory(api_key, http), http)
+        return entry[0]
+
+
+def _close(provider: str, http: httpx.Client) -> None:
+    try:
+        http.close()
+    except Exception as e:
+        logging.warning("Closing %s client failed: %s", provider, e)
+
+
+def invalidate(provider: str) -> int:
+    """
+    Drop every cached client for a provider, e.g. after POST /apikey rotates its key. Sweeps
+    already running keep using the client they hold; its connections close once the last
+    of them lets go of it.
+    """
+    with _lock:
+        stale = [k for k in _clients if k[0] == provider]
+        dropped = [_clients.pop(k) for k in stale]
+    for client, http in dropped:
+        weakref.finalize(client, _close, provider, http)
+    return len(dropped)
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        by_provider: Dict[str, int] = {}
+        for provider, _fp in _clients:
+            by_provider[provider] = by_provider.get(provider, 0) + 1
+    return {"clients": by_provider, "max_connections": HTTP_MAX_CONNECTIONS, "max_keepalive": HTTP_MAX_KEEPALIVE}
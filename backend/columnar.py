@@ -0,0 +1,118 @@
+# columnar.py (typed Arrow / Parquet exports of stored responses)
+import os
+import io
+import tempfile
+from typing import List, Dict, Any, Iterable, Iterator
+
+from metrics import METRIC_KEYS
+
+BATCH_ROWS = int(os.getenv("COLUMNAR_BATCH_ROWS", "2000"))
+
+# param_set fields flattened into typed columns; unknown keys are dropped
+PARAM_FIELDS = [
+    ("temperature", "float64"),
+    ("top_p", "float64"),
+    ("max_tokens", "int64"),
+    ("n", "int64"),
+    ("prompt_override", "string"),
+]
+
+
+class ColumnarUnavailable(Exception):
+    pass
+
+
+def _pa():
+    try:
+        import pyarrow as pa
+        return pa
+    except ImportError as e:
+        raise ColumnarUnavailable("pyarrow is not installed; pip install pyarrow to enable columnar exports") from e
+
+
+def schema(include_text: bool = True):
+    pa = _pa()
+    fields = [
+        pa.field("experiment_id", pa.string()),
+        pa.field("experiment_title", pa.string()),
+        pa.field("model", pa.string()),
+        pa.field("response_id", pa.string()),
+    ]
+    fields += [pa.field(f"param_{k}", getattr(pa, t)()) for k, t in PARAM_FIELDS]
+    if include_text:
+        fields.append(pa.field("text", pa.string()))
+    fields += [pa.field(f"metric_{k}", pa.float64()) for k in METRIC_KEYS]
+    return pa.schema(fields)
+
+
+def _batches(rows: Iterable[Dict[str, Any]], sch, include_text: bool) -> Iterator[Any]:
+    """rows: {"experiment": {...}, "response": {...}} pairs -> RecordBatches of BATCH_ROWS."""
+    pa = _pa()
+    names = sch.names
+
+    def _empty():
+        return {n: [] for n in names}
+
+    cols = _empty()
+    count = 0
+    for row in rows:
+        exp, r = row["experiment"], row["response"]
+        p = r.get("param_set") or {}
+        m = r.get("metrics") or {}
+        cols["experiment_id"].append(exp.get("id"))
+        cols["experiment_title"].append(exp.get("title"))
+        cols["model"].append(exp.get("model"))
+        cols["response_id"].append(r.get("response_id"))
+        for k, _t in PARAM_FIELDS:
+            cols[f"param_{k}"].append(p.get(k))
+        if include_text:
+            cols["text"].append(r.get("text"))
+        for k in METRIC_KEYS:
+            v = m.get(k)
+            cols[f"metric_{k}"].append(float(v) if v is not None else None)
+        count += 1
+        if count >= BATCH_ROWS:
+            yield pa.RecordBatch.from_pydict(cols, schema=sch)
+            cols, count = _empty(), 0
+    if count:
+        yield pa.RecordBatch.from_pydict(cols, schema=sch)
+
+
+def iter_arrow_stream(rows: Iterable[Dict[str, Any]], include_text: bool = True) -> Iterator[bytes]:
+    """Arrow IPC stream format: each record batch is flushed to the client as it is built."""
+    pa = _pa()
+    sch = schema(include_text)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, sch) as writer:
+        for batch in _batches(rows, sch, include_text):
+            writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+def iter_parquet(rows: Iterable[Dict[str, Any]], include_text: bool = True, chunk: int = 1 << 20) -> Iterator[bytes]:
+    """
+    Parquet needs its footer written last, so row groups are spilled to a temp file
+    (one per record batch) and the finished file is streamed back in chunks.
+    """
+    _pa()
+    import pyarrow.parquet as pq
+    sch = schema(include_text)
+    with tempfile.TemporaryFile() as f:
+        with pq.ParquetWriter(f, sch, compression="zstd") as writer:
+            for batch in _batches(rows, sch, include_text):
+                writer.write_batch(batch)
+        f.seek(0)
+        while True:
+            data = f.read(chunk)
+            if not data:
+                break
+            yield data
+
+
+def rows_for(experiments: List[Dict[str, Any]], iter_responses, page_size: int) -> Iterator[Dict[str, Any]]:
+    for exp in experiments:
+        for r in iter_responses(exp["id"], page_size):
+            yield {"experiment": exp, "response": r}
@@ -0,0 +1,35 @@
+# compact.py (compress texts / move metrics into typed columns for rows written before that existed)
+#
+#   python compact.py --chunk-size 2000 --vacuum
+#   python compact.py --search-index      # (re)build the full-text index used by GET /search
+#
+import os
+import time
+import argparse
+
+from dotenv import load_dotenv
+load_dotenv()
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("COMPACT_CHUNK_SIZE", "1000"))
+
+
+def compact(chunk_size: int = DEFAULT_CHUNK_SIZE, vacuum: bool = False, search_index: bool = False):
+    from storage import init_storage, compact_responses, reindex_search, vacuum as st_vacuum
+    init_storage()
+    t0 = time.time()
+    out = {"compacted": compact_responses(chunk_size)}
+    if search_index:
+        out["indexed"] = reindex_search(chunk_size)
+    if vacuum:
+        st_vacuum()
+    out["seconds"] = round(time.time() - t0, 2)
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Compact stored responses in place.")
+    ap.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    ap.add_argument("--vacuum", action="store_true", help="reclaim the freed space afterwards (SQLite/Postgres VACUUM, Mongo compact)")
+    ap.add_argument("--search-index", action="store_true", help="rebuild the full-text search index from the stored responses")
+    args = ap.parse_args()
+    print(compact(args.chunk_size, args.vacuum, args.search_index))
@@ -0,0 +1,67 @@
+# concurrency.py (bounded fan-out helpers shared by the provider clients)
+import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Iterator, List, Sequence, Tuple
+
+DEFAULT_CONCURRENCY = int(os.getenv("PROVIDER_CONCURRENCY", "8"))
+
+
+def provider_concurrency(provider: str) -> int:
+    """
+    Max in-flight calls for a provider. <PROVIDER>_CONCURRENCY overrides the
+    global PROVIDER_CONCURRENCY default; 1 restores the old sequential behaviour.
+    """
+    raw = os.getenv(f"{provider.upper()}_CONCURRENCY")
+    try:
+        n = int(raw) if raw else DEFAULT_CONCURRENCY
+    except ValueError:
+        n = DEFAULT_CONCURRENCY
+    return max(1, n)
+
+
+def _safe_call(fn: Callable[[Any], Any], item: Any) -> Any:
+    try:
+        return fn(item)
+    except Exception as e:
+        return e
+
+
+def _submit(pool: ThreadPoolExecutor, fn: Callable[[Any], Any], item: Any):
+    # each call runs in a copy of the caller's context so the request trace (and its spans) follow it onto
+    # the worker; one copy per item, a Context can only be entered by one thread at a time
+    return pool.submit(contextvars.copy_context().run, _safe_call, fn, item)
+
+
+def map_ordered(fn: Callable[[Any], Any], items: Sequence[Any], max_workers: int) -> List[Any]:
+    """
+    Run fn over items on a bounded thread pool and return results in input order.
+    A failing call does not cancel the others: its exception is returned in place
+    of the result so the caller decides how to record it.
+    """
+    if not items:
+        return []
+    workers = max(1, min(max_workers, len(items)))
+    if workers == 1:
+        return [_safe_call(fn, it) for it in items]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futs = [_submit(pool, fn, it) for it in items]
+        return [f.result() for f in futs]
+
+
+def iter_completed(fn: Callable[[Any], Any], items: Sequence[Any], max_workers: int) -> Iterator[Tuple[int, Any]]:
+    """
+    Same contract as map_ordered but yields (index, result_or_exception) as soon as
+    each call finishes, so callers can forward results before the sweep is done.
+    """
+    if not items:
+        return
+    workers = max(1, min(max_workers, len(items)))
+    if workers == 1:
+        for i, it in enumerate(items):
+            yield i, _safe_call(fn, it)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futs = {_submit(pool, fn, it): i for i, it in enumerate(items)}
+        for fut in as_completed(futs):
+            yield futs[fut], fut.result()
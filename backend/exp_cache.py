@@ -0,0 +1,140 @@
+# exp_cache.py (read-through cache of serialized GET /experiments/{id} payloads)
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+EXP_CACHE_ENABLED = os.getenv("EXP_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+EXP_CACHE_MAX_BYTES = int(os.getenv("EXP_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# writes from other processes (rescore CLI, a second worker) aren't seen here; the TTL bounds that staleness
+EXP_CACHE_TTL = float(os.getenv("EXP_CACHE_TTL", "300"))  # seconds, 0 = never expire
+_MAX_GENERATIONS = 100000  # write counters kept for the most recently written experiments
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # weak comparison, as If-None-Match requires
+    return "*" in tags or etag in tags or etag in (t[2:] for t in tags if t.startswith("W/"))
+
+
+class ExperimentCache:
+    """
+    LRU of JSON bodies keyed by (experiment id, fields), bounded by total body bytes.
+    Every write to an experiment bumps its generation and drops its entries; a reader
+    passes the generation it saw before going to the DB, so a payload read while a
+    write was landing is never cached.
+    """
+
+    def __init__(self, max_bytes: int = EXP_CACHE_MAX_BYTES, ttl: float = EXP_CACHE_TTL, enabled: bool = EXP_CACHE_ENABLED):
+        self.max_bytes = max(0, max_bytes)
+        self.ttl = ttl
+        self.enabled = enabled
+        self._mem: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (body, etag, created_at)
+        self._by_exp: Dict[str, set] = {}
+        self._gens: "OrderedDict[str, int]" = OrderedDict()
+        self._writes = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0, "too_large": 0}
+
+    def _drop(self, key: tuple) -> None:
+        body, _etag, _t = self._mem.pop(key)
+        self._bytes -= len(body)
+        keys = self._by_exp.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_exp[key[0]]
+
+    def get(self, exp_id: str, fields: tuple) -> Optional[Tuple[bytes, str]]:
+        if not self.enabled:
+            return None
+        key = (exp_id, fields)
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit and self.ttl > 0 and time.time() - hit[2] > self.ttl:
+                self._drop(key)
+                hit = None
+            if hit is None:
+                self._stats["misses"] += 1
+                return None
+            self._mem.move_to_end(key)
+            self._stats["hits"] += 1
+            return hit[0], hit[1]
+
+    def generation(self, exp_id: str) -> int:
+        with self._lock:
+            return self._gens.get(exp_id, 0)
+
+    def put(self, exp_id: str, fields: tuple, body: bytes, generation: int) -> Tuple[bytes, str]:
+        """Store a freshly read body (if still current) and return it with its ETag."""
+        etag = make_etag(body)
+        if not self.enabled:
+            return body, etag
+        key = (exp_id, fields)
+        with self._lock:
+            if self._gens.get(exp_id, 0) != generation:
+                return body, etag
+            if len(body) > self.max_bytes:
+                self._stats["too_large"] += 1
+                return body, etag
+            if key in self._mem:
+                self._drop(key)
+            self._mem[key] = (body, etag, time.time())
+            self._by_exp.setdefault(exp_id, set()).add(key)
+            self._bytes += len(body)
+            self._stats["stores"] += 1
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._mem)))
+                self._stats["evictions"] += 1
+        return body, etag
+
+    def _bump(self, exp_id: str) -> None:
+        # globally increasing, so a forgotten (pruned) counter can't come back with a value a reader saw
+        self._writes += 1
+        self._gens[exp_id] = self._writes
+        self._gens.move_to_end(exp_id)
+        while len(self._gens) > _MAX_GENERATIONS:
+            self._gens.popitem(last=False)
+
+    def invalidate(self, exp_id: str) -> None:
+        with self._lock:
+            self._bump(exp_id)
+            for key in list(self._by_exp.get(exp_id, ())):
+                self._drop(key)
+            self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for exp_id in list(self._by_exp):
+                self._bump(exp_id)
+            self._mem.clear()
+            self._by_exp.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "entries": len(self._mem),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": round(self._stats["hits"] / total, 4) if total else 0.0,
+            }
+
+
+cache = ExperimentCache()
+
+
+def invalidate(exp_id: str) -> None:
+    cache.invalidate(exp_id)
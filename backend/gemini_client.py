@@ -1,17 +1,30 @@
-import os, time, re
-from typing import List, Dict, Any
+import os, re
+from typing import List, Dict, Any, Iterator, Tuple
 from dotenv import load_dotenv
 load_dotenv()
 
 from google import genai
 from google.genai import types as gt  # typed config
 
+import rate_limiter
+import telemetry
+from client_registry import get_client, HTTP_TIMEOUT
+from concurrency import map_ordered, iter_completed, provider_concurrency
+
 DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 
 def _client() -> genai.Client:
-    key = os.getenv("geminiPi") or os.getenv("GEMINI_API_KEY") or os.getenv("GEMINI_KEY")
+    key = os.getenv("geminiPi") or os.getenv("GEMINI_API_KEY") or os.getenv("GEMINI_KEY") or os.getenv("GOOGLE_API_KEY")
     if not key:
-        raise ValueError("Gemini API key not found (geminiPi / GEMINI_API_KEY / GEMINI_KEY).")
+        raise ValueError("Gemini API key not found (geminiPi / GEMINI_API_KEY / GEMINI_KEY / GOOGLE_API_KEY).")
+    # cached per key, so the retry loop and every cell reuse one client and its connection pool
+    return get_client("gemini", key, _make_client)
+
+def _make_client(key: str, http) -> genai.Client:
+    # google-genai takes a ready httpx client from 1.x on; older SDKs pool with their own defaults
+    if "httpx_client" in getattr(gt.HttpOptions, "model_fields", {}):
+        # timeout is per request and in ms; unset, the SDK would send every request with none
+        return genai.Client(api_key=key, http_options=gt.HttpOptions(httpx_client=http, timeout=int(HTTP_TIMEOUT * 1000)))
     return genai.Client(api_key=key)
 
 def _extract_text(resp) -> str:
@@ -59,14 +72,22 @@ def _extract_text(resp) -> str:
     return ""
 
 
-def generate_responses_sync(prompt: str, param_sets: List[Dict[str, Any]], model: str = DEFAULT_MODEL) -> List[Dict[str, Any]]:
-    """
-    Use GenerativeModel.generate_content (stable .text) and fall back to Client.models
-    only if needed. Persist empty string only if the API truly returns no text.
-    """
-    _ = _client()  # validate key early
-    results: List[Dict[str, Any]] = []
+def _generate_one(user_text: str, cfg: "gt.GenerateContentConfig", model: str, max_tokens: Any = None) -> str:
+    # quota / RESOURCE_EXHAUSTED responses are paced and retried by the shared limiter
+    with telemetry.span("provider_request", telemetry.PROVIDER_REQUEST_SECONDS, provider="gemini", model=model):
+        cli = _client()
+        contents = [gt.Content(role="user", parts=[gt.Part.from_text(user_text)])]
+        resp = rate_limiter.call(
+            "gemini", model,
+            lambda: cli.models.generate_content(model=model, contents=contents, config=cfg),
+            est_tokens=rate_limiter.estimate_tokens(user_text, max_tokens),
+            tokens_used=lambda r: getattr(getattr(r, "usage_metadata", None), "total_token_count", None),
+        )
+        return _extract_text(resp).strip()
 
+
+def _cells(prompt: str, param_sets: List[Dict[str, Any]]) -> List[tuple]:
+    cells = []
     for p in param_sets:
         user_text = p.get("prompt_override") or prompt
         cfg = gt.GenerateContentConfig(
@@ -75,32 +96,39 @@ def generate_responses_sync(prompt: str, param_sets: List[Dict[str, Any]], model
             # max_output_tokens=int(p.get("max_tokens", 256)),
         )
         n = int(p.get("n", 1))
+        cells.extend((p, user_text, cfg) for _i in range(n))
+    return cells
+
+def _result(p: Dict[str, Any], o: Any) -> Dict[str, Any]:
+    if isinstance(o, Exception):
+        return {"param_set": p, "text": "", "error": str(o)}
+    return {"param_set": p, "text": o}
 
-        for _i in range(n):
-            tries = 0
-            while True:
-                tries += 1
-                try:
-                # Primary path: GenerativeModel (preferred)
-                # gm = genai.GenerativeModel(model_name=model, client=_client())
-                # resp = gm.generate_content(user_text, generation_config=cfg)
-                # text = (getattr(resp, "text", None) or _extract_text(resp)).strip()
-                # # Fallback path only if still empty (older odd SDKs)
-                # if not text:
-                #     cli = _client()
-                #     contents = [gt.Content(role="user", parts=[gt.Part.from_text(user_text)])]
-                #     resp2 = cli.models.generate_content(model=model, contents=contents, config=cfg)
-                #     text = _extract_text(resp2).strip()
-                #     results.append({"param_set": p, "text": text})
-                #     break
-                    cli = _client()
-                    contents = [gt.Content(role="user", parts=[gt.Part.from_text(user_text)])]
-                    resp = cli.models.generate_content(model=model, contents=contents, config=cfg)
-                    text = _extract_text(resp).strip()
-                    results.append({"param_set": p, "text": text})
-                    break
-                except Exception as e:
-                    if tries == 1 and "quota" in str(e).lower():
-                        time.sleep(0.8); continue
-                    raise
-    return results
+
+def generate_responses_sync(prompt: str, param_sets: List[Dict[str, Any]], model: str = DEFAULT_MODEL) -> List[Dict[str, Any]]:
+    """
+    Generate via Client.models.generate_content, fanning the (param_set, n) cells out
+    over a bounded thread pool (GEMINI_CONCURRENCY). Output order matches the input.
+    Persist empty string only if the API truly returns no text; a failed cell is
+    recorded with an "error" key, and the sweep only raises if every cell failed.
+    """
+    _ = _client()  # validate key early
+    cells = _cells(prompt, param_sets)
+    outcomes = map_ordered(
+        lambda c: _generate_one(c[1], c[2], model, c[0].get("max_tokens")),
+        cells,
+        provider_concurrency("gemini"),
+    )
+    errors = [o for o in outcomes if isinstance(o, Exception)]
+    if outcomes and len(errors) == len(outcomes):
+        raise errors[0]
+
+    return [_result(c[0], o) for c, o in zip(cells, outcomes)]
+
+
+def iter_responses(prompt: str, param_sets: List[Dict[str, Any]], model: str = DEFAULT_MODEL) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (cell index, result) in completion order; used by the streaming endpoint."""
+    _ = _client()  # validate key early
+    cells = _cells(prompt, param_sets)
+    for i, o in iter_completed(lambda c: _generate_one(c[1], c[2], model, c[0].get("max_tokens")), cells, provider_concurrency("gemini")):
+        yield i, _result(cells[i][0], o)
@@ -0,0 +1,125 @@
+# grid.py (prompt x param grid specs, expanded lazily into param sets)
+import os
+import itertools
+from typing import List, Dict, Any, Iterator, Optional
+
+GRID_MAX_CELLS = int(os.getenv("GRID_MAX_CELLS", "20000"))
+MAX_N = int(os.getenv("GRID_MAX_N", "10"))
+
+AXES = ("temperature", "top_p", "max_tokens", "n")
+DEFAULTS: Dict[str, Any] = {"temperature": 0.7, "top_p": 1.0, "max_tokens": 150, "n": 1}
+BOUNDS = {"temperature": (0.0, 2.0), "top_p": (0.0, 1.0), "max_tokens": (1, None), "n": (1, MAX_N)}
+INT_AXES = {"max_tokens", "n"}
+
+
+class GridError(ValueError):
+    pass
+
+
+def _sweep(lo: float, hi: float, steps: int) -> List[float]:
+    # same spacing as PromptForm's sweep(): inclusive endpoints
+    if steps <= 1:
+        return [lo]
+    step = (hi - lo) / (steps - 1)
+    return [lo + i * step for i in range(steps)]
+
+
+def axis_values(name: str, spec: Any) -> List[Any]:
+    """
+    spec is None (default value), a list of values, or {"min", "max", "steps"}.
+    Values are range-checked, cast and de-duplicated (order kept).
+    """
+    if spec is None:
+        raw = [DEFAULTS[name]]
+    elif isinstance(spec, dict):
+        lo = spec.get("min", DEFAULTS[name])
+        hi = spec.get("max", lo)
+        raw = _sweep(float(lo), float(hi), int(spec.get("steps") or 1))
+    elif isinstance(spec, (list, tuple)):
+        raw = list(spec)
+    else:
+        raw = [spec]
+    lo, hi = BOUNDS[name]
+    out: List[Any] = []
+    for v in raw:
+        v = int(round(float(v))) if name in INT_AXES else round(float(v), 4)
+        if v < lo or (hi is not None and v > hi):
+            raise GridError(f"{name}={v} outside [{lo}, {hi if hi is not None else 'inf'}]")
+        if v not in out:
+            out.append(v)
+    if not out:
+        raise GridError(f"{name} has no values")
+    return out
+
+
+def normalize(prompts: List[str], axes: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compact, JSON-safe grid spec stored on the job row: {"prompts": [...], "axes": {name: [values]}}."""
+    axes = axes or {}
+    unknown = set(axes) - set(AXES)
+    if unknown:
+        raise GridError(f"unknown grid axes: {', '.join(sorted(unknown))}")
+    uniq_prompts = list(dict.fromkeys(p for p in prompts if p and p.strip()))
+    if not uniq_prompts:
+        raise GridError("at least one non-empty prompt is required")
+    return {"prompts": uniq_prompts, "axes": {a: axis_values(a, axes.get(a)) for a in AXES}}
+
+
+def _key(p: Dict[str, Any]):
+    return tuple((k, p.get(k, DEFAULTS.get(k))) for k in ("prompt_override",) + AXES)
+
+
+def _in_grid(p: Dict[str, Any], spec: Dict[str, Any], base_prompt: Optional[str]) -> bool:
+    prompt = p.get("prompt_override") or base_prompt
+    return prompt in spec["prompts"] and all(p.get(a, DEFAULTS[a]) in spec["axes"][a] for a in AXES)
+
+
+def _explicit(param_sets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    out, seen = [], set()
+    for p in param_sets:
+        p = {k: v for k, v in p.items() if v is not None}
+        k = _key(p)
+        if k not in seen:
+            seen.add(k)
+            out.append(p)
+    return out
+
+
+def iter_param_sets(spec: Optional[Dict[str, Any]], param_sets: Optional[List[Dict[str, Any]]] = None,
+                    base_prompt: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Explicit param sets first, then the grid product, one dict at a time. Axis values
+    are already unique, so the product has no duplicates; cells equal to an explicit
+    set are skipped. prompt_override is set for every prompt other than base_prompt.
+    """
+    explicit = _explicit(param_sets or [])
+    yield from explicit
+    if not spec:
+        return
+    seen = {_key(p) for p in explicit}
+    axes = spec["axes"]
+    for prompt in spec["prompts"]:
+        for t, tp, mt, n in itertools.product(*(axes[a] for a in AXES)):
+            p: Dict[str, Any] = {"temperature": t, "top_p": tp, "max_tokens": mt, "n": n}
+            if prompt != base_prompt:
+                p["prompt_override"] = prompt
+            if not seen or _key(p) not in seen:
+                yield p
+
+
+def count(spec: Optional[Dict[str, Any]], param_sets: Optional[List[Dict[str, Any]]] = None,
+          base_prompt: Optional[str] = None) -> Dict[str, int]:
+    """Param sets and generated cells (sum of n) without materializing the grid."""
+    explicit = _explicit(param_sets or [])
+    sets = len(explicit)
+    cells = sum(int(p.get("n", 1) or 1) for p in explicit)
+    if spec:
+        axes = spec["axes"]
+        per_prompt = len(spec["prompts"]) * len(axes["temperature"]) * len(axes["top_p"]) * len(axes["max_tokens"])
+        sets += per_prompt * len(axes["n"])
+        cells += per_prompt * sum(axes["n"])
+        # grid cells equal to an explicit set are only generated once
+        for p in explicit:
+            if _in_grid(p, spec, base_prompt):
+                sets -= 1
+                cells -= int(p.get("n", 1) or 1)
+    return {"param_sets": sets, "cells": cells}
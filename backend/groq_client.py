@@ -1,7 +1,14 @@
 import os
-from typing import List, Dict, Any
+import logging
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
 from groq import Groq
 
+import rate_limiter
+import telemetry
+from live_scoring import StopGeneration
+from client_registry import get_client
+from concurrency import map_ordered, iter_completed, provider_concurrency
+
 DEFAULT_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
 
 def _get_key() -> str:
@@ -10,41 +17,97 @@ def _get_key() -> str:
         raise ValueError("GROQ_API_KEY not set in environment (.env)")
     return key
 
+def _client() -> Groq:
+    # one shared client per key: keep-alive connections are reused across generations
+    return get_client("groq", _get_key(), lambda k, http: Groq(api_key=k, http_client=http))
+
+def _generate_one(
+    client: Groq, prompt: str, p: Dict[str, Any], model: str,
+    on_delta: Optional[Callable[[str], None]] = None,
+) -> str:
+    user_text = p.get("prompt_override") or prompt
+    with telemetry.span("provider_request", telemetry.PROVIDER_REQUEST_SECONDS, provider="groq", model=model) as sp:
+        est = rate_limiter.estimate_tokens(user_text, p.get("max_tokens", 256))
+        # opening the stream is what gets throttled, so that is what the limiter paces
+        stream = rate_limiter.call(
+            "groq", model,
+            lambda: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": user_text}
+                ],
+                temperature=float(p.get("temperature", 0.7)),
+                top_p=float(p.get("top_p", 1.0)),
+                max_completion_tokens=int(p.get("max_tokens", 256)),
+                stream=True, 
+            ),
+            est_tokens=est,
+        )
+        collected = []
+        try:
+            for chunk in stream:
+                delta = getattr(chunk.choices[0].delta, "content", "") or ""
+                collected.append(delta)
+                if on_delta and delta:
+                    on_delta(delta)
+        except StopGeneration as stop:
+            # closing the response drops the connection, which is what stops server-side generation
+            stream.close()
+            stop.text = "".join(collected).strip()
+            sp["outcome"] = "stopped"
+            telemetry.PROVIDER_STOPPED.inc(provider="groq", model=model, reason=stop.reason)
+            rate_limiter.get("groq", model).record_tokens(est, len(user_text) / 4.0 + len(stop.text) / 4.0)
+            raise
+
+        text = "".join(collected).strip()
+        rate_limiter.get("groq", model).record_tokens(est, len(user_text) / 4.0 + len(text) / 4.0)
+        return text
+
 def generate_responses_sync(
-    prompt: str, param_sets: List[Dict[str, Any]], model: str = DEFAULT_MODEL
+    prompt: str, param_sets: List[Dict[str, Any]], model: str = DEFAULT_MODEL,
+    on_delta: Optional[Callable[[int, str], None]] = None,
 ) -> List[Dict[str, Any]]:
     """
     Generate Groq responses for each parameter set using streaming completion.
     Collects all streamed chunks into a single text string for display.
+    Cells run concurrently (GROQ_CONCURRENCY) and come back in param-set order.
+    on_delta(cell index, chunk) may raise StopGeneration to cut a cell short.
+    """
+    client = _client()
+
+    cells = [p for p in param_sets for _ in range(int(p.get("n", 1)))]
+    outcomes = map_ordered(
+        lambda ip: _generate_one(client, prompt, ip[1], model,
+                                 on_delta=(lambda d: on_delta(ip[0], d)) if on_delta else None),
+        list(enumerate(cells)),
+        provider_concurrency("groq"),
+    )
+
+    return [_result(p, o) for p, o in zip(cells, outcomes)]
+
+def _result(p: Dict[str, Any], o: Any) -> Dict[str, Any]:
+    if isinstance(o, StopGeneration):
+        return {"param_set": p, "text": o.text, "stopped": o.reason}
+    if isinstance(o, Exception):
+        logging.warning("Groq request failed: %s", o)
+        return {"param_set": p, "text": f"[GroqError] {o}", "error": str(o)}
+    return {"param_set": p, "text": o}
+
+def iter_responses(
+    prompt: str, param_sets: List[Dict[str, Any]], model: str = DEFAULT_MODEL,
+    on_delta: Optional[Callable[[int, str], None]] = None,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
     """
-    api_key = _get_key()
-    client = Groq(api_key=api_key)
-    results: List[Dict[str, Any]] = []
-
-    for p in param_sets:
-        n = int(p.get("n", 1))
-        for _ in range(n):
-            try:
-                stream = client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "user", "content": p.get("prompt_override") or prompt}
-                    ],
-                    temperature=float(p.get("temperature", 0.7)),
-                    top_p=float(p.get("top_p", 1.0)),
-                    max_completion_tokens=int(p.get("max_tokens", 256)),
-                    stream=True, 
-                )
-                collected = []
-                for chunk in stream:
-                    delta = getattr(chunk.choices[0].delta, "content", "") or ""
-                    collected.append(delta)
-
-                text = "".join(collected).strip()
-                results.append({"param_set": p, "text": text})
-
-            except Exception as e:
-                print(f"[Groq Error] {e}")
-                results.append({"param_set": p, "text": f"[GroqError] {e}"})
-
-    return results
+    Yield (cell index, result) in completion order. If on_delta is given it is
+    called with (cell index, token text) for every streamed chunk, from worker threads.
+    """
+    client = _client()
+    cells = list(enumerate(p for p in param_sets for _ in range(int(p.get("n", 1)))))
+
+    def _one(cell):
+        i, p = cell
+        cb = (lambda d: on_delta(i, d)) if on_delta else None
+        return _generate_one(client, prompt, p, model, on_delta=cb)
+
+    for i, o in iter_completed(_one, cells, provider_concurrency("groq")):
+        yield i, _result(cells[i][1], o)
@@ -0,0 +1,192 @@
+# jobs.py (background generation jobs for POST /experiments mode=job / mode=batch)
+import os
+import queue
+import logging
+import threading
+from typing import List, Dict, Any, Iterable, Optional
+
+import adaptive as adaptive_search
+import batch_mode
+import live_scoring
+from concurrency import provider_concurrency
+from grid import iter_param_sets
+from metrics import analyze_response_batch
+from providers import generate, is_quota_error
+from storage import add_responses, create_job, delete_responses, update_job, list_unfinished_jobs
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+BATCH_PERSIST_CHUNK = int(os.getenv("BATCH_PERSIST_CHUNK", "500"))
+
+_queue: "queue.Queue[str]" = queue.Queue(maxsize=JOB_QUEUE_SIZE)
+_jobs: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+_started = False
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _cells(p: Dict[str, Any]) -> int:
+    return int(p.get("n", 1) or 1)
+
+
+def _param_sets(job: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    # explicit param sets, then the grid (if any) expanded lazily
+    return iter_param_sets(job.get("grid"), job.get("param_sets"), job["prompt"])
+
+
+def _chunks(param_sets: Iterable[Dict[str, Any]], done: int, size: int):
+    """Yield chunks of param sets not yet persisted; `done` counts responses."""
+    seen = 0
+    pending: List[Dict[str, Any]] = []
+    for p in param_sets:
+        if seen >= done:
+            pending.append(p)
+            if len(pending) >= size:
+                yield pending
+                pending = []
+        seen += _cells(p)
+    if pending:
+        yield pending
+
+
+def _run(job: Dict[str, Any]) -> None:
+    exp_id = job["experiment_id"]
+    provider, model, prompt = job["provider"], job["model"], job["prompt"]
+    done = int(job.get("done") or 0)
+    live = live_scoring.limits(job.get("live"))
+    update_job(exp_id, status="running")
+    try:
+        # chunks match the provider fan-out so each chunk is one concurrent round
+        for chunk in _chunks(_param_sets(job), done, provider_concurrency(provider)):
+            raw = generate(provider, prompt, chunk, model, use_cache=job.get("use_cache", True), live=live)
+            done += len(raw)
+            # rows and progress land together, so a restart resumes exactly after this chunk
+            add_responses(exp_id, analyze_response_batch(prompt, raw, job.get("metrics")), job_done=done)
+        update_job(exp_id, status="done")
+    except Exception as e:
+        logging.exception("Job %s failed: %s", exp_id, e)
+        reason = f"quota_exceeded: {e}" if is_quota_error(e) else str(e)
+        update_job(exp_id, status="failed", error=reason)
+
+
+def _run_adaptive(job: Dict[str, Any]) -> None:
+    """Successive-halving search; every round's responses are stored as they come in."""
+    exp_id = job["experiment_id"]
+    cfg = job["adaptive"]
+    if job.get("done") or job.get("status") == "running":
+        # a search is not resumable mid-way (its state lives in memory): drop the rounds an
+        # interrupted run stored, so the restarted search doesn't count them twice
+        delete_responses(exp_id)
+        update_job(exp_id, done=0)
+    update_job(exp_id, status="running")
+
+    def _on_round(enriched, calls, summary):
+        add_responses(exp_id, enriched, job_done=calls)
+
+    try:
+        result = adaptive_search.run(
+            job["provider"], job["model"], job["prompt"], adaptive_search.arms_from(_param_sets(job)),
+            budget=int(cfg["budget"]), eta=int(cfg.get("eta", adaptive_search.DEFAULT_ETA)),
+            margin=float(cfg.get("margin", adaptive_search.DEFAULT_MARGIN)), min_samples=int(cfg.get("min_samples", 1)),
+            use_cache=job.get("use_cache", True), on_round=_on_round, metrics=job.get("metrics"),
+            live=live_scoring.limits(job.get("live")),
+        )
+        update_job(exp_id, status="done", result=result)
+    except Exception as e:
+        logging.exception("Adaptive job %s failed: %s", exp_id, e)
+        reason = f"quota_exceeded: {e}" if is_quota_error(e) else str(e)
+        update_job(exp_id, status="failed", error=reason)
+
+
+def _run_batch(job: Dict[str, Any]) -> None:
+    """Whole grid through the provider batch API, then score + persist in chunks."""
+    exp_id = job["experiment_id"]
+    provider, model, prompt = job["provider"], job["model"], job["prompt"]
+    done = int(job.get("done") or 0)
+    update_job(exp_id, status="running")
+    try:
+        raw = batch_mode.generate_batch(
+            provider, prompt, list(_param_sets(job)), model,
+            use_cache=job.get("use_cache", True), batch_id=job.get("batch_id"), batch_indices=job.get("batch_indices"),
+            on_submit=lambda batch_id, indices: update_job(exp_id, batch_id=batch_id, batch_indices=indices),
+        )
+        for i in range(done, len(raw), BATCH_PERSIST_CHUNK):
+            chunk = raw[i:i + BATCH_PERSIST_CHUNK]
+            done += len(chunk)
+            add_responses(exp_id, analyze_response_batch(prompt, chunk, job.get("metrics")), job_done=done)
+        update_job(exp_id, status="done")
+    except Exception as e:
+        logging.exception("Batch job %s failed: %s", exp_id, e)
+        reason = f"quota_exceeded: {e}" if is_quota_error(e) else str(e)
+        update_job(exp_id, status="failed", error=reason)
+
+
+def _worker() -> None:
+    while True:
+        exp_id = _queue.get()
+        try:
+            with _lock:
+                job = _jobs.pop(exp_id, None)
+            if job and job.get("mode") == "batch" and batch_mode.supports_batch(job["provider"]):
+                # batches can take hours; poll on their own thread so the queue keeps moving
+                threading.Thread(target=_run_batch, args=(job,), name=f"batch-{exp_id}", daemon=True).start()
+            elif job and job.get("adaptive"):
+                _run_adaptive(job)
+            elif job:
+                # providers without a batch API fall back to the concurrent path
+                _run(job)
+        finally:
+            _queue.task_done()
+
+
+def _enqueue(job: Dict[str, Any]) -> None:
+    with _lock:
+        _jobs[job["experiment_id"]] = job
+    try:
+        _queue.put_nowait(job["experiment_id"])
+    except queue.Full:
+        with _lock:
+            _jobs.pop(job["experiment_id"], None)
+        raise QueueFullError("job queue is full")
+
+
+def start() -> None:
+    """Spin up the worker pool and re-queue jobs left unfinished by a previous process."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    for i in range(max(1, JOB_WORKERS)):
+        threading.Thread(target=_worker, name=f"job-worker-{i}", daemon=True).start()
+    for job in list_unfinished_jobs():
+        logging.info("Resuming job %s at %s/%s", job["experiment_id"], job.get("done", 0), job.get("total", 0))
+        try:
+            _enqueue(job)
+        except QueueFullError:
+            logging.warning("Job queue full; %s stays queued until next restart", job["experiment_id"])
+
+
+def submit(exp_id: str, provider: str, model: str, prompt: str, param_sets: List[Dict[str, Any]], total: int,
+           use_cache: bool = True, mode: str = "job", grid: Optional[Dict[str, Any]] = None,
+           adaptive: Optional[Dict[str, Any]] = None, metrics: Optional[List[str]] = None,
+           live: Optional[Dict[str, Any]] = None) -> None:
+    if _queue.full():
+        raise QueueFullError("job queue is full")
+    create_job(exp_id, provider, model, prompt, param_sets, total, use_cache=use_cache, mode=mode, grid=grid,
+               adaptive=adaptive, metrics=metrics, live=live)
+    job = {"experiment_id": exp_id, "provider": provider, "model": model, "prompt": prompt,
+           "param_sets": param_sets, "total": total, "done": 0, "use_cache": use_cache, "mode": mode, "grid": grid,
+           "adaptive": adaptive, "metrics": metrics, "live": live}
+    try:
+        _enqueue(job)
+    except QueueFullError:
+        update_job(exp_id, status="failed", error="job queue is full")
+        raise
+
+
+def queue_depth() -> int:
+    return _queue.qsize()
@@ -0,0 +1,202 @@
+# live_scoring.py (running metrics over streamed chunks, and limits that cut a generation short)
+#
+# IncrementalScorer keeps running token counts, the unique-token set, a rolling trigram counter,
+# prompt-keyword hits and sentence lengths, so each chunk costs O(len(chunk)). Once the stream has
+# ended and finish() has flushed the last token, its snapshot equals score_batch for the token
+# metrics (lexical_diversity, repetition, length_ok, keyword_coverage, clarity_score). Structure
+# and readability still need the full text.
+#
+# A Guard holds one scorer per sweep cell. Its hook is an on_delta callback: when a limit trips it
+# raises StopGeneration, and the streaming client closes the stream. That stops the provider
+# generating and billing tokens. The result keeps the partial text and gets "stopped": reason.
+import os
+from collections import deque
+from typing import List, Dict, Any, Callable, Optional, NamedTuple
+
+import metrics
+
+LIVE_MIN_WORDS = int(os.getenv("LIVE_MIN_WORDS", "30"))  # no repetition / diversity verdicts before this many tokens
+# trigrams in the rolling window behind repeat_share. repetition_score counts *distinct* repeated
+# n-grams, so it falls as a degenerate loop goes on; the share of recent n-grams already seen spikes
+LIVE_WINDOW = int(os.getenv("LIVE_WINDOW", "50"))
+
+_SENTENCE_END = ".!?"
+
+
+def _is_token_char(c: str) -> bool:
+    # same character class as metrics._tokenize: [A-Za-z']
+    return c == "'" or ("a" <= c <= "z") or ("A" <= c <= "Z")
+
+
+class StopGeneration(Exception):
+    """Raised from on_delta to abort a streaming generation; the client fills in the partial text."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+        self.text = ""
+
+
+class IncrementalScorer:
+    def __init__(self, prompt: str, n: int = 3, window: int = LIVE_WINDOW):
+        self.n = n
+        self.keywords = set(t for t in metrics._tokenize(prompt) if len(t) > 3)
+        self.n_tokens = 0
+        self.unique: set = set()
+        self.covered: set = set()
+        self.ngrams: Dict[tuple, int] = {}
+        self.n_repeated = 0  # distinct n-grams seen more than once
+        self._recent: deque = deque(maxlen=max(1, window))  # 1 per recent n-gram seen before, else 0
+        self._recent_repeats = 0
+        self._window: List[str] = []  # last n-1 tokens
+        self._partial = ""  # token cut off at the end of the last chunk
+        self._prev = ""  # last character seen, for sentence breaks split across chunks
+        self.n_sentences = 0
+        self.sentence_tokens = 0  # summed lengths of closed sentences
+        self._cur_sentence = 0
+
+    def _add_token(self, tok: str) -> None:
+        self.n_tokens += 1
+        self.unique.add(tok)
+        if tok in self.keywords:
+            self.covered.add(tok)
+        if len(self._window) == self.n - 1:
+            g = (*self._window, tok)
+            c = self.ngrams.get(g, 0) + 1
+            self.ngrams[g] = c
+            if c == 2:
+                self.n_repeated += 1
+            if len(self._recent) == self._recent.maxlen:
+                self._recent_repeats -= self._recent[0]
+            self._recent.append(1 if c > 1 else 0)
+            self._recent_repeats += self._recent[-1]
+            self._window.pop(0)
+        self._window.append(tok)
+        self._cur_sentence += 1
+
+    def _close_sentence(self) -> None:
+        if self._cur_sentence:
+            self.n_sentences += 1
+            self.sentence_tokens += self._cur_sentence
+            self._cur_sentence = 0
+
+    def feed(self, delta: str) -> None:
+        buf = self._partial
+        prev = self._prev
+        # lowercase per chunk like _tokenize lowercases the whole text (it never changes [.!?] / whitespace)
+        for c in delta.lower():
+            if _is_token_char(c):
+                buf += c
+            else:
+                if buf:
+                    self._add_token(buf)
+                    buf = ""
+                if prev in _SENTENCE_END and c.isspace():
+                    self._close_sentence()
+            prev = c
+        self._partial = buf
+        self._prev = prev
+
+    def finish(self) -> "IncrementalScorer":
+        """Flush the last token once the stream has ended."""
+        if self._partial:
+            self._add_token(self._partial)
+            self._partial = ""
+        return self
+
+    @property
+    def repetition(self) -> float:
+        if self.n_tokens < self.n:
+            return 0.0
+        return metrics._repetition(self.n_tokens, self.n_repeated, self.n)
+
+    @property
+    def repeat_share(self) -> float:
+        """Share of the last `window` n-grams that had already occurred."""
+        return self._recent_repeats / len(self._recent) if self._recent else 0.0
+
+    @property
+    def lexical_diversity(self) -> float:
+        return len(self.unique) / self.n_tokens if self.n_tokens else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Running metrics over the tokens completed so far (cheap: no pass over the text)."""
+        n_sent = self.n_sentences + (1 if self._cur_sentence else 0)
+        total = self.sentence_tokens + self._cur_sentence
+        return {
+            "tokens": self.n_tokens,
+            "lexical_diversity": round(self.lexical_diversity, 4),
+            "repetition": round(self.repetition, 4),
+            "repeat_share": round(self.repeat_share, 4),
+            "length_ok": round(metrics._length_ok(self.n_tokens), 4),
+            "keyword_coverage": round(len(self.covered) / len(self.keywords), 4) if self.keywords else 0.0,
+            "clarity_score": round(metrics._clarity(total / n_sent), 4) if n_sent else 0.0,
+        }
+
+
+class Limits(NamedTuple):
+    max_repeat_share: Optional[float] = None
+    min_diversity: Optional[float] = None
+    max_words: Optional[int] = None
+    min_words: int = LIVE_MIN_WORDS
+
+    def check(self, sc: IncrementalScorer) -> Optional[str]:
+        """Name of the first limit the running metrics trip, or None."""
+        if self.max_words is not None and sc.n_tokens > self.max_words:
+            return "max_words"
+        if sc.n_tokens < self.min_words:
+            return None
+        if self.max_repeat_share is not None and sc.repeat_share > self.max_repeat_share:
+            return "repetition"
+        if self.min_diversity is not None and sc.lexical_diversity < self.min_diversity:
+            return "diversity"
+        return None
+
+
+def limits(spec: Optional[Dict[str, Any]]) -> Optional[Limits]:
+    """Limits from a request / job dict; None when nothing is set."""
+    if not spec:
+        return None
+    lim = Limits(**{k: v for k, v in spec.items() if k in Limits._fields and v is not None})
+    return lim if (lim.max_repeat_share, lim.min_diversity, lim.max_words) != (None, None, None) else None
+
+
+class Guard:
+    """One scorer per cell of a sweep; cell i is scored against prompts[i]."""
+
+    def __init__(self, lim: Limits, prompts: List[str]):
+        self.limits = lim
+        self._prompts = prompts
+        self._scorers: Dict[int, IncrementalScorer] = {}
+
+    def feed(self, i: int, delta: str) -> Optional[str]:
+        sc = self._scorers.get(i)
+        if sc is None:
+            # each cell streams on one worker thread, so the first delta of a cell creates its scorer once
+            sc = self._scorers.setdefault(i, IncrementalScorer(self._prompts[i]))
+        sc.feed(delta)
+        return self.limits.check(sc)
+
+    def snapshot(self, i: int) -> Dict[str, Any]:
+        sc = self._scorers.get(i)
+        return sc.snapshot() if sc else {}
+
+    def finish(self, i: int) -> Dict[str, Any]:
+        """Final metrics of a cell whose stream has ended (completed or stopped); {} if it never streamed."""
+        sc = self._scorers.get(i)
+        return sc.finish().snapshot() if sc else {}
+
+    def hook(self, on_delta: Optional[Callable[[int, str], None]] = None) -> Callable[[int, str], None]:
+        """on_delta callback that scores each chunk, forwards it, then raises StopGeneration if a limit tripped."""
+        def _cb(i: int, delta: str) -> None:
+            reason = self.feed(i, delta)
+            if on_delta:
+                on_delta(i, delta)
+            if reason:
+                raise StopGeneration(reason)
+        return _cb
+
+
+def cell_prompts(prompt: str, param_sets: List[Dict[str, Any]]) -> List[str]:
+    """Prompt of every (param_set, n) cell, in sweep order; prompt_override wins, as in scoring."""
+    return [p.get("prompt_override") or prompt for p in param_sets for _ in range(int(p.get("n", 1) or 1))]
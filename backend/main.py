@@ -3,14 +3,19 @@ import os
 import io
 import json
 import uuid
-import pandas as pd
-from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, HTTPException
+import csv
+import itertools
+from typing import List, Dict, Any, Literal, Optional, Union
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 import logging
+import queue
+import threading
+import asyncio
+import time
 
 # Simple in-memory key store for demo only — DO NOT use this in production.
 API_KEYS: Dict[str, str] = {}
@@ -24,35 +29,25 @@ ENV_VAR_BY_PROVIDER = {
 load_dotenv()
 
 # storage abstraction (SQL or Mongo depending on DB_KIND)
-from storage import init_storage, create_experiment as st_create_experiment, add_responses as st_add_responses, list_experiments as st_list_experiments, get_experiment as st_get_experiment
-
-# Provider adapters
-def _gemini_generate(prompt: str, param_sets: List[Dict[str, Any]], model: str):
-    from gemini_client import generate_responses_sync
-    print("Using Gemini provider with model:", model)
-    return generate_responses_sync(prompt, param_sets, model=model)
-
-def _openai_generate(prompt: str, param_sets: List[Dict[str, Any]], model: str):
-    from openai_client import generate_responses_sync
-    print("Using OpenAI provider with model:", model, prompt, param_sets)
-    return generate_responses_sync(prompt, param_sets, model=model)
-
-def _groq_generate(prompt: str, param_sets: List[Dict[str, Any]], model: str):
-    from groq_client import generate_responses_sync
-    print("Using Groq provider with model:", model)
-    return generate_responses_sync(prompt, param_sets, model=model)
-
-
-def _mock_generate(prompt: str, param_sets: List[Dict[str, Any]]):
-    out = []
-    print("Mock generate called with prompt:", prompt)
-    print("Param sets:", param_sets)
-    for p in param_sets:
-        txt = f"[MOCK] temp={p.get('temperature')} top_p={p.get('top_p')}: {prompt[:160]}"
-        out.append({"param_set": p, "text": txt})
-    return out
+from storage import init_storage, create_experiment as st_create_experiment, add_responses as st_add_responses, get_experiment as st_get_experiment, get_job as st_get_job, get_experiment_meta as st_get_experiment_meta, iter_experiment_responses as st_iter_experiment_responses, find_experiments as st_find_experiments, pool_stats as st_pool_stats, get_aggregates as st_get_aggregates, rebuild_aggregates as st_rebuild_aggregates, search_responses as st_search_responses, parse_fields, parse_metric_filters
+
+import storage_async
+from providers import generate, iter_generate, normalize_provider, resolve_model, is_quota_error, num_cells
+import jobs
+import grid as grid_planner
+import adaptive as adaptive_search
+import response_cache
+import exp_cache
+import aggregates
+import client_registry
+import live_scoring
+import telemetry
 
 from metrics import analyze_response_batch
+import metrics as metric_registry
+
+telemetry.configure_logging()
+log = telemetry.get_logger("api")
 
 app = FastAPI(title="LLM Lab Backend")
 
@@ -75,9 +70,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    token = telemetry.start_trace()
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        seconds = time.perf_counter() - t0
+        stages = telemetry.end_trace(token)
+        # the route template, not the path, so /experiments/{exp_id} stays one series
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        telemetry.HTTP_SECONDS.observe(seconds, method=request.method, route=route, status=status)
+        if seconds * 1000 >= telemetry.SLOW_REQUEST_MS:
+            log.warning("slow request %s %s -> %s in %.1fms: %s", request.method, route, status, seconds * 1000,
+                        telemetry.breakdown(stages) or "no spans")
+        else:
+            telemetry.sampled(log, logging.INFO, "%s %s -> %s in %.1fms %s", request.method, route, status,
+                              seconds * 1000, telemetry.breakdown(stages))
+
 @app.on_event("startup")
 def startup():
     init_storage()
+    jobs.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await storage_async.close()
 
 @app.post("/apikey")
 def set_apikey(payload: Dict[str, Any]):
@@ -94,109 +116,564 @@ def set_apikey(payload: Dict[str, Any]):
     if env_var:
         # set env var so provider client libraries can pick it up (demo only)
         os.environ[env_var] = key
+    # drop pooled clients built with the previous key
+    client_registry.invalidate(provider)
     return {"ok": True, "provider": provider}
 
 class ParamSet(BaseModel):
     temperature: Optional[float] = Field(0.7, ge=0.0, le=2.0)
     top_p: Optional[float] = Field(1.0, ge=0.0, le=1.0)
     max_tokens: Optional[int] = Field(150, ge=1)
-    # prompt_override: Optional[str] = None
+    n: Optional[int] = Field(1, ge=1, le=grid_planner.MAX_N)
+    prompt_override: Optional[str] = None
+
+class AxisRange(BaseModel):
+    min: float
+    max: float
+    steps: int = Field(3, ge=1, le=100)
+
+AxisSpec = Union[List[float], AxisRange, float]
+
+class GridSpec(BaseModel):
+    """Each axis is a list of values, {min, max, steps}, or one value; omitted axes use the ParamSet default."""
+    temperature: Optional[AxisSpec] = None
+    top_p: Optional[AxisSpec] = None
+    max_tokens: Optional[AxisSpec] = None
+    n: Optional[AxisSpec] = None
+
+class AdaptiveSpec(BaseModel):
+    """Successive halving over the grid's (temperature, top_p, ...) cells instead of sampling every one."""
+    budget: Optional[int] = Field(default=None, ge=1, description="max provider calls (default: half the exhaustive grid, at least 2 per cell)")
+    eta: int = Field(default=adaptive_search.DEFAULT_ETA, ge=2, description="keep the top 1/eta cells each round")
+    margin: float = Field(default=adaptive_search.DEFAULT_MARGIN, ge=0.0, description="stop early once the leader is this far ahead")
+    min_samples: int = Field(default=1, ge=1, description="samples per surviving cell per round, at least")
+
+class LiveSpec(BaseModel):
+    """Stop a streamed generation (Groq) as soon as its running metrics trip one of these."""
+    max_repeat_share: Optional[float] = Field(default=None, ge=0.0, le=1.0, description="share of the last LIVE_WINDOW trigrams already seen")
+    min_diversity: Optional[float] = Field(default=None, ge=0.0, le=1.0, description="running lexical_diversity floor")
+    max_words: Optional[int] = Field(default=None, ge=1, description="stop once the text is longer than this (length_ok tops out at 220)")
+    min_words: int = Field(default=live_scoring.LIVE_MIN_WORDS, ge=0, description="no repetition / diversity verdicts before this many words")
 
 class CreateExperimentRequest(BaseModel):
     title: str = "untitled experiment"
-    prompt: str
-    param_sets: List[ParamSet]
+    prompt: Optional[str] = None
+    prompts: Optional[List[str]] = Field(default=None, description="several prompts in one experiment (crossed with param_sets / grid)")
+    param_sets: List[ParamSet] = Field(default_factory=list)
+    grid: Optional[GridSpec] = Field(default=None, description="compact sweep expanded server-side: prompts x temperature x top_p x max_tokens x n")
+    adaptive: Optional[AdaptiveSpec] = Field(default=None, description="search the grid adaptively and report the best param set")
     provider: Optional[str] = Field(default="gemini", description="gemini | openai | groq | mock")
     model: Optional[str] = Field(default=None, description="model name for selected provider")
+    use_cache: bool = Field(default=True, description="serve identical (provider, model, prompt, param_set) cells from the response cache")
+    metrics: Optional[List[str]] = Field(default=None, description="score only these metrics (default: all registered); the shared features they need are computed once")
+    live: Optional[LiveSpec] = Field(default=None, description="abort streamed generations early on degenerate output (sync, job, adaptive and stream; Groq only)")
+    mode: Optional[Literal["sync", "job", "batch"]] = Field(default=None, description="sync | job (return immediately, poll /experiments/{id}/status) | batch (job submitted through the provider batch API); grids and multi-prompt requests default to job")
+
+def _plan(req: CreateExperimentRequest) -> Dict[str, Any]:
+    """
+    Resolve prompts, explicit param sets and the grid spec into one plan. Explicit
+    param sets are crossed with every prompt; the grid itself stays compact and is
+    expanded lazily by whoever runs it. 400 when the plan is empty or too large.
+    """
+    prompts = list(dict.fromkeys(p for p in ([req.prompt] if req.prompt else []) + (req.prompts or []) if p and p.strip()))
+    if not prompts:
+        raise HTTPException(status_code=400, detail="prompt or prompts is required")
+    try:
+        metric_registry.resolve(req.metrics)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    base = prompts[0]
+    explicit = [p.dict() for p in req.param_sets]
+    if len(prompts) > 1:
+        explicit = [{**p, "prompt_override": p.get("prompt_override") or (pr if pr != base else None)}
+                    for pr in prompts for p in explicit]
+    spec = None
+    if req.grid is not None:
+        axes = {k: (v.dict() if isinstance(v, BaseModel) else v) for k, v in req.grid.dict(exclude_none=True).items()}
+        try:
+            spec = grid_planner.normalize(prompts, axes)
+        except grid_planner.GridError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    elif not explicit:
+        raise HTTPException(status_code=400, detail="param_sets or grid is required")
+    counts = grid_planner.count(spec, explicit, base)
+    if counts["cells"] > grid_planner.GRID_MAX_CELLS:
+        raise HTTPException(status_code=400, detail=f"grid has {counts['cells']} cells (max {grid_planner.GRID_MAX_CELLS})")
+    return {"prompt": base, "prompts": prompts, "param_sets": explicit, "grid": spec,
+            "num_param_sets": counts["param_sets"], "cells": counts["cells"]}
+
+def _plan_param_sets(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return list(grid_planner.iter_param_sets(plan["grid"], plan["param_sets"], plan["prompt"]))
+
+@app.get("/scoring/metrics")
+def scoring_metrics():
+    """Metrics that POST /experiments can select with "metrics": [...], and the features each one computes."""
+    return {"metrics": metric_registry.describe()}
 
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/storage/pool")
+def storage_pool():
+    """Connection pool usage (checked out, overflow, checkout wait) for sizing DB_POOL_*."""
+    return st_pool_stats()
+
+@app.get("/ratelimit")
+def ratelimit_stats():
+    """Per provider/model pacing state: current rpm/tpm, queue depth, Retry-After block."""
+    import rate_limiter
+    return rate_limiter.stats()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus text format: HTTP, provider, rate limiter, scoring, DB and export timings."""
+    return Response(telemetry.render(), media_type=telemetry.CONTENT_TYPE)
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {**response_cache.cache.stats(), "experiments": exp_cache.cache.stats()}
+
+@app.post("/cache/clear")
+def cache_clear():
+    response_cache.cache.clear()
+    exp_cache.cache.clear()
+    return {"ok": True}
+
+@app.post("/experiments/plan")
+def plan_exp(req: CreateExperimentRequest):
+    """Dry run: how many param sets / generated cells a request expands to, without running it."""
+    plan = _plan(req)
+    return {"prompts": len(plan["prompts"]), "param_sets": plan["num_param_sets"], "cells": plan["cells"], "grid": plan["grid"]}
+
+def _live(req: CreateExperimentRequest) -> Optional[Dict[str, Any]]:
+    return req.live.dict() if req.live else None
+
+def _generate_and_score(provider: str, prompt: str, params: List[Dict[str, Any]], model: str, use_cache: bool,
+                        metrics: Optional[List[str]] = None, live: Optional[Dict[str, Any]] = None):
+    raw = generate(provider, prompt, params, model, use_cache=use_cache, live=live_scoring.limits(live))
+    return analyze_response_batch(prompt, raw, metrics)
+
 @app.post("/experiments")
-def create_exp(req: CreateExperimentRequest):
-    print("Create experiment request received:", req)
-    provider = (req.provider or "gemini").lower().strip()
-    # req.model may be None; avoid calling .lower() on None
-    model = (req.model or "").lower().strip() or ("gemini-2.5-flash" if provider == "gemini" else "gpt-4o-mini")
+async def create_exp(req: CreateExperimentRequest):
+    # counts only: prompts and keys stay out of the logs
+    telemetry.sampled(log, logging.DEBUG, "create experiment: provider=%s model=%s param_sets=%d",
+                      req.provider, req.model, len(req.param_sets or []))
+    provider = normalize_provider(req.provider)
+    model = resolve_model(provider, req.model)
     # Ensure provider env var is populated from in-memory store if available (demo).
     key = API_KEYS.get(provider)
     if key:
         env_var = ENV_VAR_BY_PROVIDER.get(provider)
         if env_var:
             os.environ[env_var] = key
-    exp_id = st_create_experiment(req.title, req.prompt, model)
+    plan = _plan(req)
+    prompt = plan["prompt"]
 
-    params = [p.dict() for p in req.param_sets]
+    mode = req.mode or ("job" if plan["grid"] or len(plan["prompts"]) > 1 else "sync")
+    if req.adaptive is not None:
+        # rounds of provider calls: the whole search runs in a worker thread
+        return await asyncio.to_thread(_create_adaptive, req, plan, provider, model, mode)
+    if mode in ("job", "batch"):
+        if jobs.queue_depth() >= jobs.JOB_QUEUE_SIZE:
+            raise HTTPException(status_code=503, detail="job queue is full, retry later")
+        exp_id = await storage_async.create_experiment(req.title, prompt, model)
+        total = plan["cells"]
+        try:
+            # the grid goes to the job as its compact spec; the worker expands it chunk by chunk
+            await asyncio.to_thread(jobs.submit, exp_id, provider, model, prompt, plan["param_sets"], total,
+                                    use_cache=req.use_cache, mode=mode, grid=plan["grid"], metrics=req.metrics,
+                                    live=_live(req))
+        except jobs.QueueFullError:
+            raise HTTPException(status_code=503, detail={"message": "job queue is full, retry later", "experiment_id": exp_id})
+        return {"experiment_id": exp_id, "num_responses": 0, "status": "queued", "total": total, "mode": mode}
+
+    params = _plan_param_sets(plan)
+    exp_id = await storage_async.create_experiment(req.title, prompt, model)
     try:
-        if provider == "gemini":
-            raw = _gemini_generate(req.prompt, params, model=model)
-        elif provider == "openai":
-            raw = _openai_generate(req.prompt, params, model=model)
-        elif provider == "groq":  
-            raw = _groq_generate(req.prompt, params, model=model)
-        else:
-            raw = _mock_generate(req.prompt, params)
+        # provider SDKs block, so generation and scoring leave the event loop; storage stays on it
+        enriched = await asyncio.to_thread(_generate_and_score, provider, prompt, params, model, req.use_cache, req.metrics,
+                                           _live(req))
     except Exception as e:
         # If provider returned a quota error, return 429 with a clear payload so frontend can show a popup.
-        msg = str(e).lower()
         logging.exception("Failed to generate responses from provider: %s", e)
-        if "insufficient_quota" in msg or "quota" in msg or "exceed" in msg:
+        if is_quota_error(e):
             raise HTTPException(status_code=429, detail={"message": "quota_exceeded", "reason": str(e), "experiment_id": exp_id})
         raise HTTPException(status_code=500, detail=f"Provider error: {str(e)}")
-    enriched = analyze_response_batch(req.prompt, raw)
-    st_add_responses(exp_id, enriched)
-    print(f"Experiment {exp_id} created with {len(enriched)} responses.")
-    return {"experiment_id": exp_id, "num_responses": len(enriched)}
+    await storage_async.add_responses(exp_id, enriched)
+    telemetry.sampled(log, logging.INFO, "experiment %s created with %d responses", exp_id, len(enriched))
+    out = {"experiment_id": exp_id, "num_responses": len(enriched)}
+    if req.live:
+        out["stopped"] = sum(1 for r in enriched if r.get("stopped"))
+    return out
 
-@app.get("/experiments")
-def list_exps(skip: int = 0, limit: int = 50):
-    return {"experiments": st_list_experiments(skip, limit)}
+def _create_adaptive(req: CreateExperimentRequest, plan: Dict[str, Any], provider: str, model: str, mode: str):
+    if mode == "batch":
+        raise HTTPException(status_code=400, detail="adaptive search runs in rounds and cannot use mode=batch")
+    try:
+        arms = adaptive_search.arms_from(_plan_param_sets(plan))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cfg = req.adaptive.dict()
+    # default: half of what the exhaustive grid would generate, but at least two samples per cell
+    cfg["budget"] = cfg.get("budget") or max(2 * len(arms), plan["cells"] // 2)
+    if cfg["budget"] < len(arms):
+        raise HTTPException(status_code=400, detail=f"adaptive budget must cover one sample of each of the {len(arms)} cells")
+    prompt = plan["prompt"]
+    if mode == "job":
+        # check before creating the experiment, so a full queue doesn't leave an empty one behind
+        if jobs.queue_depth() >= jobs.JOB_QUEUE_SIZE:
+            raise HTTPException(status_code=503, detail="job queue is full, retry later")
+        exp_id = st_create_experiment(req.title, prompt, model)
+        try:
+            jobs.submit(exp_id, provider, model, prompt, plan["param_sets"], cfg["budget"], use_cache=req.use_cache,
+                        grid=plan["grid"], adaptive=cfg, metrics=req.metrics, live=_live(req))
+        except jobs.QueueFullError:
+            raise HTTPException(status_code=503, detail={"message": "job queue is full, retry later", "experiment_id": exp_id})
+        return {"experiment_id": exp_id, "num_responses": 0, "status": "queued", "total": cfg["budget"], "mode": mode,
+                "arms": len(arms)}
+    exp_id = st_create_experiment(req.title, prompt, model)
+    try:
+        result = adaptive_search.run(
+            provider, model, prompt, arms, budget=cfg["budget"], eta=cfg["eta"], margin=cfg["margin"],
+            min_samples=cfg["min_samples"], use_cache=req.use_cache, metrics=req.metrics,
+            live=live_scoring.limits(_live(req)),
+            on_round=lambda enriched, calls, summary: st_add_responses(exp_id, enriched),
+        )
+    except Exception as e:
+        logging.exception("Adaptive search failed: %s", e)
+        if is_quota_error(e):
+            raise HTTPException(status_code=429, detail={"message": "quota_exceeded", "reason": str(e), "experiment_id": exp_id})
+        raise HTTPException(status_code=500, detail=f"Provider error: {str(e)}")
+    log.info("experiment %s adaptive search: %d/%d calls, stop=%s", exp_id, result["calls"], result["budget"], result["stop_reason"])
+    return {"experiment_id": exp_id, "num_responses": result["calls"], "adaptive": result}
 
-@app.get("/experiments/{exp_id}")
-def get_exp(exp_id: str):
+def _sse(event: Dict[str, Any]) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+@app.post("/experiments/stream")
+def create_exp_stream(req: CreateExperimentRequest, format: str = "ndjson", deltas: bool = False):
+    """
+    Like POST /experiments, but streams one event per response as soon as it is
+    generated and scored: experiment -> [delta...] response... -> done (or error).
+    format=ndjson (default) or sse; deltas=true forwards token chunks where the provider streams.
+    With "live" limits each delta carries the running metrics of its cell, and a cell that
+    trips a limit is cut short: its response event has "stopped": reason.
+    """
+    provider = normalize_provider(req.provider)
+    model = resolve_model(provider, req.model)
+    key = API_KEYS.get(provider)
+    if key:
+        env_var = ENV_VAR_BY_PROVIDER.get(provider)
+        if env_var:
+            os.environ[env_var] = key
+    plan = _plan(req)
+    prompt = plan["prompt"]
+    params = _plan_param_sets(plan)
+    exp_id = st_create_experiment(req.title, prompt, model)
+    total = num_cells(params)
+    encode = _sse if format == "sse" else (lambda ev: json.dumps(ev, ensure_ascii=False) + "\n")
+
+    # a producer thread feeds this queue so token deltas from worker threads interleave with results
+    events: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+
+    lim = live_scoring.limits(_live(req))
+    guard = live_scoring.Guard(lim, live_scoring.cell_prompts(prompt, params)) if lim else None
+
+    def _delta(i: int, d: str) -> None:
+        ev = {"event": "delta", "index": i, "delta": d}
+        if guard:
+            ev["live"] = guard.snapshot(i)
+        events.put(ev)
+
+    def _produce():
+        try:
+            on_delta = _delta if deltas else None
+            if guard:
+                on_delta = guard.hook(on_delta)
+            for i, r in iter_generate(provider, prompt, params, model, on_delta=on_delta, use_cache=req.use_cache):
+                ev = {"event": "result", "index": i, "raw": r}
+                if guard:
+                    # the cell's stream has ended, stopped or not: flush its last token
+                    ev["live"] = guard.finish(i)
+                events.put(ev)
+        except Exception as e:
+            logging.exception("Streaming generation failed: %s", e)
+            events.put({"event": "error", "message": "quota_exceeded" if is_quota_error(e) else "provider_error",
+                        "reason": str(e), "experiment_id": exp_id})
+        finally:
+            events.put(None)
+
+    def _stream():
+        yield encode({"event": "experiment", "experiment_id": exp_id, "total": total})
+        threading.Thread(target=_produce, daemon=True).start()
+        done: Dict[int, Dict[str, Any]] = {}
+        try:
+            while True:
+                ev = events.get()
+                if ev is None:
+                    break
+                if ev["event"] != "result":
+                    yield encode(ev)
+                    continue
+                enriched = analyze_response_batch(prompt, [ev["raw"]], req.metrics)[0]
+                done[ev["index"]] = enriched
+                yield encode({"event": "response", "index": ev["index"], "param_set": enriched.get("param_set", {}),
+                              "text": enriched.get("text", ""), "metrics": enriched["metrics"],
+                              **({"stopped": enriched["stopped"]} if enriched.get("stopped") else {}),
+                              **({"live": ev["live"]} if ev.get("live") else {})})
+            yield encode({"event": "done", "experiment_id": exp_id, "num_responses": len(done)})
+        finally:
+            # persist in sweep order, including partial results if the client went away
+            if done:
+                st_add_responses(exp_id, [done[i] for i in sorted(done)])
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_stream(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+def _summary(exp_id: str, cells: bool) -> Dict[str, Any]:
+    rows = st_get_aggregates(exp_id, include_cells=cells)
+    if not rows:
+        meta = st_get_experiment_meta(exp_id)
+        if not meta:
+            raise HTTPException(status_code=404, detail="not found")
+        # experiments stored before the aggregates table existed: backfill once
+        st_rebuild_aggregates(exp_id)
+        rows = st_get_aggregates(exp_id, include_cells=cells)
+    return aggregates.build_summary(exp_id, rows, include_cells=cells)
+
+@app.get("/experiments/{exp_id}/summary")
+def exp_summary(exp_id: str, cells: bool = True):
+    """count/mean/std/min/max/p50/p90/p99 per metric, overall and per param cell, from running aggregates."""
+    return _summary(exp_id, cells)
+
+@app.get("/summary")
+def summary_many(experiment_ids: str, cells: bool = False):
+    """Side-by-side experiment summaries for comparisons: ?experiment_ids=a,b,c"""
+    ids = [i.strip() for i in experiment_ids.split(",") if i.strip()]
+    return {"summaries": [_summary(i, cells) for i in ids]}
+
+@app.get("/experiments/{exp_id}/similarity")
+def exp_similarity(exp_id: str, threshold: float = Query(default=None, ge=0.0, le=1.0), idf: bool = True,
+                   cells: bool = True, neighbors: bool = False):
+    """Prompt similarity, pairwise diversity (overall / per param cell) and near-duplicate clusters."""
+    import similarity
+    try:
+        out = similarity.experiment_similarity(exp_id, similarity.SIM_DUP_THRESHOLD if threshold is None else threshold,
+                                               idf=idf, cells=cells, neighbors=neighbors)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not out:
+        raise HTTPException(status_code=404, detail="not found")
+    return out
+
+@app.get("/experiments/{exp_id}/status")
+def exp_status(exp_id: str):
+    job = st_get_job(exp_id)
+    if job:
+        done, total = int(job.get("done") or 0), int(job.get("total") or 0)
+        return {"experiment_id": exp_id, "status": job.get("status"), "done": done, "total": total,
+                "progress": f"{done}/{total}", "error": job.get("error"),
+                "mode": job.get("mode") or "job", "batch_id": job.get("batch_id"), "result": job.get("result")}
+    # experiments created synchronously have no job row; they are complete by definition
     payload = st_get_experiment(exp_id)
     if not payload:
         raise HTTPException(status_code=404, detail="Experiment not found")
-    # normalize responses field
-    norm = []
-    for r in payload.get("responses", []):
-        norm.append({
-            "response_id": r.get("response_id") or r.get("id") or str(uuid.uuid4()),
-            "param_set": r.get("param_set", {}),
-            "text": r.get("text",""),
-            "metrics": r.get("metrics", {}),
-        })
-    payload["responses"] = norm
-    return payload
+    n = len(payload.get("responses", []))
+    return {"experiment_id": exp_id, "status": "done", "done": n, "total": n, "progress": f"{n}/{n}", "error": None}
+
+@app.post("/admin/rescore")
+def start_rescore(chunk_size: int = 1000, workers: Optional[int] = None, restart: bool = False):
+    """Recompute metrics for every stored response in the background (resumes from checkpoint)."""
+    import rescore
+    started = rescore.start_background(chunk_size, workers or rescore.DEFAULT_WORKERS, restart)
+    if not started:
+        raise HTTPException(status_code=409, detail="rescore already running")
+    return {"ok": True, "status": rescore.status()}
+
+@app.get("/admin/rescore")
+def rescore_status():
+    import rescore
+    return rescore.status()
+
+@app.get("/experiments")
+async def list_exps(skip: int = 0, limit: int = 50, cursor: Optional[str] = None, model: Optional[str] = None):
+    """Newest first; pass next_cursor from the previous page for constant-cost paging."""
+    try:
+        rows, next_cursor = await storage_async.list_experiments(skip, limit, cursor, model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"experiments": rows, "next_cursor": next_cursor}
+
+_RESPONSE_DEFAULTS = {"param_set": {}, "text": "", "metrics": {}}
+
+def _fields(fields: Optional[str]):
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _norm_response(r: Dict[str, Any], fields=tuple(_RESPONSE_DEFAULTS)) -> Dict[str, Any]:
+    out = {"response_id": r.get("response_id") or r.get("id") or str(uuid.uuid4())}
+    for f in fields:
+        out[f] = r.get(f, _RESPONSE_DEFAULTS[f])
+    return out
+
+@app.get("/experiments/{exp_id}")
+async def get_exp(exp_id: str, request: Request, fields: Optional[str] = None):
+    """
+    fields=param_set,metrics skips reading (and decompressing) response texts.
+    The serialized payload is cached until the experiment is written to again; send
+    the ETag back as If-None-Match to get a 304 while nothing changed.
+    """
+    fields = _fields(fields)
+    hit = exp_cache.cache.get(exp_id, fields)
+    if hit is None:
+        gen = exp_cache.cache.generation(exp_id)
+        payload = await storage_async.get_experiment(exp_id, fields=fields)
+        if not payload:
+            raise HTTPException(status_code=404, detail="Experiment not found")
+        # normalize responses field
+        payload["responses"] = [_norm_response(r, fields) for r in payload.get("responses", [])]
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        hit = exp_cache.cache.put(exp_id, fields, body, gen)
+    body, etag = hit
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if exp_cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "500"))
+
+@app.get("/search")
+def search(q: Optional[str] = None, metric: List[str] = Query(default=[]), model: Optional[str] = None,
+           experiment_ids: Optional[str] = None, limit: int = 50, cursor: Optional[str] = None,
+           fields: Optional[str] = None):
+    """
+    Responses across experiments by full-text query and/or metric ranges, e.g.
+    /search?q="as an AI"&metric=repetition>0.3&model=gpt-4o-mini; page with next_cursor.
+    """
+    fields = _fields(fields)
+    try:
+        filters = parse_metric_filters(metric)
+        ids = [i for i in (experiment_ids or "").split(",") if i]
+        rows, next_cursor = st_search_responses(q, filters, model=model, experiment_ids=ids or None,
+                                                limit=max(1, min(limit, SEARCH_MAX_LIMIT)), cursor=cursor, fields=fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    results = [{**_norm_response(r, fields), "experiment_id": r.get("experiment_id")} for r in rows]
+    return {"results": results, "next_cursor": next_cursor}
+
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+
+def _export_meta(exp_id: str) -> Dict[str, Any]:
+    exp = st_get_experiment_meta(exp_id)
+    if not exp:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    return exp
+
+def _iter_export_rows(exp_id: str, fields=tuple(_RESPONSE_DEFAULTS)):
+    for r in st_iter_experiment_responses(exp_id, EXPORT_PAGE_SIZE, fields=fields):
+        yield _norm_response(r, fields)
 
 @app.get("/experiments/{exp_id}/export/json")
-def export_json(exp_id: str):
-    payload = get_exp(exp_id)
-    s = json.dumps(payload, indent=2, ensure_ascii=False)
-    return StreamingResponse(io.BytesIO(s.encode("utf-8")),
+def export_json(exp_id: str, fields: Optional[str] = None):
+    fields = _fields(fields)
+    exp = _export_meta(exp_id)
+
+    def _gen():
+        # same document shape as GET /experiments/{id}, written one response at a time
+        yield '{\n  "experiment": ' + json.dumps(exp, ensure_ascii=False) + ',\n  "responses": ['
+        sep = "\n    "
+        for r in _iter_export_rows(exp_id, fields):
+            yield sep + json.dumps(r, ensure_ascii=False)
+            sep = ",\n    "
+        yield "\n  ]\n}\n"
+
+    return StreamingResponse(telemetry.timed_stream(_gen(), "json"),
                              media_type="application/json",
                              headers={"Content-Disposition": f"attachment; filename={exp_id}.json"})
 
+@app.get("/experiments/{exp_id}/export/ndjson")
+def export_ndjson(exp_id: str, fields: Optional[str] = None):
+    fields = _fields(fields)
+    exp = _export_meta(exp_id)
+
+    def _gen():
+        yield json.dumps({"experiment": exp}, ensure_ascii=False) + "\n"
+        for r in _iter_export_rows(exp_id, fields):
+            yield json.dumps(r, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(telemetry.timed_stream(_gen(), "ndjson"),
+                             media_type="application/x-ndjson",
+                             headers={"Content-Disposition": f"attachment; filename={exp_id}.ndjson"})
+
 @app.get("/experiments/{exp_id}/export/csv")
 def export_csv(exp_id: str):
-    payload = get_exp(exp_id)
-    rows = []
-    exp_model = payload.get("experiment", {}).get("model", "")
-    for r in payload.get("responses", []):
-        row = {
-            "response_id": r["response_id"],
-            "model": exp_model,
-            "param_set": json.dumps(r.get("param_set", {})),
-            "text": r.get("text",""),
-        }
-        for k, v in r.get("metrics", {}).items():
-            row[f"metric_{k}"] = v
-        rows.append(row)
-    import pandas as pd
-    df = pd.DataFrame(rows)
-    buf = io.StringIO()
-    df.to_csv(buf, index=False)
-    return StreamingResponse(io.BytesIO(buf.getvalue().encode()),
+    exp = _export_meta(exp_id)
+    exp_model = exp.get("model", "")
+    # rows can carry different metric sets (metric subsets, rescores, removed plugins), so the header is
+    # every registered metric plus any other metric the experiment's aggregates have seen
+    metric_keys = metric_registry.resolve()
+    metric_keys += sorted({a["metric"] for a in st_get_aggregates(exp_id, include_cells=False)} - set(metric_keys))
+
+    def _gen():
+        rows = _iter_export_rows(exp_id)
+        first = next(rows, None)
+        buf = io.StringIO()
+        w = csv.writer(buf, lineterminator="\n")
+        w.writerow(["response_id", "model", "param_set", "text"] + [f"metric_{k}" for k in metric_keys])
+        if first is None:
+            yield buf.getvalue()
+            return
+        for i, r in enumerate(itertools.chain([first], rows)):
+            m = r.get("metrics", {})
+            w.writerow([r["response_id"], exp_model, json.dumps(r.get("param_set", {})), r.get("text","")]
+                       + [m.get(k, "") for k in metric_keys])
+            if i % 100 == 99:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    return StreamingResponse(telemetry.timed_stream(_gen(), "csv"),
                              media_type="text/csv",
                              headers={"Content-Disposition": f"attachment; filename={exp_id}.csv"})
+
+COLUMNAR_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+def _columnar_response(fmt: str, experiments: List[Dict[str, Any]], include_text: bool, filename: str):
+    import columnar
+    if fmt not in COLUMNAR_FORMATS:
+        raise HTTPException(status_code=400, detail=f"unknown format {fmt!r}, expected parquet | arrow")
+    try:
+        columnar.schema(include_text)  # fail fast (501) when pyarrow is missing
+    except columnar.ColumnarUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    fields = ("param_set", "text", "metrics") if include_text else ("param_set", "metrics")
+    rows = columnar.rows_for(experiments, lambda exp_id, page_size: st_iter_experiment_responses(exp_id, page_size, fields=fields),
+                             EXPORT_PAGE_SIZE)
+    body = columnar.iter_parquet(rows, include_text) if fmt == "parquet" else columnar.iter_arrow_stream(rows, include_text)
+    media_type, ext = COLUMNAR_FORMATS[fmt]
+    return StreamingResponse(telemetry.timed_stream(body, fmt), media_type=media_type,
+                             headers={"Content-Disposition": f"attachment; filename={filename}.{ext}"})
+
+@app.get("/experiments/{exp_id}/export/{fmt}")
+def export_columnar(exp_id: str, fmt: str, include_text: bool = True):
+    """Typed columnar export: fmt = parquet | arrow (Arrow IPC stream)."""
+    exp = _export_meta(exp_id)
+    return _columnar_response(fmt, [exp], include_text, exp_id)
+
+@app.get("/export/{fmt}")
+def export_columnar_many(fmt: str, experiment_ids: Optional[str] = None, model: Optional[str] = None,
+                         include_text: bool = True):
+    """
+    Cross-experiment columnar export. experiment_ids is a comma-separated list;
+    model filters on the experiment model. With no filters every response is exported.
+    """
+    ids = [i.strip() for i in (experiment_ids or "").split(",") if i.strip()]
+    experiments = st_find_experiments(ids=ids or None, model=model)
+    return _columnar_response(fmt, experiments, include_text, "responses")
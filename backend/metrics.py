@@ -1,12 +1,168 @@
 # metrics.py
-from typing import List, Dict, Any
+#
+# Metrics are registered with the features they need; features are the shared intermediate
+# values (tokens, sentences, n-grams, the syllable-based reading ease) that several metrics read.
+# Scoring a subset computes only the features and metrics that subset reaches, each once, in
+# dependency order. Custom metrics register with @metric (e.g. from a METRIC_PLUGINS module):
+#
+#   @metric("question_marks", needs=("tokens",))
+#   def question_marks(f):
+#       return min(1.0, f["text"].count("?") / max(1, len(f["tokens"])) * 10)
+#
+import os
 import re
+import importlib
+from typing import List, Dict, Any, Callable, Iterable, Optional, NamedTuple
 from collections import Counter
+import numpy as np
 import textstat
 
+import telemetry
+
+# comma separated modules imported at the end of this one; they register custom metrics
+METRIC_PLUGINS = os.getenv("METRIC_PLUGINS", "")
+
+
+class _Node(NamedTuple):
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]
+    needs: tuple
+
+
+_features: Dict[str, _Node] = {}
+_metrics: Dict[str, _Node] = {}  # registration order is output order
+
+
+def _register(table: Dict[str, _Node], name: str, needs: Iterable[str]):
+    needs = tuple(needs)
+    if name in _features or name in _metrics or name in ("prompt", "text"):
+        raise ValueError(f"{name!r} is already registered")
+    # dependencies must exist already, so the graph can't have cycles and registration order is a valid order
+    unknown = [n for n in needs if n not in _features and n not in _metrics]
+    if unknown:
+        raise ValueError(f"{name!r} needs unregistered {', '.join(unknown)}")
+
+    def deco(fn):
+        table[name] = _Node(name, fn, needs)
+        return fn
+    return deco
+
+
+def feature(name: str, needs: Iterable[str] = ()):
+    """Register a shared feature: fn(f) gets the values computed so far ("prompt", "text", its needs)."""
+    return _register(_features, name, needs)
+
+
+def metric(name: str, needs: Iterable[str] = ()):
+    """Register a metric returning a float; needs may list features and other metrics."""
+    return _register(_metrics, name, needs)
+
+
+def metric_names() -> List[str]:
+    return list(_metrics)
+
+
+def describe() -> List[Dict[str, Any]]:
+    """Registered metrics with everything each one needs, for clients picking a subset."""
+    return [{"name": m, "needs": [n for n in plan([m]) if n != m], "builtin": m in METRIC_KEYS} for m in _metrics]
+
+
+def resolve(names: Optional[Iterable[str]] = None) -> List[str]:
+    """Requested metric names in output order (None = all); ValueError for unknown names."""
+    if names is None:
+        return list(_metrics)
+    names = set(names)
+    unknown = sorted(names - set(_metrics))
+    if unknown:
+        raise ValueError(f"unknown metrics {', '.join(unknown)} (available: {', '.join(_metrics)})")
+    return [m for m in _metrics if m in names]
+
+
+def plan(names: Iterable[str]) -> List[str]:
+    """Every feature / metric needed for names, dependencies first."""
+    order: List[str] = []
+    seen = set()
+
+    def visit(n: str) -> None:
+        if n in seen:
+            return
+        seen.add(n)
+        for d in (_features.get(n) or _metrics[n]).needs:
+            visit(d)
+        order.append(n)
+
+    for n in names:
+        visit(n)
+    return order
+
+
+def _evaluate(prompt: str, text: str, order: List[str], seed: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    f: Dict[str, Any] = {"prompt": prompt, "text": text, **(seed or {})}
+    for n in order:
+        if n not in f:
+            f[n] = (_features.get(n) or _metrics[n]).fn(f)
+    return f
+
+
 def _tokenize(text: str) -> List[str]:
     return re.findall(r"[A-Za-z']+", text.lower())
 
+def _sentences(text: str) -> List[str]:
+    # light splitter that handles common punctuation
+    chunks = re.split(r'(?<=[.!?])\s+', text.strip())
+    return [c for c in chunks if c]
+
+
+# ---------------- scoring rules (shared by the per-text and batch paths) ----------------
+
+def _repetition(n_tokens: Any, n_repeated: Any, n: int = 3) -> Any:
+    if isinstance(n_tokens, np.ndarray):
+        return n_repeated / np.maximum(1, n_tokens - n + 1)
+    return n_repeated / max(1, n_tokens - n + 1)
+
+def _length_ok(l: Any, min_w=30, max_w=220) -> Any:
+    if isinstance(l, np.ndarray):
+        return np.where(
+            (l >= min_w) & (l <= max_w), 1.0,
+            np.where(l < min_w, np.maximum(0.0, l / min_w), np.maximum(0.0, (max_w - (l - max_w)) / max_w)),
+        )
+    if min_w <= l <= max_w:
+        return 1.0
+    if l < min_w:
+        return max(0.0, l / min_w)
+    return max(0.0, (max_w - (l - max_w)) / max_w)
+
+def _readability(fre: float) -> float:
+    fre = max(-20.0, min(120.0, fre))
+    return (fre + 20.0) / 140.0
+
+def _clarity(avg: Any, lo: float = 12.0, hi: float = 24.0) -> Any:
+    # 1.0 in-band, linear falloff up to +/- 24 words from the band edges
+    if isinstance(avg, np.ndarray):
+        return np.where((avg >= lo) & (avg <= hi), 1.0,
+                        np.where(avg < lo, np.maximum(0.0, 1.0 - (lo - avg) / 24.0),
+                                 np.maximum(0.0, 1.0 - (avg - hi) / 24.0)))
+    if lo <= avg <= hi:
+        return 1.0
+    if avg < lo:
+        return max(0.0, 1.0 - (lo - avg) / 24.0)
+    return max(0.0, 1.0 - (avg - hi) / 24.0)
+
+def _aggregate(ld, rep, ln, st, kw, rd, cl):
+    # works on floats and on NumPy columns alike, in the same operation order
+    return (
+        0.18 * ld +
+        0.12 * (1 - rep) +
+        0.18 * ln +
+        0.14 * st +
+        0.14 * kw +
+        0.12 * rd +
+        0.12 * cl
+    )
+
+
+# ---------------- single-text helpers ----------------
+
 def lexical_diversity(text: str) -> float:
     toks = _tokenize(text)
     return 0.0 if not toks else len(set(toks)) / len(toks)
@@ -18,15 +174,10 @@ def repetition_score(text: str, n: int = 3) -> float:
     ngrams = [' '.join(toks[i:i+n]) for i in range(len(toks)-n+1)]
     counts = Counter(ngrams)
     repeated = sum(1 for v in counts.values() if v > 1)
-    return repeated / max(1, len(ngrams))
+    return _repetition(len(toks), repeated, n)
 
 def length_ok(text: str, min_w=30, max_w=220) -> float:
-    l = len(_tokenize(text))
-    if min_w <= l <= max_w:
-        return 1.0
-    if l < min_w:
-        return max(0.0, l / min_w)
-    return max(0.0, (max_w - (l - max_w)) / max_w)
+    return _length_ok(len(_tokenize(text)), min_w, max_w)
 
 def structure_score(text: str) -> float:
     score = 0.0
@@ -43,92 +194,211 @@ def keyword_coverage(prompt: str, text: str) -> float:
     covered = sum(1 for k in p if k in t)
     return covered / len(p)
 
-def readability_score(text: str) -> float:
+def _reading_ease(text: str) -> float:
     try:
-        fre = textstat.flesch_reading_ease(text)
+        return textstat.flesch_reading_ease(text)
     except Exception:
-        fre = 50.0
-    fre = max(-20.0, min(120.0, fre))
-    return (fre + 20.0) / 140.0
+        return 50.0
 
-def analyze_response(prompt: str, text: str) -> Dict[str, float]:
-    ld = lexical_diversity(text)
-    rep = repetition_score(text)
-    ln = length_ok(text)
-    st = structure_score(text)
-    kw = keyword_coverage(prompt, text)
-    rd = readability_score(text)
-    agg = 0.2*ld + 0.15*(1-rep) + 0.2*ln + 0.15*st + 0.15*kw + 0.15*rd
-    return {
-        "lexical_diversity": round(ld, 4),
-        "repetition": round(rep, 4),
-        "length_ok": round(ln, 4),
-        "structure": round(st, 4),
-        "keyword_coverage": round(kw, 4),
-        "readability": round(rd, 4),
-        "aggregate_score": round(agg, 4),
-    }
-
-def analyze_response_batch(prompt: str, raw: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    out = []
-    for r in raw:
-        txt = r.get("text", "")
-        out.append({**r, "metrics": analyze_response(prompt, txt)})
-    return out
-
-
-def _sentences(text: str) -> List[str]:
-    # light splitter that handles common punctuation
-    chunks = re.split(r'(?<=[.!?])\s+', text.strip())
-    return [c for c in chunks if c]
+def readability_score(text: str) -> float:
+    return _readability(_reading_ease(text))
 
 def clarity_score(text: str) -> float:
     """
     Rates average sentence length in words. Ideal band ~12–24 words.
     Scores 1.0 in-band, tapers outside.
     """
-    sents = _sentences(text)
-    if not sents:
-        return 0.0
-    lengths = [len(_tokenize(s)) for s in sents if _tokenize(s)]
+    lengths = [len(t) for t in map(_tokenize, _sentences(text)) if t]
     if not lengths:
         return 0.0
-    avg = sum(lengths) / len(lengths)
-    lo, hi = 12.0, 24.0
-    if lo <= avg <= hi:
-        return 1.0
-    # linear falloff up to +/- 24 words from the band edges
-    if avg < lo:
-        return max(0.0, 1.0 - (lo - avg) / 24.0)
-    return max(0.0, 1.0 - (avg - hi) / 24.0)
+    return _clarity(sum(lengths) / len(lengths))
 
-def analyze_response(prompt: str, text: str) -> Dict[str, float]:
-    ld = lexical_diversity(text)
-    rep = repetition_score(text)
-    ln = length_ok(text)
-    st = structure_score(text)
-    kw = keyword_coverage(prompt, text)
-    rd = readability_score(text)
-    cl = clarity_score(text)
-
-    # reweight aggregate to include clarity
-    agg = (
-        0.18 * ld +
-        0.12 * (1 - rep) +
-        0.18 * ln +
-        0.14 * st +
-        0.14 * kw +
-        0.12 * rd +
-        0.12 * cl
-    )
+
+# ---------------- built-in features and metrics ----------------
+
+feature("tokens")(lambda f: _tokenize(f["text"]))
+feature("token_set", needs=("tokens",))(lambda f: set(f["tokens"]))
+feature("prompt_keywords")(lambda f: set(t for t in _tokenize(f["prompt"]) if len(t) > 3))
+feature("trigrams", needs=("tokens",))(
+    lambda f: Counter(' '.join(f["tokens"][i:i+3]) for i in range(len(f["tokens"]) - 2)))
+feature("sentence_lengths")(lambda f: [len(t) for t in map(_tokenize, _sentences(f["text"])) if t])
+# textstat counts syllables over the whole text: by far the most expensive feature
+feature("reading_ease")(lambda f: _reading_ease(f["text"]))
+
+
+@metric("lexical_diversity", needs=("tokens", "token_set"))
+def _m_lexical_diversity(f):
+    return 0.0 if not f["tokens"] else len(f["token_set"]) / len(f["tokens"])
+
+@metric("repetition", needs=("tokens", "trigrams"))
+def _m_repetition(f):
+    if len(f["tokens"]) < 3:
+        return 0.0
+    return _repetition(len(f["tokens"]), sum(1 for v in f["trigrams"].values() if v > 1))
+
+@metric("length_ok", needs=("tokens",))
+def _m_length_ok(f):
+    return _length_ok(len(f["tokens"]))
+
+@metric("structure")
+def _m_structure(f):
+    return structure_score(f["text"])
+
+@metric("keyword_coverage", needs=("prompt_keywords", "token_set"))
+def _m_keyword_coverage(f):
+    p = f["prompt_keywords"]
+    return sum(1 for k in p if k in f["token_set"]) / len(p) if p else 0.0
+
+@metric("readability", needs=("reading_ease",))
+def _m_readability(f):
+    return _readability(f["reading_ease"])
+
+@metric("clarity_score", needs=("sentence_lengths",))
+def _m_clarity(f):
+    lengths = f["sentence_lengths"]
+    return _clarity(sum(lengths) / len(lengths)) if lengths else 0.0
+
+_AGG_INPUTS = ("lexical_diversity", "repetition", "length_ok", "structure", "keyword_coverage", "readability", "clarity_score")
+
+@metric("aggregate_score", needs=_AGG_INPUTS)
+def _m_aggregate(f):
+    return _aggregate(*(f[k] for k in _AGG_INPUTS))
+
+
+# built-in metrics, in order: these are the typed columns in storage (custom metrics go to its metrics JSON)
+METRIC_KEYS = metric_names()
+
+
+def analyze_response(prompt: str, text: str, metrics: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    names = resolve(metrics)
+    f = _evaluate(prompt, text, plan(names))
+    return {k: round(f[k], 4) for k in names}
+
+
+def analyze_response_batch(prompt: str, raw: List[Dict[str, Any]], metrics: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    # cells with a prompt_override are scored against their own prompt
+    names = resolve(metrics)
+    groups: Dict[str, List[int]] = {}
+    for i, r in enumerate(raw):
+        groups.setdefault((r.get("param_set") or {}).get("prompt_override") or prompt, []).append(i)
+    scores: List[Dict[str, float]] = [{} for _ in raw]
+    telemetry.SCORING_BATCH_SIZE.observe(len(raw))
+    with telemetry.span("scoring", telemetry.SCORING_SECONDS):
+        for p, idx in groups.items():
+            for i, m in zip(idx, score_batch(p, [raw[i].get("text", "") for i in idx], names)):
+                scores[i] = m
+    return [{**r, "metrics": m} for r, m in zip(raw, scores)]
+
+
+_TOKEN_RE = re.compile(r"[A-Za-z']+")
+_SENT_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+# built-ins computed for the whole batch from one tokenization pass
+_TOKEN_METRICS = {"lexical_diversity", "repetition", "length_ok", "keyword_coverage", "clarity_score"}
+
+
+def score_batch(prompt: str, texts: List[str], metrics: Optional[Iterable[str]] = None) -> List[Dict[str, float]]:
+    """
+    Batch equivalent of analyze_response: returns exactly the same dicts, but each text
+    is tokenized once, the prompt keyword set is built once, and the token / n-gram /
+    sentence features are computed over the whole batch with NumPy arrays.
+    Structure, readability and custom metrics run per text, and only when requested.
+    """
+    names = resolve(metrics)
+    n_docs = len(texts)
+    if not n_docs:
+        return []
+    order = plan(names)
+    needed = set(order)
+    cols: Dict[str, Any] = {}
+
+    if needed & _TOKEN_METRICS:
+        cols.update(_token_columns(prompt, texts))
+    if "structure" in needed:
+        cols["structure"] = np.asarray([structure_score(t) for t in texts], dtype=np.float64)
+    if "readability" in needed:
+        cols["readability"] = np.asarray([readability_score(t) for t in texts], dtype=np.float64)
+    if "aggregate_score" in needed:
+        cols["aggregate_score"] = _aggregate(*(cols[k] for k in _AGG_INPUTS))
+    cols = {k: v.tolist() for k, v in cols.items() if k in needed}
+
+    rest = [n for n in order if n not in cols]
+    out = []
+    for i, text in enumerate(texts):
+        row = {k: col[i] for k, col in cols.items()}
+        if any(n in _metrics for n in rest):
+            # custom metrics: per text, reusing the batch values of any built-ins they depend on
+            row = _evaluate(prompt, text, rest, row)
+        # Python's round() (not np.round) so values match analyze_response exactly
+        out.append({k: round(row[k], 4) for k in names})
+    return out
+
+
+def _token_columns(prompt: str, texts: List[str]) -> Dict[str, np.ndarray]:
+    n_docs = len(texts)
+
+    # Tokenize each sentence piece once: the concatenated pieces are exactly _tokenize(text)
+    # (tokens never span whitespace) and their lengths are what clarity_score needs.
+    # Lowercasing never creates/removes [.!?] or whitespace, so the split matches _sentences().
+    tokens: List[str] = []
+    n_tok_list: List[int] = []
+    sent_len: List[int] = []
+    sent_doc: List[int] = []
+    for d, text in enumerate(texts):
+        count = 0
+        for piece in _SENT_SPLIT_RE.split(text.strip().lower()):
+            toks = _TOKEN_RE.findall(piece)
+            if toks:
+                tokens.extend(toks)
+                sent_len.append(len(toks))
+                sent_doc.append(d)
+                count += len(toks)
+        n_tok_list.append(count)
+
+    vocab = {t: i for i, t in enumerate(dict.fromkeys(tokens))}
+    tok = np.fromiter(map(vocab.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+    n_tok = np.asarray(n_tok_list, dtype=np.int64)
+    doc = np.repeat(np.arange(n_docs, dtype=np.int64), n_tok)
+
+    # unique tokens per doc, and how many of them are prompt keywords
+    v = max(1, len(vocab))
+    pairs = np.unique(doc * v + tok)
+    pair_doc = pairs // v
+    n_unique = np.bincount(pair_doc, minlength=n_docs)
+    prompt_kw = set(t for t in _tokenize(prompt) if len(t) > 3)
+    n_kw = len(prompt_kw)
+    kw_ids = np.asarray([vocab[t] for t in prompt_kw if t in vocab], dtype=np.int64)
+    n_covered = np.bincount(pair_doc[np.isin(pairs % v, kw_ids)], minlength=n_docs)
+
+    # repeated trigrams per doc: a trigram starting at i is valid if i and i+2 share a doc.
+    # Factorize bigram -> trigram ids so the final (doc, trigram) key fits in int64.
+    n_repeated = np.zeros(n_docs, dtype=np.int64)
+    valid = doc[:-2] == doc[2:] if len(tok) >= 3 else np.zeros(0, dtype=bool)
+    if valid.any():
+        _, bi = np.unique(tok[:-2][valid] * v + tok[1:-1][valid], return_inverse=True)
+        _, tri = np.unique(bi.reshape(-1) * v + tok[2:][valid], return_inverse=True)
+        width = int(tri.max()) + 1
+        keys, counts = np.unique(doc[:-2][valid] * width + tri.reshape(-1), return_counts=True)
+        n_repeated = np.bincount(keys[counts > 1] // width, minlength=n_docs)
+
+    # sentence lengths are exact integers, so float sums divide exactly like sum()/len()
+    sent_doc_arr = np.asarray(sent_doc, dtype=np.int64)
+    n_sent = np.bincount(sent_doc_arr, minlength=n_docs)
+    sent_sum = np.bincount(sent_doc_arr, weights=np.asarray(sent_len, dtype=np.float64), minlength=n_docs)
+    avg = sent_sum / np.maximum(n_sent, 1)
 
     return {
-        "lexical_diversity": round(ld, 4),
-        "repetition": round(rep, 4),
-        "length_ok": round(ln, 4),
-        "structure": round(st, 4),
-        "keyword_coverage": round(kw, 4),
-        "readability": round(rd, 4),
-        "clarity_score": round(cl, 4),
-        "aggregate_score": round(agg, 4),
-    }
\ No newline at end of file
+        "lexical_diversity": np.where(n_tok > 0, n_unique / np.maximum(n_tok, 1), 0.0),
+        "repetition": np.where(n_tok >= 3, _repetition(n_tok, n_repeated), 0.0),
+        "length_ok": _length_ok(n_tok),
+        "keyword_coverage": n_covered / n_kw if n_kw else np.zeros(n_docs),
+        "clarity_score": np.where(n_sent == 0, 0.0, _clarity(avg)),
+    }
+
+
+def load_plugins(modules: str = METRIC_PLUGINS) -> None:
+    for name in (m.strip() for m in modules.split(",")):
+        if name:
+            importlib.import_module(name)
+
+
+load_plugins()
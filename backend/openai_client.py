@@ -1,5 +1,5 @@
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple
 from dotenv import load_dotenv
 load_dotenv()
 import logging
@@ -7,6 +7,11 @@ import time
 
 from openai import OpenAI
 
+import rate_limiter
+import telemetry
+from client_registry import get_client
+from concurrency import map_ordered, iter_completed, provider_concurrency
+
 DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 DEFAULT_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
 
@@ -20,25 +25,27 @@ def _make_client() -> OpenAI:
         raise ValueError("OPENAI_API_KEY not found. Set it in your environment or .env file.")
     # If your OpenAI SDK supports max_retries on the client constructor you could pass it here:
     # return OpenAI(api_key=api_key, max_retries=DEFAULT_MAX_RETRIES)
-    return OpenAI(api_key=api_key)
+    # one shared client per key: keep-alive connections are reused across generations
+    return get_client("openai", api_key, lambda k, http: OpenAI(api_key=k, http_client=http))
 
-def generate_responses_sync(prompt: str, param_sets: List[Dict[str, Any]], model: str = DEFAULT_MODEL) -> List[Dict[str, Any]]:
-    print("Creating OpenAI client...", prompt, param_sets, model)
-    client = _make_client()
-    results: List[Dict[str, Any]] = []
-    max_retries = int(os.getenv("MAX_RETRIES", DEFAULT_MAX_RETRIES))
-    print("Generating responses using OpenAI client (Responses API)...")
-    for p in param_sets:
-        prompt_text = prompt
-        text = ""
+def _generate_one(client: OpenAI, prompt: str, p: Dict[str, Any], model: str, max_retries: int) -> str:
+    prompt_text = p.get("prompt_override") or prompt
+    text = ""
+    with telemetry.span("provider_request", telemetry.PROVIDER_REQUEST_SECONDS, provider="openai", model=model) as sp:
         for attempt in range(1, max_retries + 1):
             try:
                 # Use Responses API
-                resp = client.responses.create(
-                    model=model,
-                    input=prompt_text,
-                    temperature=float(p.get("temperature", 0.7)),
-                    top_p=float(p.get("top_p", 1.0)),
+                # paced by the shared per-model limiter; 429s are re-queued there
+                resp = rate_limiter.call(
+                    "openai", model,
+                    lambda: client.responses.create(
+                        model=model,
+                        input=prompt_text,
+                        temperature=float(p.get("temperature", 0.7)),
+                        top_p=float(p.get("top_p", 1.0)),
+                    ),
+                    est_tokens=rate_limiter.estimate_tokens(prompt_text, p.get("max_tokens")),
+                    tokens_used=lambda r: getattr(getattr(r, "usage", None), "total_tokens", None),
                 )
 
                 # Robust extraction: prefer output_text, else walk output -> content -> text
@@ -63,13 +70,54 @@ def generate_responses_sync(prompt: str, param_sets: List[Dict[str, Any]], model
                 if "insufficient_quota" in msg or "quota" in msg or "exceed" in msg:
                     logging.exception("Quota error detected, raising QuotaExceededError: %s", e)
                     raise QuotaExceededError(str(e))
-                logging.exception("Attempt %s/%s failed for param_set %s: %s", attempt, max_retries, p, e)
+                logging.warning("Attempt %s/%s failed for param_set %s: %s", attempt, max_retries, p, e)
                 if attempt < max_retries:
+                    telemetry.PROVIDER_RETRIES.inc(provider="openai", model=model, reason="error")
                     backoff = min(2 ** (attempt - 1), 8)
                     time.sleep(backoff)
                     continue
                 else:
-                    print(f"Error generating response (final attempt): {e}")
+                    logging.error("Error generating response (final attempt): %s", e)
+                    sp["outcome"] = "error"
                     text = ""
-        results.append({"param_set": p, "text": text})
-    return results
+    return text
+
+def generate_responses_sync(prompt: str, param_sets: List[Dict[str, Any]], model: str = DEFAULT_MODEL) -> List[Dict[str, Any]]:
+    """
+    Fan the param sets out over a bounded thread pool (OPENAI_CONCURRENCY).
+    Results keep param-set order; a failed call is recorded with an "error" key
+    instead of aborting the sweep. Quota errors only propagate if every call hit one.
+    """
+    client = _make_client()
+    max_retries = int(os.getenv("MAX_RETRIES", DEFAULT_MAX_RETRIES))
+    cells = _cells(param_sets)
+    outcomes = map_ordered(
+        lambda p: _generate_one(client, prompt, p, model, max_retries),
+        cells,
+        provider_concurrency("openai"),
+    )
+    quota_errors = [o for o in outcomes if isinstance(o, QuotaExceededError)]
+    if outcomes and len(quota_errors) == len(outcomes):
+        raise quota_errors[0]
+    return [_result(p, o) for p, o in zip(cells, outcomes)]
+
+def _cells(param_sets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # the Responses API has no n; issue one call per requested sample
+    return [p for p in param_sets for _ in range(int(p.get("n", 1) or 1))]
+
+def _result(p: Dict[str, Any], o: Any) -> Dict[str, Any]:
+    if isinstance(o, Exception):
+        return {"param_set": p, "text": "", "error": str(o)}
+    return {"param_set": p, "text": o}
+
+def iter_responses(prompt: str, param_sets: List[Dict[str, Any]], model: str = DEFAULT_MODEL) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (cell index, result) in completion order; used by the streaming endpoint."""
+    client = _make_client()
+    max_retries = int(os.getenv("MAX_RETRIES", DEFAULT_MAX_RETRIES))
+    cells = _cells(param_sets)
+    for i, o in iter_completed(
+        lambda p: _generate_one(client, prompt, p, model, max_retries),
+        cells,
+        provider_concurrency("openai"),
+    ):
+        yield i, _result(cells[i], o)
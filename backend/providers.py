@@ -0,0 +1,155 @@
+# providers.py (provider adapters + dispatch shared by the sync, job and stream paths)
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
+
+import logging
+
+import live_scoring
+import response_cache
+import telemetry
+
+log = telemetry.get_logger("providers")
+
+DEFAULT_MODEL_BY_PROVIDER = {
+    "gemini": "gemini-2.5-flash",
+    "openai": "gpt-4o-mini",
+}
+
+# Provider adapters
+def _gemini_generate(prompt: str, param_sets: List[Dict[str, Any]], model: str):
+    from gemini_client import generate_responses_sync
+    return generate_responses_sync(prompt, param_sets, model=model)
+
+def _openai_generate(prompt: str, param_sets: List[Dict[str, Any]], model: str):
+    from openai_client import generate_responses_sync
+    return generate_responses_sync(prompt, param_sets, model=model)
+
+def _groq_generate(prompt: str, param_sets: List[Dict[str, Any]], model: str,
+                   on_delta: Optional[Callable[[int, str], None]] = None):
+    from groq_client import generate_responses_sync
+    return generate_responses_sync(prompt, param_sets, model=model, on_delta=on_delta)
+
+
+def _mock_generate(prompt: str, param_sets: List[Dict[str, Any]]):
+    out = []
+    for p in param_sets:
+        txt = f"[MOCK] temp={p.get('temperature')} top_p={p.get('top_p')}: {(p.get('prompt_override') or prompt)[:160]}"
+        for _ in range(int(p.get("n", 1) or 1)):
+            out.append({"param_set": p, "text": txt})
+    return out
+
+
+def normalize_provider(provider: Optional[str]) -> str:
+    return (provider or "gemini").lower().strip()
+
+def resolve_model(provider: str, model: Optional[str]) -> str:
+    # model may be None; avoid calling .lower() on None
+    return (model or "").lower().strip() or DEFAULT_MODEL_BY_PROVIDER.get(provider, "gpt-4o-mini")
+
+def is_quota_error(e: Exception) -> bool:
+    msg = str(e).lower()
+    return "insufficient_quota" in msg or "quota" in msg or "exceed" in msg
+
+def _cells(p: Dict[str, Any]) -> int:
+    return int(p.get("n", 1) or 1)
+
+def _use_cache(provider: str, use_cache: bool) -> bool:
+    # the mock provider is free, caching it would only hide changes to _mock_generate
+    return use_cache and response_cache.CACHE_ENABLED and provider != "mock"
+
+def _dispatch(provider: str, prompt: str, param_sets: List[Dict[str, Any]], model: str,
+              live: Optional[live_scoring.Limits] = None) -> List[Dict[str, Any]]:
+    if provider == "gemini":
+        return _gemini_generate(prompt, param_sets, model=model)
+    if provider == "openai":
+        return _openai_generate(prompt, param_sets, model=model)
+    if provider == "groq":
+        # only Groq streams, so only its cells can be cut short by live limits
+        guard = live_scoring.Guard(live, live_scoring.cell_prompts(prompt, param_sets)) if live else None
+        return _groq_generate(prompt, param_sets, model=model, on_delta=guard.hook() if guard else None)
+    return _mock_generate(prompt, param_sets)
+
+def _generate(provider: str, prompt: str, param_sets: List[Dict[str, Any]], model: str,
+              live: Optional[live_scoring.Limits] = None) -> List[Dict[str, Any]]:
+    cells = num_cells(param_sets)
+    telemetry.PROVIDER_CELLS.inc(cells, provider=provider, model=model)
+    # counts only: prompts and param sets can be large and are not worth a log line each
+    telemetry.sampled(log, logging.DEBUG, "generate provider=%s model=%s param_sets=%s cells=%s",
+                      provider, model, len(param_sets), cells)
+    with telemetry.span("provider_call", telemetry.PROVIDER_CALL_SECONDS, provider=provider, model=model):
+        return _dispatch(provider, prompt, param_sets, model, live)
+
+def _complete(results: List[Dict[str, Any]]) -> bool:
+    # a cell cut short by live limits is not what the param set produces: never cache it
+    return not any(r.get("stopped") for r in results)
+
+def generate(provider: str, prompt: str, param_sets: List[Dict[str, Any]], model: str,
+             use_cache: bool = True, live: Optional[live_scoring.Limits] = None) -> List[Dict[str, Any]]:
+    """
+    Generate one result per (param_set, n) cell, in order. Param sets already in the
+    response cache are served from it; only the misses reach the provider. With live
+    limits, streamed cells that trip one stop early and carry "stopped": reason.
+    """
+    if not _use_cache(provider, use_cache):
+        return _generate(provider, prompt, param_sets, model, live)
+    by_set, misses = response_cache.lookup(provider, model, prompt, param_sets)
+    fresh = _generate(provider, prompt, [param_sets[i] for i in misses], model, live) if misses else []
+    pos = 0
+    for i in misses:
+        n = _cells(param_sets[i])
+        by_set[i] = fresh[pos:pos + n]
+        pos += n
+        if _complete(by_set[i]):
+            response_cache.store(provider, model, prompt, param_sets[i], by_set[i])
+    return [r for i in range(len(param_sets)) for r in by_set[i]]
+
+def _iter_generate(
+    provider: str, prompt: str, param_sets: List[Dict[str, Any]], model: str,
+    on_delta: Optional[Callable[[int, str], None]] = None,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    telemetry.PROVIDER_CELLS.inc(num_cells(param_sets), provider=provider, model=model)
+    if provider == "gemini":
+        from gemini_client import iter_responses
+        yield from iter_responses(prompt, param_sets, model=model)
+    elif provider == "openai":
+        from openai_client import iter_responses
+        yield from iter_responses(prompt, param_sets, model=model)
+    elif provider == "groq":
+        from groq_client import iter_responses
+        yield from iter_responses(prompt, param_sets, model=model, on_delta=on_delta)
+    else:
+        yield from enumerate(_mock_generate(prompt, param_sets))
+
+def iter_generate(
+    provider: str, prompt: str, param_sets: List[Dict[str, Any]], model: str,
+    on_delta: Optional[Callable[[int, str], None]] = None, use_cache: bool = True,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yield (cell index, result) as each generation completes; cached cells come first.
+    Token deltas are only available from providers that stream (Groq); on_delta is
+    ignored elsewhere. on_delta may raise live_scoring.StopGeneration to cut a cell short.
+    """
+    if not _use_cache(provider, use_cache):
+        yield from _iter_generate(provider, prompt, param_sets, model, on_delta=on_delta)
+        return
+    offsets, pos = [], 0
+    for p in param_sets:
+        offsets.append(pos)
+        pos += _cells(p)
+    by_set, misses = response_cache.lookup(provider, model, prompt, param_sets)
+    for i, results in by_set.items():
+        for j, r in enumerate(results):
+            yield offsets[i] + j, r
+    # map the provider's local cell indices back onto the full sweep
+    local = [(i, offsets[i] + j) for i in misses for j in range(_cells(param_sets[i]))]
+    pending = {i: [] for i in misses}
+    cb = (lambda k, d: on_delta(local[k][1], d)) if on_delta else None
+    for k, r in _iter_generate(provider, prompt, [param_sets[i] for i in misses], model, on_delta=cb):
+        set_idx, cell_idx = local[k]
+        pending[set_idx].append((cell_idx, r))
+        if len(pending[set_idx]) == _cells(param_sets[set_idx]) and _complete([x for _, x in pending[set_idx]]):
+            response_cache.store(provider, model, prompt, param_sets[set_idx], [x for _, x in sorted(pending[set_idx], key=lambda t: t[0])])
+        yield cell_idx, r
+
+def num_cells(param_sets: List[Dict[str, Any]]) -> int:
+    """Number of responses a sweep produces (each param set yields n of them)."""
+    return sum(int(p.get("n", 1) or 1) for p in param_sets)
@@ -0,0 +1,215 @@
+# rate_limiter.py (shared RPM/TPM pacing per provider+model with adaptive 429 backoff)
+import os
+import re
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import telemetry
+
+DEFAULT_RPM = float(os.getenv("RATE_LIMIT_RPM", "300"))
+DEFAULT_TPM = float(os.getenv("RATE_LIMIT_TPM", "200000"))
+BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "5"))
+MAX_RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "6"))
+DEFAULT_RETRY_AFTER = float(os.getenv("RATE_LIMIT_DEFAULT_RETRY_AFTER", "2"))
+MIN_RATE_FRACTION = 0.05   # never pace below 5% of the configured rate
+INCREASE_FRACTION = 0.02   # additive increase per success, as a fraction of the configured rate
+
+
+def _configured(provider: str, kind: str, default: float) -> float:
+    raw = os.getenv(f"{provider.upper()}_{kind}")
+    try:
+        return float(raw) if raw else default
+    except ValueError:
+        return default
+
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.level = self.capacity
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.per_minute * BURST_SECONDS / 60.0)
+
+    def refill(self, elapsed: float) -> None:
+        self.level = min(self.capacity, self.level + elapsed * self.per_minute / 60.0)
+
+    def wait_for(self, amount: float) -> float:
+        # a request larger than the burst capacity only waits for a full bucket
+        need = min(amount, self.capacity)
+        return 0.0 if self.level >= need else (need - self.level) * 60.0 / self.per_minute
+
+
+class ProviderLimiter:
+    """
+    Token buckets for requests/min and tokens/min shared by every caller of one
+    provider+model. 429s halve the pace (and honour Retry-After for everyone);
+    successes creep it back up to the configured limits (AIMD).
+    """
+
+    def __init__(self, provider: str, model: str, rpm: float, tpm: float):
+        self.provider, self.model = provider, model
+        self.max_rpm, self.max_tpm = rpm, tpm
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self.rate_limited = 0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.requests.refill(now - self._last)
+        self.tokens.refill(now - self._last)
+        self._last = now
+
+    def acquire(self, est_tokens: float = 0.0) -> float:
+        """Block until both buckets allow one request of ~est_tokens; returns seconds waited."""
+        t0 = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            while True:
+                with self._lock:
+                    self._refill()
+                    wait = max(
+                        self.blocked_until - time.monotonic(),
+                        self.requests.wait_for(1.0),
+                        self.tokens.wait_for(est_tokens),
+                    )
+                    if wait <= 0:
+                        self.requests.level -= 1.0
+                        self.tokens.level -= min(est_tokens, self.tokens.capacity)
+                        return time.monotonic() - t0
+                time.sleep(min(wait, 1.0))
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def record_tokens(self, estimated: float, actual: float) -> None:
+        """Charge (or refund) the difference once the real token count is known."""
+        with self._lock:
+            self.tokens.level -= actual - min(estimated, self.tokens.capacity)
+        telemetry.PROVIDER_TOKENS.inc(actual, provider=self.provider, model=self.model)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.requests.per_minute = min(self.max_rpm, self.requests.per_minute + self.max_rpm * INCREASE_FRACTION)
+            self.tokens.per_minute = min(self.max_tpm, self.tokens.per_minute + self.max_tpm * INCREASE_FRACTION)
+
+    def on_rate_limited(self, retry_after: Optional[float]) -> None:
+        with self._lock:
+            self.rate_limited += 1
+            self.requests.per_minute = max(self.max_rpm * MIN_RATE_FRACTION, self.requests.per_minute / 2)
+            self.tokens.per_minute = max(self.max_tpm * MIN_RATE_FRACTION, self.tokens.per_minute / 2)
+            self.requests.level = min(self.requests.level, 0.0)
+            pause = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "provider": self.provider,
+                "model": self.model,
+                "queue_depth": self.waiting,
+                "rpm": round(self.requests.per_minute, 2),
+                "max_rpm": self.max_rpm,
+                "tpm": round(self.tokens.per_minute, 2),
+                "max_tpm": self.max_tpm,
+                "rate_limited": self.rate_limited,
+                "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 3),
+            }
+
+
+_limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+_lock = threading.Lock()
+
+
+def get(provider: str, model: str) -> ProviderLimiter:
+    key = (provider, model)
+    with _lock:
+        lim = _limiters.get(key)
+        if lim is None:
+            lim = ProviderLimiter(provider, model,
+                                  _configured(provider, "RPM", DEFAULT_RPM),
+                                  _configured(provider, "TPM", DEFAULT_TPM))
+            _limiters[key] = lim
+        return lim
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        lims = list(_limiters.values())
+    return {"limiters": [l.snapshot() for l in lims], "queue_depth": sum(l.waiting for l in lims)}
+
+
+def estimate_tokens(prompt: str, max_tokens: Any) -> float:
+    # ~4 characters per token for the prompt, plus the completion budget
+    return len(prompt) / 4.0 + float(max_tokens or 256)
+
+
+def is_rate_limited(e: Exception) -> bool:
+    """429-style throttling that pacing can fix (billing problems such as insufficient_quota are not)."""
+    msg = str(e).lower()
+    if "insufficient_quota" in msg:
+        return False
+    status = getattr(e, "status_code", None) or getattr(e, "code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return status == 429 or "rate limit" in msg or "rate_limit" in msg or "resource_exhausted" in msg or "429" in msg
+
+
+_RETRY_RE = re.compile(r"retry(?:ing)?[ _-]?(?:after|in|delay)?[\"':= ]+(\d+(?:\.\d+)?)\s*(ms|s)?", re.I)
+
+
+def retry_after_from(e: Exception) -> Optional[float]:
+    """Seconds from Retry-After / retry-after-ms headers, or a 'retry in Ns' hint in the message."""
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    m = _RETRY_RE.search(str(e))
+    if m:
+        v = float(m.group(1))
+        return v / 1000.0 if (m.group(2) or "").lower() == "ms" else v
+    return None
+
+
+def call(provider: str, model: str, fn: Callable[[], Any], est_tokens: float = 0.0,
+         tokens_used: Optional[Callable[[Any], Optional[float]]] = None) -> Any:
+    """
+    Run fn() paced by the shared limiter. Rate-limit errors feed back into the limiter
+    and the call is re-queued (up to RATE_LIMIT_MAX_RETRIES); other errors propagate.
+    tokens_used(result) may report the real token count to settle the TPM estimate.
+    """
+    lim = get(provider, model)
+    attempt = 0
+    while True:
+        waited = lim.acquire(est_tokens)
+        telemetry.RATE_LIMIT_WAIT_SECONDS.observe(waited, provider=provider, model=model)
+        try:
+            out = fn()
+        except Exception as e:
+            if not is_rate_limited(e) or attempt >= MAX_RATE_LIMIT_RETRIES:
+                raise
+            attempt += 1
+            telemetry.PROVIDER_RETRIES.inc(provider=provider, model=model, reason="rate_limit")
+            retry_after = retry_after_from(e)
+            logging.warning("%s/%s rate limited (attempt %s), retry_after=%s", provider, model, attempt, retry_after)
+            lim.on_rate_limited(retry_after)
+            continue
+        lim.on_success()
+        if tokens_used is not None:
+            try:
+                actual = tokens_used(out)
+            except Exception:
+                actual = None
+            if actual:
+                lim.record_tokens(est_tokens, float(actual))
+        return out
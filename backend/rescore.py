@@ -0,0 +1,160 @@
+# rescore.py (recompute metrics for every stored response, e.g. after changing weights)
+#
+#   python rescore.py --chunk-size 2000 --workers 8 --checkpoint rescore.ckpt
+#
+import os
+import json
+import time
+import argparse
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from metrics import score_batch, resolve
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("RESCORE_CHUNK_SIZE", "1000"))
+DEFAULT_WORKERS = int(os.getenv("RESCORE_WORKERS", str(os.cpu_count() or 2)))
+DEFAULT_CHECKPOINT = os.getenv("RESCORE_CHECKPOINT", "rescore.ckpt")
+
+# progress of the run started from the API (one at a time per process)
+_state: Dict[str, Any] = {"running": False}
+_state_lock = threading.Lock()
+
+
+def _metric_names(stored: Dict[str, Any]) -> Optional[tuple]:
+    """
+    Metrics to rescore a row with: the ones it was scored with (experiments may use a subset).
+    None = all, for rows never scored; stored keys no longer registered are left as they are.
+    """
+    if not stored:
+        return None
+    known = set(resolve())
+    return tuple(resolve([k for k in stored if k in known]))
+
+
+def _score_chunk(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Runs in a worker process: score a chunk, one batch per distinct (prompt, metric set)."""
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for it in items:
+        # multi-prompt experiments score each response against the prompt it answered
+        prompt = (it.get("param_set") or {}).get("prompt_override") or it["prompt"]
+        groups.setdefault((prompt, _metric_names(it.get("metrics") or {})), []).append(it)
+    out = []
+    for (prompt, names), group in groups.items():
+        for it, m in zip(group, score_batch(prompt, [g.get("text") or "" for g in group], names)):
+            out.append({"response_id": it["response_id"], "experiment_id": it["experiment_id"],
+                        "metrics": {**(it.get("metrics") or {}), **m}})
+    return out
+
+
+def _load_checkpoint(path: str) -> Dict[str, Any]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_checkpoint(path: str, data: Dict[str, Any]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def rescore_all(chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = DEFAULT_WORKERS,
+                checkpoint: Optional[str] = DEFAULT_CHECKPOINT, restart: bool = False,
+                progress: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Stream responses out of storage in keyset-ordered chunks, score them on a process
+    pool and write them back with bulk updates. Only a bounded window of chunks is in
+    flight, and results are written in chunk order so the checkpoint (last written id)
+    is always safe to resume from. The checkpoint also lists the experiments written so
+    far, so a resumed run still rebuilds the aggregates of those rescored before the crash.
+    """
+    from storage import init_storage, iter_response_chunks, get_prompts, update_metrics_bulk, rebuild_aggregates
+    init_storage()
+
+    state = {} if restart or not checkpoint else _load_checkpoint(checkpoint)
+    after_id = state.get("after_id")
+    done = int(state.get("done", 0))
+    touched = set(state.get("experiments", []))
+    progress = progress if progress is not None else {}
+    progress.update({"done": done, "after_id": after_id})
+    prompts: Dict[str, str] = {}
+    t0 = time.time()
+
+    def _flush(fut, last_id):
+        nonlocal done
+        updates = fut.result()
+        update_metrics_bulk(updates)
+        done += len(updates)
+        touched.update(u["experiment_id"] for u in updates)
+        if checkpoint:
+            _save_checkpoint(checkpoint, {"after_id": last_id, "done": done, "experiments": sorted(touched)})
+        progress.update({"done": done, "after_id": last_id})
+
+    window: deque = deque()
+    # spawn, not fork: /admin/rescore runs this inside the threaded server, and a forked child
+    # would inherit locks other threads held at fork time
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn")) as pool:
+        for chunk in iter_response_chunks(after_id, chunk_size):
+            missing = list({r["experiment_id"] for r in chunk if r["experiment_id"] not in prompts})
+            if missing:
+                prompts.update(get_prompts(missing))
+            items = [{**r, "prompt": prompts.get(r["experiment_id"], "")} for r in chunk]
+            window.append((pool.submit(_score_chunk, items), chunk[-1]["response_id"]))
+            # keep memory flat: at most 2 chunks per worker queued or in flight
+            while len(window) >= 2 * max(1, workers):
+                _flush(*window.popleft())
+        while window:
+            _flush(*window.popleft())
+
+    # metrics changed underneath the running aggregates; recompute them for what was touched
+    for exp_id in sorted(touched):
+        rebuild_aggregates(exp_id)
+
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return {"rescored": done, "seconds": round(time.time() - t0, 2)}
+
+
+def start_background(chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = DEFAULT_WORKERS, restart: bool = False) -> bool:
+    """Kick off rescore_all on a thread for the API; False if one is already running."""
+    with _state_lock:
+        if _state.get("running"):
+            return False
+        _state.clear()
+        _state.update({"running": True, "started_at": time.time(), "error": None})
+
+    def _run():
+        try:
+            _state.update(rescore_all(chunk_size, workers, DEFAULT_CHECKPOINT, restart, progress=_state))
+        except Exception as e:
+            logging.exception("Rescore failed: %s", e)
+            _state["error"] = str(e)
+        finally:
+            _state["running"] = False
+
+    threading.Thread(target=_run, name="rescore", daemon=True).start()
+    return True
+
+
+def status() -> Dict[str, Any]:
+    return dict(_state)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Recompute metrics for all stored responses.")
+    ap.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    ap.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    ap.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = ap.parse_args()
+    print(rescore_all(args.chunk_size, args.workers, args.checkpoint, args.restart))
@@ -0,0 +1,163 @@
+# response_cache.py (content-addressed cache in front of the provider adapters)
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))          # in-process LRU entries
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))          # seconds, 0 = never expire
+CACHE_DB = os.getenv("RESPONSE_CACHE_DB", "")                        # path enables the SQLite tier
+CACHE_DB_MAX_ROWS = int(os.getenv("RESPONSE_CACHE_DB_MAX_ROWS", "100000"))
+
+
+def _norm_value(v: Any) -> Any:
+    if isinstance(v, float):
+        return round(v, 6)
+    return v
+
+
+def cache_key(provider: str, model: str, prompt: str, param_set: Dict[str, Any]) -> str:
+    """sha256 over the normalized request: what the provider actually sees for one param set."""
+    params = {k: _norm_value(v) for k, v in sorted(param_set.items()) if v is not None and k != "prompt_override"}
+    payload = {
+        "provider": (provider or "").lower().strip(),
+        "model": (model or "").lower().strip(),
+        "prompt": param_set.get("prompt_override") or prompt,
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache: an in-process LRU (OrderedDict) and an optional SQLite file.
+    Values are the list of texts produced for one param set (n of them).
+    """
+
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 db_path: str = CACHE_DB, db_max_rows: int = CACHE_DB_MAX_ROWS):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.db_max_rows = db_max_rows
+        self._mem: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_created ON response_cache(created_at)")
+            self._db.commit()
+        # rows in the SQLite tier, kept up to date on every write so the size cap never needs a scan
+        self._db_rows = self._db.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] if self._db else 0
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def _put_mem(self, key: str, value: List[str], created_at: float) -> None:
+        self._mem[key] = (value, created_at)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit and not self._expired(hit[1]):
+                self._mem.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["memory_hits"] += 1
+                return hit[0]
+            if hit:
+                del self._mem[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created_at FROM response_cache WHERE key = ?", (key,)).fetchone()
+                if row and not self._expired(row[1]):
+                    value = json.loads(row[0])
+                    self._put_mem(key, value, row[1])
+                    self._stats["hits"] += 1
+                    self._stats["disk_hits"] += 1
+                    return value
+                if row:
+                    self._db.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._db_rows -= 1
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: List[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._put_mem(key, value, now)
+            self._stats["stores"] += 1
+            if self._db is not None:
+                exists = self._db.execute("SELECT 1 FROM response_cache WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO response_cache(key, value, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now),
+                )
+                self._db_rows += 0 if exists else 1
+                # anything past TTL, then only the oldest rows over the cap: both are range scans
+                # from the old end of the created_at index, not a walk over the whole table
+                if self.ttl > 0:
+                    self._db_rows -= self._db.execute("DELETE FROM response_cache WHERE created_at < ?",
+                                                      (now - self.ttl,)).rowcount
+                excess = self._db_rows - self.db_max_rows
+                if excess > 0:
+                    self._db_rows -= self._db.execute(
+                        "DELETE FROM response_cache WHERE key IN (SELECT key FROM response_cache "
+                        "ORDER BY created_at LIMIT ?)", (excess,),
+                    ).rowcount
+                self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM response_cache")
+                self._db.commit()
+                self._db_rows = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            lookups = out["hits"] + out["misses"]
+            out["hit_rate"] = round(out["hits"] / lookups, 4) if lookups else 0.0
+            out["memory_entries"] = len(self._mem)
+            out["max_entries"] = self.max_entries
+            out["ttl"] = self.ttl
+            if self._db is not None:
+                out["disk_entries"] = self._db_rows
+            return out
+
+
+cache = ResponseCache()
+
+
+def lookup(provider: str, model: str, prompt: str, param_sets: List[Dict[str, Any]]):
+    """Split param sets into cached results (by param-set index) and the ones still to generate."""
+    hits: Dict[int, List[Dict[str, Any]]] = {}
+    misses: List[int] = []
+    for i, p in enumerate(param_sets):
+        texts = cache.get(cache_key(provider, model, prompt, p))
+        if texts is not None and len(texts) == int(p.get("n", 1) or 1):
+            hits[i] = [{"param_set": p, "text": t, "cached": True} for t in texts]
+        else:
+            misses.append(i)
+    return hits, misses
+
+
+def store(provider: str, model: str, prompt: str, p: Dict[str, Any], results: List[Dict[str, Any]]) -> None:
+    """Cache the n results of one param set unless any of them failed or came back empty."""
+    if not results or any(r.get("error") or not r.get("text") for r in results):
+        return
+    cache.put(cache_key(provider, model, prompt, p), [r["text"] for r in results])
@@ -0,0 +1,265 @@
+# similarity.py (hashed TF-IDF vectors per response: prompt similarity, diversity, near-duplicate clusters)
+#
+# Vectors are signed feature hashes of unigrams + bigrams (sublinear tf, L2-normalized), so they
+# need no vocabulary or model on disk and are stable across processes. They are cached per response
+# as sparse float32 (see storage.get_vectors / put_vectors); IDF is applied per experiment at query
+# time. Diversity uses |sum v|^2 instead of the n x n matrix; clustering walks it in row blocks.
+import os
+import re
+import zlib
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+import aggregates
+import storage
+
+SIM_DIM = int(os.getenv("SIM_DIM", "1024"))
+SIM_DUP_THRESHOLD = float(os.getenv("SIM_DUP_THRESHOLD", "0.9"))
+SIM_CACHE_VECTORS = os.getenv("SIM_CACHE_VECTORS", "1").lower() not in ("0", "false", "no")
+SIM_MAX_RESPONSES = int(os.getenv("SIM_MAX_RESPONSES", "20000"))
+SIM_BLOCK_ROWS = int(os.getenv("SIM_BLOCK_ROWS", "1024"))
+SIM_MAX_CLUSTERS = 50  # largest clusters listed; the counts cover all of them
+SIM_CLUSTER_IDS = 50  # response ids listed per cluster; size is always exact
+_VECTOR_CHUNK = 1000  # texts hashed per bincount
+
+if not 0 < SIM_DIM <= 65536:
+    raise ValueError("SIM_DIM must be in 1..65536 (indices are stored as uint16)")
+
+_TOKEN_RE = re.compile(r"[A-Za-z']+")  # same tokens as metrics._tokenize
+
+
+def _features(text: str) -> List[str]:
+    toks = _TOKEN_RE.findall(text.lower())
+    return toks + [a + " " + b for a, b in zip(toks, toks[1:])]
+
+
+def vectorize(texts: List[str], dim: int = SIM_DIM) -> np.ndarray:
+    """(len(texts), dim) float32, rows L2-normalized (all-zero for texts without tokens)."""
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for start in range(0, len(texts), _VECTOR_CHUNK):
+        feats = [_features(t or "") for t in texts[start:start + _VECTOR_CHUNK]]
+        # crc32, not hash(): str hashes are salted per process and the vectors are stored
+        hashes = {f: zlib.crc32(f.encode("utf-8")) for fs in feats for f in fs}
+        h = np.fromiter((hashes[f] for fs in feats for f in fs), dtype=np.int64, count=sum(map(len, feats)))
+        doc = np.repeat(np.arange(len(feats), dtype=np.int64), [len(fs) for fs in feats])
+        sign = np.where(h & 0x80000000, -1.0, 1.0)  # signed hashing: collisions cancel instead of piling up
+        counts = np.bincount(doc * dim + h % dim, weights=sign, minlength=len(feats) * dim).reshape(len(feats), dim)
+        tf = np.sign(counts) * np.log1p(np.abs(counts))
+        out[start:start + len(feats)] = _normalize(tf)
+    return out
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return (x / np.where(norms > 0, norms, 1.0)).astype(np.float32)
+
+
+def encode(vec: np.ndarray) -> bytes:
+    """Sparse form: uint16 indices then float32 values, little-endian."""
+    nz = np.flatnonzero(vec)
+    return nz.astype("<u2").tobytes() + vec[nz].astype("<f4").tobytes()
+
+
+def decode(blob: bytes, dim: int = SIM_DIM) -> np.ndarray:
+    k = len(blob) // 6
+    vec = np.zeros(dim, dtype=np.float32)
+    vec[np.frombuffer(blob, dtype="<u2", count=k)] = np.frombuffer(blob, dtype="<f4", count=k, offset=2 * k)
+    return vec
+
+
+def experiment_matrix(exp_id: str, page_size: int = 1000) -> Tuple[List[str], List[Dict[str, Any]], np.ndarray]:
+    """Response ids, param sets and the vector matrix of an experiment; missing vectors are computed and cached."""
+    ids: List[str] = []
+    params: List[Dict[str, Any]] = []
+    for r in storage.iter_experiment_responses(exp_id, page_size, fields=("param_set",)):
+        ids.append(r["response_id"])
+        params.append(r.get("param_set") or {})
+    if len(ids) > SIM_MAX_RESPONSES:
+        raise ValueError(f"experiment has {len(ids)} responses, similarity is limited to SIM_MAX_RESPONSES={SIM_MAX_RESPONSES}")
+    cached = storage.get_vectors(exp_id) if SIM_CACHE_VECTORS else {}
+    X = np.zeros((len(ids), SIM_DIM), dtype=np.float32)
+    missing: Dict[str, int] = {}
+    for i, rid in enumerate(ids):
+        hit = cached.get(rid)
+        if hit and hit[0] == SIM_DIM:
+            X[i] = decode(hit[1])
+        else:
+            missing[rid] = i
+    if missing:
+        fresh: Dict[str, bytes] = {}
+        pending: List[Tuple[str, str]] = []
+
+        def _flush():
+            V = vectorize([t for _, t in pending])
+            for (rid, _), v in zip(pending, V):
+                X[missing[rid]] = v
+                fresh[rid] = encode(v)
+            pending.clear()
+
+        for r in storage.iter_experiment_responses(exp_id, page_size, fields=("text",)):
+            if r["response_id"] in missing:
+                pending.append((r["response_id"], r.get("text", "")))
+                if len(pending) >= _VECTOR_CHUNK:
+                    _flush()
+        if pending:
+            _flush()
+        if SIM_CACHE_VECTORS:
+            storage.put_vectors(exp_id, SIM_DIM, fresh)
+    return ids, params, X
+
+
+def idf_weights(X: np.ndarray) -> np.ndarray:
+    """Smoothed idf over the rows of X (document frequency of each hashed feature)."""
+    df = np.count_nonzero(X, axis=0)
+    return (np.log((1.0 + len(X)) / (1.0 + df)) + 1.0).astype(np.float32)
+
+
+def mean_similarity(X: np.ndarray) -> Optional[float]:
+    """Mean cosine similarity over all pairs i != j, in O(n * dim): sum_{i != j} x_i.x_j = |sum x|^2 - sum |x_i|^2."""
+    n = len(X)
+    if n < 2:
+        return None
+    s = X.sum(axis=0, dtype=np.float64)
+    pair_sum = float(s @ s) - float(np.einsum("ij,ij->", X, X, dtype=np.float64))
+    return pair_sum / (n * (n - 1))
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _neighbors_and_components(U: np.ndarray, threshold: float, block: int) -> Tuple[np.ndarray, np.ndarray, List[int]]:
+    """Nearest other row (index, similarity) of each row of U and union-find parents of rows linked at >= threshold."""
+    m = len(U)
+    nn_idx = np.full(m, -1, dtype=np.int64)
+    nn_sim = np.full(m, np.nan, dtype=np.float32)
+    parent = list(range(m))
+    for start in range(0, m, block):
+        S = U[start:start + block] @ U.T
+        rows = np.arange(len(S))
+        S[rows, start + rows] = -np.inf
+        if m > 1:
+            best = S.argmax(axis=1)
+            nn_idx[start:start + len(S)] = best
+            nn_sim[start:start + len(S)] = S[rows, best]
+        i, j = np.nonzero(S >= threshold)
+        i += start
+        for a, b in zip(i[j > i].tolist(), j[j > i].tolist()):
+            ra, rb = _find(parent, a), _find(parent, b)
+            if ra != rb:
+                parent[rb] = ra
+    return nn_idx, nn_sim, parent
+
+
+def _stats(values: np.ndarray) -> Dict[str, Any]:
+    if not len(values):
+        return {"mean": None, "min": None, "max": None}
+    return {"mean": round(float(values.mean()), 4), "min": round(float(values.min()), 4), "max": round(float(values.max()), 4)}
+
+
+def _round(v: Optional[float]) -> Optional[float]:
+    return None if v is None else round(v, 4)
+
+
+def _diversity(sim: Optional[float]) -> Optional[float]:
+    # float error can put the mean similarity a hair past 0 or 1; clamping also avoids a -0.0
+    return None if sim is None else round(max(0.0, min(1.0, 1.0 - sim)), 4)
+
+
+def experiment_similarity(exp_id: str, threshold: float = SIM_DUP_THRESHOLD, idf: bool = True, cells: bool = True,
+                          neighbors: bool = False) -> Dict[str, Any]:
+    """
+    Prompt similarity, pairwise diversity (overall and per param cell) and near-duplicate
+    clusters of one experiment; neighbors adds each response's nearest other response.
+    """
+    meta = storage.get_experiment_meta(exp_id)
+    if not meta:
+        return {}
+    ids, params, X = experiment_matrix(exp_id)
+    n = len(ids)
+
+    # cells with a prompt_override are compared with their own prompt, as in scoring
+    prompts = [p.get("prompt_override") or meta["prompt"] for p in params]
+    prompt_pos = {p: i for i, p in enumerate(dict.fromkeys(prompts))}
+    P = vectorize(list(prompt_pos))
+    if idf and n:
+        w = idf_weights(X)
+        X, P = _normalize(X * w), _normalize(P * w)
+    prompt_sim = np.einsum("ij,ij->i", X, P[[prompt_pos[p] for p in prompts]]) if n else np.zeros(0, dtype=np.float32)
+
+    mean_sim = mean_similarity(X)
+    out: Dict[str, Any] = {
+        "experiment_id": exp_id,
+        "count": n,
+        "dim": SIM_DIM,
+        "idf": idf,
+        "mean_similarity": _round(mean_sim),
+        "diversity": _diversity(mean_sim),
+        "prompt_similarity": _stats(prompt_sim),
+    }
+
+    if cells:
+        groups: Dict[str, List[int]] = {}
+        for i, p in enumerate(params):
+            groups.setdefault(aggregates.cell_key(p), []).append(i)
+        cell_rows = []
+        for key, idx in groups.items():
+            sim = mean_similarity(X[idx])
+            cell_rows.append({"cell": key, "param_set": params[idx[0]], "count": len(idx),
+                              "mean_similarity": _round(sim), "diversity": _diversity(sim),
+                              "prompt_similarity": _round(float(prompt_sim[idx].mean()))})
+        out["cells"] = cell_rows
+
+    # identical vectors (e.g. cached or degenerate outputs) collapse to one row before the pairwise pass
+    if n:
+        U, inv = np.unique(X, axis=0, return_inverse=True)
+        inv = inv.reshape(-1)
+    else:
+        U, inv = X, np.zeros(0, dtype=np.int64)
+    nn_idx, nn_sim, parent = _neighbors_and_components(U, threshold, max(1, SIM_BLOCK_ROWS))
+    empty = ~X.any(axis=1)  # no tokens: nothing to compare, never a duplicate
+
+    members: Dict[int, List[int]] = {}
+    for i, g in enumerate(inv.tolist()):
+        if not empty[i]:
+            members.setdefault(_find(parent, g), []).append(i)
+    clusters = []
+    for idx in members.values():
+        if len(idx) < 2:
+            continue
+        sim = mean_similarity(X[idx])
+        clusters.append({"size": len(idx), "mean_similarity": _round(sim),
+                         "response_ids": [ids[i] for i in idx[:SIM_CLUSTER_IDS]]})
+    clusters.sort(key=lambda c: -c["size"])
+    out["near_duplicates"] = {
+        "threshold": threshold,
+        "clusters": len(clusters),
+        # responses beyond the first of each cluster
+        "redundant": sum(c["size"] - 1 for c in clusters),
+        "redundant_share": round(sum(c["size"] - 1 for c in clusters) / n, 4) if n else 0.0,
+        "top": clusters[:SIM_MAX_CLUSTERS],
+    }
+
+    if neighbors:
+        by_group: Dict[int, List[int]] = {}
+        for i, g in enumerate(inv.tolist()):
+            by_group.setdefault(g, []).append(i)
+        rows = []
+        for i, g in enumerate(inv.tolist()):
+            same = by_group[g]
+            if empty[i]:
+                j, sim = None, None
+            elif len(same) > 1:
+                j, sim = (same[1] if same[0] == i else same[0]), 1.0
+            elif nn_idx[g] >= 0:
+                j, sim = by_group[int(nn_idx[g])][0], float(nn_sim[g])
+            else:
+                j, sim = None, None
+            rows.append({"response_id": ids[i], "prompt_similarity": round(float(prompt_sim[i]), 4),
+                         "nearest_id": ids[j] if j is not None else None, "nearest_similarity": _round(sim)})
+        out["responses"] = rows
+    return out
@@ -1,38 +1,471 @@
 # storage.py
 import os
+import re
 import uuid
-from typing import List, Dict, Any, Optional
+import time
+import base64
+import datetime
+import logging
+import functools
+import threading
+import sqlite3
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+import aggregates
+import exp_cache
+import telemetry
+import textcodec
 
 DB_KIND = os.getenv("DB_KIND", "sql").lower()  # 'sql' or 'mongo'
+INSERT_BATCH_SIZE = int(os.getenv("INSERT_BATCH_SIZE", "1000"))
+# full-text index over response texts (SQLite FTS5 / Postgres tsvector / Mongo text index) for GET /search
+SEARCH_INDEX = os.getenv("SEARCH_INDEX", "1").lower() not in ("0", "false", "no")
+SEARCH_LANGUAGE = re.sub(r"[^a-z_]", "", os.getenv("SEARCH_LANGUAGE", "english").lower()) or "english"
+
+# connection pool sizing (SQL engine pool / Mongo client pool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no")
+
+
+class _PoolWaits:
+    """Checkout counters and time spent waiting for a pooled connection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += int(timed_out)
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": round(1000 * self.wait_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(1000 * self.wait_max, 3),
+            }
+
+
+_pool_waits = _PoolWaits()
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+def encode_cursor(created_at: datetime.datetime, exp_id: str) -> str:
+    """Opaque keyset cursor for GET /experiments: position after (created_at, id)."""
+    raw = f"{created_at.isoformat()}|{exp_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, str]:
+    try:
+        ts, exp_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.datetime.fromisoformat(ts), exp_id
+    except Exception:
+        raise ValueError("invalid cursor")
+
+# typed metric columns; mirrors metrics.METRIC_KEYS (anything else stays in the metrics JSON)
+TYPED_METRICS = [
+    "lexical_diversity",
+    "repetition",
+    "length_ok",
+    "structure",
+    "keyword_coverage",
+    "readability",
+    "clarity_score",
+    "aggregate_score",
+]
+RESPONSE_FIELDS = ("param_set", "text", "metrics")
+
+_codec = textcodec.Codec()
+
+
+def parse_fields(fields: Any) -> Tuple[str, ...]:
+    """fields= projection for responses: "param_set,metrics" or a list; None means everything."""
+    if not fields:
+        return RESPONSE_FIELDS
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    picked = tuple(f.strip() for f in fields if f.strip())
+    unknown = [f for f in picked if f not in RESPONSE_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)} (allowed: {', '.join(RESPONSE_FIELDS)})")
+    return picked
+
+
+_FILTER_RE = re.compile(r"^\s*([a-z_]+)\s*(>=|<=|>|<|=)\s*(-?(?:\d+\.?\d*|\.\d+))\s*$")
+
+
+def parse_metric_filters(specs: Optional[List[str]]) -> List[Tuple[str, str, float]]:
+    """["repetition>0.3", "aggregate_score<=0.8"] -> [(metric, op, value)]; only typed (indexed) metrics."""
+    out = []
+    for spec in specs or []:
+        m = _FILTER_RE.match(spec)
+        if not m:
+            raise ValueError(f"bad metric filter {spec!r} (expected e.g. repetition>0.3)")
+        if m.group(1) not in TYPED_METRICS:
+            raise ValueError(f"metric {m.group(1)!r} is not filterable (allowed: {', '.join(TYPED_METRICS)})")
+        out.append((m.group(1), m.group(2), float(m.group(3))))
+    return out
+
+
+def encode_search_cursor(response_id: str) -> str:
+    return base64.urlsafe_b64encode(response_id.encode("utf-8")).decode("ascii")
+
+
+def decode_search_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def _split_metrics(metrics: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    extra = dict(metrics or {})
+    typed = {f"metric_{k}": extra.pop(k, None) for k in TYPED_METRICS}
+    return typed, extra
+
+
+def _join_metrics(typed: Dict[str, Any], extra: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    # legacy rows have every metric in the JSON and NULL typed columns
+    out = {k: typed[f"metric_{k}"] for k in TYPED_METRICS if typed.get(f"metric_{k}") is not None}
+    for k, v in (extra or {}).items():
+        out.setdefault(k, v)
+    return out
+
+
+def _encode_text(text: str) -> Dict[str, Any]:
+    if not textcodec.enabled():
+        return {"text": text, "text_z": None, "zdict_id": None}
+    blob, dict_id = _codec.encode(text)
+    return {"text": "", "text_z": blob, "zdict_id": dict_id}
 
 # ---------------- SQL (SQLite/MySQL/Postgres) ----------------
 if DB_KIND == "sql":
     from sqlmodel import SQLModel, Field, Session, create_engine, select
-    from sqlalchemy import Column, JSON as SA_JSON
+    from sqlalchemy import Column, BigInteger, DateTime, LargeBinary, JSON as SA_JSON, update, insert, delete, inspect, text as sa_text, or_, and_, event
+    from sqlalchemy import select as sa_select, literal_column
+    from sqlalchemy import MetaData, Table, Integer, String, Text, Index
+    from sqlalchemy.pool import QueuePool
+    from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./llmlab.db")
-    connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-    engine = create_engine(DATABASE_URL, echo=False, connect_args=connect_args)
+    IS_SQLITE = DATABASE_URL.startswith("sqlite")
+    SQLITE_WAL = os.getenv("SQLITE_WAL", "1").lower() not in ("0", "false", "no")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    connect_args = {"check_same_thread": False} if IS_SQLITE else {}
+
+    class _TimedQueuePool(QueuePool):
+        """QueuePool that records how long each checkout waited for a free connection."""
+
+        def _do_get(self):
+            t0 = time.perf_counter()
+            try:
+                conn = super()._do_get()
+            except PoolTimeoutError:
+                _pool_waits.record(time.perf_counter() - t0, timed_out=True)
+                raise
+            _pool_waits.record(time.perf_counter() - t0)
+            return conn
+
+    _in_memory = IS_SQLITE and (":memory:" in DATABASE_URL or DATABASE_URL in ("sqlite://", "sqlite:///"))
+    pool_args: Dict[str, Any] = {} if _in_memory else {
+        "poolclass": _TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    engine = create_engine(DATABASE_URL, echo=False, connect_args=connect_args,
+                           pool_pre_ping=DB_POOL_PRE_PING, **pool_args)
+
+    if IS_SQLITE:
+        @event.listens_for(engine, "connect")
+        def _sqlite_pragmas(dbapi_conn, _record):
+            # WAL lets readers proceed while a writer commits; NORMAL is durable enough under WAL
+            cur = dbapi_conn.cursor()
+            if SQLITE_WAL and not _in_memory:
+                cur.execute("PRAGMA journal_mode=WAL")
+                cur.execute("PRAGMA synchronous=NORMAL")
+            cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cur.close()
 
     class Experiment(SQLModel, table=True):
         id: str = Field(primary_key=True)
         title: Optional[str] = None
         prompt: str
-        model: str
+        model: str = Field(index=True)
+        created_at: datetime.datetime = Field(default_factory=_utcnow, sa_column=Column(DateTime, index=True))
 
     class ResponseRecord(SQLModel, table=True):
+        # per-experiment reads (GET, exports, similarity) filter on experiment_id and keyset on (seq, id)
+        __table_args__ = (Index("ix_responserecord_experiment_seq", "experiment_id", "seq", "id"),)
         id: str = Field(primary_key=True)
-        experiment_id: str = Field(index=True)
+        experiment_id: str
+        seq: Optional[int] = Field(default=None, sa_column=Column(BigInteger))  # insertion order, see _Sequence
         param_set: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(SA_JSON))
-        text: str
-        metrics: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(SA_JSON))
+        text: str  # inline text of legacy / uncompressed rows; "" when text_z is set
+        text_z: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))
+        zdict_id: Optional[int] = None  # TextDictionary used for text_z (0 = none)
+        metric_lexical_diversity: Optional[float] = Field(default=None, index=True)
+        metric_repetition: Optional[float] = Field(default=None, index=True)
+        metric_length_ok: Optional[float] = Field(default=None, index=True)
+        metric_structure: Optional[float] = Field(default=None, index=True)
+        metric_keyword_coverage: Optional[float] = Field(default=None, index=True)
+        metric_readability: Optional[float] = Field(default=None, index=True)
+        metric_clarity_score: Optional[float] = Field(default=None, index=True)
+        metric_aggregate_score: Optional[float] = Field(default=None, index=True)
+        metrics: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(SA_JSON))  # non-typed metrics only
+
+    class TextDictionary(SQLModel, table=True):
+        """zlib preset dictionaries trained from this store's texts; rows keep the id they were written with."""
+        id: Optional[int] = Field(default=None, primary_key=True)
+        data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+        created_at: datetime.datetime = Field(default_factory=_utcnow, sa_column=Column(DateTime))
+
+    class ResponseVector(SQLModel, table=True):
+        """Cached similarity vector of one response (see similarity.py); recomputed when dim changes."""
+        response_id: str = Field(primary_key=True)
+        experiment_id: str = Field(index=True)
+        dim: int
+        vec: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+    class ExperimentJob(SQLModel, table=True):
+        experiment_id: str = Field(primary_key=True)
+        provider: str
+        model: str
+        prompt: str
+        param_sets: List[Dict[str, Any]] = Field(default_factory=list, sa_column=Column(SA_JSON))
+        status: str = Field(default="queued", index=True)  # queued | running | done | failed
+        total: int = 0
+        done: int = 0
+        error: Optional[str] = None
+        use_cache: bool = True
+        mode: Optional[str] = "job"  # job | batch
+        batch_id: Optional[str] = None  # provider batch id once a batch job is submitted
+        batch_indices: Optional[List[int]] = Field(default=None, sa_column=Column(SA_JSON))  # param sets in that batch
+        grid: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(SA_JSON))  # compact spec, see grid.py
+        adaptive: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(SA_JSON))  # search settings, see adaptive.py
+        result: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(SA_JSON))  # e.g. best params of an adaptive search
+        metrics: Optional[List[str]] = Field(default=None, sa_column=Column(SA_JSON))  # metric subset, None = all
+        live: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(SA_JSON))  # live_scoring limits
+
+    class MetricAggregate(SQLModel, table=True):
+        """Running stats of one metric for one experiment (cell "*") or one param cell, see aggregates.py."""
+        experiment_id: str = Field(primary_key=True)
+        cell: str = Field(primary_key=True)
+        metric: str = Field(primary_key=True)
+        param_set: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(SA_JSON))
+        count: int = 0
+        sum: float = 0.0
+        sumsq: float = 0.0
+        min: Optional[float] = None
+        max: Optional[float] = None
+        hist: List[int] = Field(default_factory=list, sa_column=Column(SA_JSON))
+
+    # rows that predate created_at sort as the oldest experiments
+    _LEGACY_CREATED_AT = datetime.datetime(1970, 1, 1)
+
+    class _Sequence:
+        """
+        Strictly increasing row numbers: microseconds since the epoch, bumped past the last
+        value handed out. Ids are random uuids, so responses are read back in (seq, id) order
+        to get the order they were written in.
+        """
+
+        def __init__(self):
+            self._last = 0
+            self._lock = threading.Lock()
+
+        def take(self, n: int) -> int:
+            """First of n consecutive values reserved for one insert."""
+            with self._lock:
+                first = max(time.time_ns() // 1000, self._last + 1)
+                self._last = first + n - 1
+                return first
+
+    _seq = _Sequence()
+
+    def _add_missing_columns():
+        """
+        create_all only creates missing tables, so columns added to existing models
+        (e.g. experiment.created_at) are added here with ALTER TABLE, plus any missing indexes.
+        """
+        insp = inspect(engine)
+        added_seq = False
+        with engine.begin() as conn:
+            for table in SQLModel.metadata.sorted_tables:
+                if not insp.has_table(table.name):
+                    continue
+                existing = {c["name"] for c in insp.get_columns(table.name)}
+                added = [col for col in table.columns if col.name not in existing]
+                for col in added:
+                    ddl = col.type.compile(dialect=engine.dialect)
+                    conn.execute(sa_text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {ddl}"))
+                    added_seq = added_seq or col is ResponseRecord.__table__.c.seq
+                for idx in table.indexes:
+                    idx.create(conn, checkfirst=True)
+            conn.execute(update(Experiment).where(Experiment.created_at.is_(None)).values(created_at=_LEGACY_CREATED_AT))
+            if added_seq:
+                # older rows keep their relative order on SQLite (rowid) and sort before every new row
+                conn.execute(update(ResponseRecord).where(ResponseRecord.seq.is_(None))
+                             .values(seq=literal_column("rowid") if IS_SQLITE else 0))
+
+    # search index tables are dialect-specific, so they live outside SQLModel.metadata and are created by hand
+    IS_POSTGRES = engine.dialect.name == "postgresql"
+    _search_md = MetaData()
+    # the FTS5 table is contentless (it keeps only the index, the text stays compressed on the response row);
+    # response_fts_map gives every indexed response an FTS rowid. AUTOINCREMENT so a rowid is never reused
+    response_fts = Table("response_fts", _search_md, Column("rowid", Integer), Column("text", Text))
+    response_fts_map = Table("response_fts_map", _search_md, Column("fts_rowid", Integer, primary_key=True),
+                             Column("response_id", String))
+    response_search = Table("response_search", _search_md, Column("response_id", String, primary_key=True), Column("tsv", Text))
+    # contentless_delete (SQLite 3.43+) lets index entries be deleted by rowid; without it the entries of deleted
+    # responses stay in the index, unreachable through the map, until reindex_search rebuilds it
+    _FTS_DELETE = sqlite3.sqlite_version_info >= (3, 43, 0)
+    if IS_SQLITE:
+        _SEARCH_INSERTS = [
+            sa_text("INSERT INTO response_fts_map (response_id) VALUES (:response_id)"),
+            sa_text("INSERT INTO response_fts (rowid, text) "
+                    "SELECT fts_rowid, :text FROM response_fts_map WHERE response_id = :response_id"),
+        ]
+    else:
+        _SEARCH_INSERTS = [sa_text(f"INSERT INTO response_search (response_id, tsv) "
+                                   f"VALUES (:response_id, to_tsvector('{SEARCH_LANGUAGE}', CAST(:text AS text)))")]
+
+    def search_supported() -> bool:
+        return SEARCH_INDEX and (IS_SQLITE or IS_POSTGRES)
+
+    def _create_search_index() -> bool:
+        """Create the index tables; True if an old index was dropped and has to be rebuilt."""
+        if not search_supported():
+            return False
+        rebuild = False
+        with engine.begin() as conn:
+            if IS_SQLITE:
+                old = conn.execute(sa_text("SELECT sql FROM sqlite_master WHERE name = 'response_fts'")).scalar()
+                if old and "content=''" not in old:
+                    # the first version of this table stored a plain copy of every text
+                    conn.execute(sa_text("DROP TABLE response_fts"))
+                    rebuild = True
+                conn.execute(sa_text("CREATE TABLE IF NOT EXISTS response_fts_map "
+                                     "(fts_rowid INTEGER PRIMARY KEY AUTOINCREMENT, response_id VARCHAR NOT NULL UNIQUE)"))
+                opts = ", contentless_delete=1" if _FTS_DELETE else ""
+                conn.execute(sa_text("CREATE VIRTUAL TABLE IF NOT EXISTS response_fts "
+                                     f"USING fts5(text, content=''{opts}, tokenize='unicode61 remove_diacritics 2')"))
+            else:
+                conn.execute(sa_text("CREATE TABLE IF NOT EXISTS response_search (response_id VARCHAR PRIMARY KEY, tsv TSVECTOR NOT NULL)"))
+                conn.execute(sa_text("CREATE INDEX IF NOT EXISTS ix_response_search_tsv ON response_search USING GIN (tsv)"))
+        return rebuild
+
+    def _search_params(rows: List[Dict[str, Any]], enriched: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not search_supported():
+            return []
+        return [{"response_id": row["id"], "text": r.get("text", "") or ""} for row, r in zip(rows, enriched)]
+
+    def _index_search(s, params: List[Dict[str, Any]]) -> None:
+        for i in range(0, len(params), INSERT_BATCH_SIZE):
+            for stmt in _SEARCH_INSERTS:
+                s.execute(stmt, params[i:i + INSERT_BATCH_SIZE])
 
     def init_storage():
         SQLModel.metadata.create_all(engine)
+        _add_missing_columns()
+        rebuild = _create_search_index()
+        _load_dicts()
+        if rebuild:
+            logging.info("Rebuilding the search index as a contentless table (one-time)")
+            reindex_search()
+
+    def _load_dicts() -> None:
+        with Session(engine) as s:
+            _codec.load({d.id: d.data for d in s.exec(select(TextDictionary)).all()})
+
+    def _maybe_train_dict() -> None:
+        if not _codec.ready_to_train():
+            return
+        data = _codec.train()
+        if not data:
+            return
+        with Session(engine) as s:
+            d = TextDictionary(data=data)
+            s.add(d)
+            s.commit()
+            _codec.add(d.id, data)
+        logging.info("Trained text dictionary %s (%d bytes)", d.id, len(data))
+
+    def _decode_text(text: Optional[str], blob: Optional[bytes], dict_id: Optional[int]) -> str:
+        if blob is None:
+            return text or ""
+        try:
+            return _codec.decode(blob, dict_id)
+        except KeyError:
+            _load_dicts()  # trained by another process since we started
+            return _codec.decode(blob, dict_id)
+
+    _METRIC_COLS = [f"metric_{k}" for k in TYPED_METRICS]
+
+    def _response_columns(fields: Tuple[str, ...]) -> List[Any]:
+        cols = [ResponseRecord.id]
+        if "param_set" in fields:
+            cols.append(ResponseRecord.param_set)
+        if "text" in fields:
+            cols += [ResponseRecord.text, ResponseRecord.text_z, ResponseRecord.zdict_id]
+        if "metrics" in fields:
+            cols += [getattr(ResponseRecord, c) for c in _METRIC_COLS] + [ResponseRecord.metrics]
+        return cols
+
+    def _response_dict(row: Any, fields: Tuple[str, ...]) -> Dict[str, Any]:
+        m = row._mapping
+        out: Dict[str, Any] = {"response_id": m["id"]}
+        if "param_set" in fields:
+            out["param_set"] = m["param_set"] or {}
+        if "text" in fields:
+            out["text"] = _decode_text(m["text"], m["text_z"], m["zdict_id"])
+        if "metrics" in fields:
+            out["metrics"] = _join_metrics({c: m[c] for c in _METRIC_COLS}, m["metrics"])
+        return out
+
+    def _response_row(exp_id: str, r: Dict[str, Any], seq: int) -> Dict[str, Any]:
+        typed, extra = _split_metrics(r.get("metrics"))
+        return {"id": str(uuid.uuid4()), "experiment_id": exp_id, "seq": seq, "param_set": r.get("param_set", {}),
+                **_encode_text(r.get("text", "") or ""), **typed, "metrics": extra}
+
+    def _response_rows(exp_id: str, enriched: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        first = _seq.take(len(enriched))
+        return [_response_row(exp_id, r, first + i) for i, r in enumerate(enriched)]
+
+    _RESPONSE_ORDER = (ResponseRecord.seq, ResponseRecord.id)
 
     def _session():
         return Session(engine)
 
+    def pool_stats() -> Dict[str, Any]:
+        pool = engine.pool
+        stats: Dict[str, Any] = {"backend": engine.dialect.name, "pool": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "max_overflow": DB_MAX_OVERFLOW,
+                "timeout": DB_POOL_TIMEOUT,
+            })
+        stats.update(_pool_waits.snapshot())
+        return stats
+
     def create_experiment(title: Optional[str], prompt: str, model: str) -> str:
         exp_id = str(uuid.uuid4())
         with _session() as s:
@@ -40,91 +473,790 @@ if DB_KIND == "sql":
             s.commit()
         return exp_id
 
-    def add_responses(exp_id: str, enriched: List[Dict[str, Any]]) -> None:
+    def add_responses(exp_id: str, enriched: List[Dict[str, Any]], job_done: Optional[int] = None) -> None:
+        """
+        Core INSERT with a list of params (executemany), INSERT_BATCH_SIZE rows per statement.
+        job_done sets the experiment's job progress in the same transaction, so a resumed
+        job never sees rows without the progress that covers them (or the reverse).
+        """
+        rows = _response_rows(exp_id, enriched)
+        if not rows:
+            return
         with _session() as s:
-            for r in enriched:
-                s.add(ResponseRecord(
-                    id=str(uuid.uuid4()),
-                    experiment_id=exp_id,
-                    param_set=r.get("param_set", {}),
-                    text=r.get("text",""),
-                    metrics=r.get("metrics",{}),
-                ))
+            for i in range(0, len(rows), INSERT_BATCH_SIZE):
+                s.execute(insert(ResponseRecord), rows[i:i + INSERT_BATCH_SIZE])
+            _index_search(s, _search_params(rows, enriched))
+            # same transaction: the write lock is already held, so the read-modify-write below can't race
+            _apply_aggregates(s, exp_id, aggregates.fold(enriched))
+            if job_done is not None:
+                s.execute(update(ExperimentJob).where(ExperimentJob.experiment_id == exp_id).values(done=job_done))
             s.commit()
+        exp_cache.invalidate(exp_id)
+        _maybe_train_dict()
+
+    def _agg_dict(a) -> Dict[str, Any]:
+        return {"cell": a.cell, "metric": a.metric, "param_set": a.param_set, "count": a.count, "sum": a.sum,
+                "sumsq": a.sumsq, "min": a.min, "max": a.max, "hist": a.hist}
+
+    def _apply_aggregates(s, exp_id: str, partial: Dict[tuple, Dict[str, Any]]) -> None:
+        if not partial:
+            return
+        cells = list({cell for cell, _m in partial})
+        existing = {}
+        for i in range(0, len(cells), INSERT_BATCH_SIZE):
+            q = select(MetricAggregate).where(MetricAggregate.experiment_id == exp_id,
+                                              MetricAggregate.cell.in_(cells[i:i + INSERT_BATCH_SIZE]))
+            for a in s.exec(q.with_for_update()).all():
+                existing[(a.cell, a.metric)] = a
+        for (cell, metric), st in partial.items():
+            row = existing.get((cell, metric))
+            if row is None:
+                s.add(MetricAggregate(experiment_id=exp_id, cell=cell, metric=metric, param_set=st["param_set"],
+                                      count=st["count"], sum=st["sum"], sumsq=st["sumsq"], min=st["min"],
+                                      max=st["max"], hist=st["hist"]))
+                continue
+            m = aggregates.merge(_agg_dict(row), st)
+            row.count, row.sum, row.sumsq, row.min, row.max, row.hist = (
+                m["count"], m["sum"], m["sumsq"], m["min"], m["max"], m["hist"])
+            s.add(row)
+
+    def get_aggregates(exp_id: str, include_cells: bool = True) -> List[Dict[str, Any]]:
+        with _session() as s:
+            q = select(MetricAggregate).where(MetricAggregate.experiment_id == exp_id)
+            if not include_cells:
+                q = q.where(MetricAggregate.cell == aggregates.EXPERIMENT_CELL)
+            return [_agg_dict(a) for a in s.exec(q).all()]
+
+    def rebuild_aggregates(exp_id: str, page_size: int = 1000) -> None:
+        """Recompute from the response rows, e.g. after a rescore or for data that predates the table."""
+        partial: Dict[tuple, Dict[str, Any]] = {}
+        page: List[Dict[str, Any]] = []
+        for r in iter_experiment_responses(exp_id, page_size, fields=("param_set", "metrics")):
+            page.append(r)
+            if len(page) >= page_size:
+                aggregates.combine(partial, aggregates.fold(page))
+                page = []
+        aggregates.combine(partial, aggregates.fold(page))
+        with _session() as s:
+            s.execute(delete(MetricAggregate).where(MetricAggregate.experiment_id == exp_id))
+            _apply_aggregates(s, exp_id, partial)
+            s.commit()
+        # called after a rescore rewrote this experiment's metrics
+        exp_cache.invalidate(exp_id)
+
+    def _exp_summary(e) -> Dict[str, Any]:
+        return {"id": e.id, "title": e.title, "prompt": e.prompt, "model": e.model,
+                "created_at": e.created_at.isoformat() if e.created_at else None}
+
+    def _list_query(skip: int, limit: int, cursor: Optional[str], model: Optional[str] = None):
+        q = select(Experiment).order_by(Experiment.created_at.desc(), Experiment.id.desc())
+        if model:
+            q = q.where(Experiment.model == model)
+        if cursor:
+            ts, last_id = decode_cursor(cursor)
+            q = q.where(or_(Experiment.created_at < ts,
+                            and_(Experiment.created_at == ts, Experiment.id < last_id)))
+        elif skip:
+            q = q.offset(skip)
+        return q.limit(limit)
+
+    def list_experiments(skip:int=0, limit:int=50, cursor: Optional[str] = None,
+                         model: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Newest first. With a cursor (from the previous page) this is a keyset seek on
+        (created_at, id) so every page costs the same; skip is kept for old clients.
+        Returns (rows, next_cursor).
+        """
+        with _session() as s:
+            rows = s.exec(_list_query(skip, limit, cursor, model)).all()
+            next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if len(rows) == limit else None
+            return [_exp_summary(e) for e in rows], next_cursor
 
-    def list_experiments(skip:int=0, limit:int=50) -> List[Dict[str, Any]]:
+    def find_experiments(ids: Optional[List[str]] = None, model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Experiment metadata matching the filters (used by cross-experiment exports)."""
         with _session() as s:
-            rows = s.exec(select(Experiment).offset(skip).limit(limit)).all()
-            return [{"id": e.id, "title": e.title, "prompt": e.prompt, "model": e.model} for e in rows]
+            q = select(Experiment).order_by(Experiment.id)
+            if ids:
+                q = q.where(Experiment.id.in_(ids))
+            if model:
+                q = q.where(Experiment.model == model)
+            return [{"id": e.id, "title": e.title, "prompt": e.prompt, "model": e.model} for e in s.exec(q).all()]
 
-    def get_experiment(exp_id: str) -> Dict[str, Any]:
+    def get_experiment(exp_id: str, fields: Any = None) -> Dict[str, Any]:
+        """fields limits the response columns read, e.g. ("param_set", "metrics") never touches text."""
+        fields = parse_fields(fields)
         with _session() as s:
             exp = s.get(Experiment, exp_id)
             if not exp:
                 return {}
-            resp_rows = s.exec(select(ResponseRecord).where(ResponseRecord.experiment_id==exp_id)).all()
+            resp_rows = s.execute(sa_select(*_response_columns(fields)).where(ResponseRecord.experiment_id == exp_id)
+                                  .order_by(*_RESPONSE_ORDER)).all()
             return {
                 "experiment": {"id": exp.id, "title": exp.title, "prompt": exp.prompt, "model": exp.model},
-                "responses": [{
-                    "response_id": r.id,
-                    "param_set": r.param_set,
-                    "text": r.text,
-                    "metrics": r.metrics,
-                } for r in resp_rows]
+                "responses": [_response_dict(r, fields) for r in resp_rows],
             }
 
+    def get_experiment_meta(exp_id: str) -> Dict[str, Any]:
+        with _session() as s:
+            exp = s.get(Experiment, exp_id)
+            return {"id": exp.id, "title": exp.title, "prompt": exp.prompt, "model": exp.model} if exp else {}
+
+    def iter_experiment_responses(exp_id: str, page_size: int = 500, fields: Any = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield one experiment's responses page by page so exports never hold them all; keyset
+        on (seq, id), i.e. the order they were written in, same as get_experiment.
+        """
+        fields = parse_fields(fields)
+        cols = _response_columns(fields) + [ResponseRecord.seq]
+        after = None
+        while True:
+            with _session() as s:
+                q = sa_select(*cols).where(ResponseRecord.experiment_id == exp_id).order_by(*_RESPONSE_ORDER)
+                if after is not None:
+                    q = q.where(or_(ResponseRecord.seq > after[0], and_(ResponseRecord.seq == after[0], ResponseRecord.id > after[1])))
+                rows = s.execute(q.limit(page_size)).all()
+                page = [_response_dict(r, fields) for r in rows]
+            if not page:
+                return
+            yield from page
+            after = (rows[-1]._mapping["seq"], rows[-1]._mapping["id"])
+
+    def iter_response_chunks(after_id: Optional[str] = None, chunk_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Page through every response by primary key (keyset), chunk_size rows at a time."""
+        while True:
+            with _session() as s:
+                q = sa_select(*_response_columns(("param_set", "text", "metrics")),
+                              ResponseRecord.experiment_id).order_by(ResponseRecord.id)
+                if after_id is not None:
+                    q = q.where(ResponseRecord.id > after_id)
+                rows = s.execute(q.limit(chunk_size)).all()
+            if not rows:
+                return
+            yield [{**_response_dict(r, ("param_set", "text", "metrics")), "experiment_id": r._mapping["experiment_id"]}
+                   for r in rows]
+            after_id = rows[-1]._mapping["id"]
+
+    _FILTER_OPS = {">": "__gt__", ">=": "__ge__", "<": "__lt__", "<=": "__le__", "=": "__eq__"}
+
+    def _fts5_query(q: str) -> str:
+        # every "quoted phrase" / bare word becomes an FTS5 string, ANDed: no query syntax leaks through
+        terms = [(phrase or word).replace('"', " ").strip() for phrase, word in re.findall(r'"([^"]*)"|(\S+)', q)]
+        terms = [t for t in terms if t]
+        if not terms:
+            raise ValueError("empty search query")
+        return " AND ".join(f'"{t}"' for t in terms)
+
+    def search_responses(text_query: Optional[str] = None, metric_filters: Optional[List[Tuple[str, str, float]]] = None,
+                         model: Optional[str] = None, experiment_ids: Optional[List[str]] = None, limit: int = 50,
+                         cursor: Optional[str] = None, fields: Any = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Responses matching a full-text query and/or ranges on the typed metric columns, across
+        experiments. Ordered by response id with a keyset cursor. Returns (rows, next_cursor).
+        """
+        fields = parse_fields(fields)
+        q = sa_select(*_response_columns(fields), ResponseRecord.experiment_id)
+        if text_query:
+            if not search_supported():
+                raise ValueError("text search needs SQLite or Postgres (or DB_KIND=mongo) with SEARCH_INDEX=1")
+            if IS_SQLITE:
+                q = q.join(response_fts_map, response_fts_map.c.response_id == ResponseRecord.id).join(
+                    response_fts, response_fts.c.rowid == response_fts_map.c.fts_rowid).where(
+                    sa_text("response_fts MATCH :fts_q").bindparams(fts_q=_fts5_query(text_query)))
+            else:
+                q = q.join(response_search, response_search.c.response_id == ResponseRecord.id).where(
+                    sa_text(f"response_search.tsv @@ websearch_to_tsquery('{SEARCH_LANGUAGE}', :ts_q)").bindparams(ts_q=text_query))
+        for metric, op, value in metric_filters or []:
+            q = q.where(getattr(getattr(ResponseRecord, f"metric_{metric}"), _FILTER_OPS[op])(value))
+        if model:
+            q = q.join(Experiment, Experiment.id == ResponseRecord.experiment_id).where(Experiment.model == model)
+        if experiment_ids:
+            q = q.where(ResponseRecord.experiment_id.in_(experiment_ids))
+        if cursor:
+            q = q.where(ResponseRecord.id > decode_search_cursor(cursor))
+        with _session() as s:
+            rows = s.execute(q.order_by(ResponseRecord.id).limit(limit)).all()
+        out = [{**_response_dict(r, fields), "experiment_id": r._mapping["experiment_id"]} for r in rows]
+        next_cursor = encode_search_cursor(out[-1]["response_id"]) if len(out) == limit else None
+        return out, next_cursor
+
+    def reindex_search(chunk_size: int = 1000) -> int:
+        """Rebuild the full-text index from the stored responses (e.g. rows written before it existed)."""
+        if not search_supported():
+            return 0
+        with _session() as s:
+            if IS_SQLITE:
+                s.execute(sa_text("INSERT INTO response_fts (response_fts) VALUES ('delete-all')"))
+                s.execute(sa_text("DELETE FROM response_fts_map"))
+            else:
+                s.execute(sa_text("DELETE FROM response_search"))
+            s.commit()
+        done = 0
+        for chunk in iter_response_chunks(chunk_size=chunk_size):
+            with _session() as s:
+                _index_search(s, [{"response_id": r["response_id"], "text": r["text"]} for r in chunk])
+                s.commit()
+            done += len(chunk)
+        return done
+
+    def get_prompts(exp_ids: List[str]) -> Dict[str, str]:
+        with _session() as s:
+            rows = s.exec(select(Experiment.id, Experiment.prompt).where(Experiment.id.in_(exp_ids))).all()
+            return {r[0]: r[1] for r in rows}
+
+    def get_vectors(exp_id: str) -> Dict[str, Tuple[int, bytes]]:
+        """response_id -> (dim, encoded vector) for the vectors cached for an experiment."""
+        with _session() as s:
+            rows = s.execute(sa_select(ResponseVector.response_id, ResponseVector.dim, ResponseVector.vec)
+                             .where(ResponseVector.experiment_id == exp_id)).all()
+        return {r[0]: (r[1], r[2]) for r in rows}
+
+    def put_vectors(exp_id: str, dim: int, vecs: Dict[str, bytes]) -> None:
+        ids = list(vecs)
+        if not ids:
+            return
+        with _session() as s:
+            # replace, so stale vectors of another dim and a concurrent fill both end up as one row
+            for i in range(0, len(ids), INSERT_BATCH_SIZE):
+                s.execute(delete(ResponseVector).where(ResponseVector.response_id.in_(ids[i:i + INSERT_BATCH_SIZE])))
+            rows = [{"response_id": k, "experiment_id": exp_id, "dim": dim, "vec": vecs[k]} for k in ids]
+            for i in range(0, len(rows), INSERT_BATCH_SIZE):
+                s.execute(insert(ResponseVector), rows[i:i + INSERT_BATCH_SIZE])
+            s.commit()
+
+    def delete_responses(exp_id: str) -> None:
+        """Remove an experiment's responses along with their aggregates, cached vectors and search index rows."""
+        ids = sa_select(ResponseRecord.id).where(ResponseRecord.experiment_id == exp_id)
+        with _session() as s:
+            if search_supported() and IS_SQLITE:
+                if _FTS_DELETE:
+                    s.execute(delete(response_fts).where(response_fts.c.rowid.in_(
+                        sa_select(response_fts_map.c.fts_rowid).where(response_fts_map.c.response_id.in_(ids)))))
+                s.execute(delete(response_fts_map).where(response_fts_map.c.response_id.in_(ids)))
+            elif search_supported():
+                s.execute(delete(response_search).where(response_search.c.response_id.in_(ids)))
+            s.execute(delete(ResponseVector).where(ResponseVector.experiment_id == exp_id))
+            s.execute(delete(MetricAggregate).where(MetricAggregate.experiment_id == exp_id))
+            s.execute(delete(ResponseRecord).where(ResponseRecord.experiment_id == exp_id))
+            s.commit()
+        exp_cache.invalidate(exp_id)
+
+    def update_metrics_bulk(updates: List[Dict[str, Any]]) -> None:
+        """updates: [{"response_id": ..., "experiment_id": ..., "metrics": {...}}]; one executemany UPDATE by primary key."""
+        if not updates:
+            return
+        rows = []
+        for u in updates:
+            typed, extra = _split_metrics(u["metrics"])
+            rows.append({"id": u["response_id"], **typed, "metrics": extra})
+        with _session() as s:
+            s.execute(update(ResponseRecord), rows)
+            s.commit()
+        for exp_id in {u["experiment_id"] for u in updates}:
+            exp_cache.invalidate(exp_id)
+
+    def compact_responses(chunk_size: int = 1000) -> int:
+        """Rewrite rows stored before compression / typed metric columns in place; returns rows rewritten."""
+        done = 0
+        after_id = None
+        while True:
+            with _session() as s:
+                q = sa_select(ResponseRecord.id, ResponseRecord.text, ResponseRecord.metrics).where(
+                    ResponseRecord.text_z.is_(None)).order_by(ResponseRecord.id)
+                if after_id is not None:
+                    q = q.where(ResponseRecord.id > after_id)
+                rows = s.execute(q.limit(chunk_size)).all()
+                if not rows:
+                    return done
+                updates = []
+                for rid, text, metrics in rows:
+                    typed, extra = _split_metrics(metrics)
+                    enc = _encode_text(text or "") if textcodec.enabled() else {}
+                    updates.append({"id": rid, **enc, **typed, "metrics": extra})
+                s.execute(update(ResponseRecord), updates)
+                s.commit()
+            _maybe_train_dict()
+            done += len(rows)
+            after_id = rows[-1][0]
+
+    def vacuum() -> None:
+        """Give freed pages back to the filesystem after compact_responses (SQLite / Postgres)."""
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if engine.dialect.name in ("sqlite", "postgresql"):
+                conn.execute(sa_text("VACUUM"))
+            if IS_SQLITE:
+                # under WAL the rewritten pages sit in the -wal file until a checkpoint
+                conn.execute(sa_text("PRAGMA wal_checkpoint(TRUNCATE)"))
+
+    def create_job(exp_id: str, provider: str, model: str, prompt: str, param_sets: List[Dict[str, Any]], total: int,
+                   use_cache: bool = True, mode: str = "job", grid: Optional[Dict[str, Any]] = None,
+                   adaptive: Optional[Dict[str, Any]] = None, metrics: Optional[List[str]] = None,
+                   live: Optional[Dict[str, Any]] = None) -> None:
+        with _session() as s:
+            s.add(ExperimentJob(experiment_id=exp_id, provider=provider, model=model, prompt=prompt,
+                                param_sets=param_sets, total=total, use_cache=use_cache, mode=mode,
+                                grid=grid, adaptive=adaptive, metrics=metrics, live=live))
+            s.commit()
+
+    def update_job(exp_id: str, **fields) -> None:
+        with _session() as s:
+            job = s.get(ExperimentJob, exp_id)
+            if not job:
+                return
+            for k, v in fields.items():
+                setattr(job, k, v)
+            s.add(job)
+            s.commit()
+
+    def _job_dict(job) -> Dict[str, Any]:
+        return {"experiment_id": job.experiment_id, "provider": job.provider, "model": job.model,
+                "prompt": job.prompt, "param_sets": job.param_sets, "status": job.status,
+                "total": job.total, "done": job.done, "error": job.error, "use_cache": job.use_cache is not False,
+                "mode": job.mode or "job", "batch_id": job.batch_id, "batch_indices": job.batch_indices, "grid": job.grid,
+                "adaptive": job.adaptive, "result": job.result, "metrics": job.metrics,
+                "live": job.live}
+
+    def get_job(exp_id: str) -> Dict[str, Any]:
+        with _session() as s:
+            job = s.get(ExperimentJob, exp_id)
+            return _job_dict(job) if job else {}
+
+    def list_unfinished_jobs() -> List[Dict[str, Any]]:
+        with _session() as s:
+            rows = s.exec(select(ExperimentJob).where(ExperimentJob.status.in_(["queued", "running"]))).all()
+            return [_job_dict(j) for j in rows]
+
 # ---------------- MongoDB (NoSQL) ----------------
 else:
-    from pymongo import MongoClient, ASCENDING
-    import datetime
+    from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT, UpdateOne
 
     MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
     MONGO_DB = os.getenv("MONGO_DB", "llmlab")
-    client = MongoClient(MONGO_URL)
+    from pymongo import monitoring
+
+    class _PoolListener(monitoring.ConnectionPoolListener):
+        """Tracks checked-out connections and checkout wait time for pool_stats()."""
+
+        def __init__(self):
+            self.checked_out = 0
+            self._started: Dict[Any, float] = {}
+            self._lock = threading.Lock()
+
+        def connection_check_out_started(self, event):
+            with self._lock:
+                self._started[threading.get_ident()] = time.perf_counter()
+
+        def _waited(self) -> float:
+            with self._lock:
+                t0 = self._started.pop(threading.get_ident(), None)
+            return time.perf_counter() - t0 if t0 is not None else 0.0
+
+        def connection_checked_out(self, event):
+            _pool_waits.record(self._waited())
+            with self._lock:
+                self.checked_out += 1
+
+        def connection_check_out_failed(self, event):
+            _pool_waits.record(self._waited(), timed_out=getattr(event, "reason", "") == "timeout")
+
+        def connection_checked_in(self, event):
+            with self._lock:
+                self.checked_out -= 1
+
+        def pool_created(self, event): pass
+        def pool_ready(self, event): pass
+        def pool_cleared(self, event): pass
+        def pool_closed(self, event): pass
+        def connection_created(self, event): pass
+        def connection_ready(self, event): pass
+        def connection_closed(self, event): pass
+
+    _pool_listener = _PoolListener()
+    client = MongoClient(
+        MONGO_URL,
+        maxPoolSize=DB_POOL_SIZE + DB_MAX_OVERFLOW,
+        minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        waitQueueTimeoutMS=int(DB_POOL_TIMEOUT * 1000),
+        event_listeners=[_pool_listener],
+    )
     db = client[MONGO_DB]
     exps = db["experiments"]
     resps = db["responses"]
     exps.create_index([("id", ASCENDING)], unique=True)
-    resps.create_index([("experiment_id", ASCENDING)])
+    exps.create_index([("created_at", DESCENDING), ("id", DESCENDING)])
+    jobs = db["jobs"]
+    # per-experiment reads filter on experiment_id and return documents in _id (insertion) order
+    resps.create_index([("experiment_id", ASCENDING), ("_id", ASCENDING)])
+    resps.create_index([("response_id", ASCENDING)])
+    jobs.create_index([("experiment_id", ASCENDING)], unique=True)
+    jobs.create_index([("status", ASCENDING)])
+    aggs = db["metric_aggregates"]
+    aggs.create_index([("experiment_id", ASCENDING), ("cell", ASCENDING), ("metric", ASCENDING)], unique=True)
+    text_dicts = db["text_dicts"]
+    vectors = db["response_vectors"]
+    vectors.create_index([("response_id", ASCENDING)], unique=True)
+    vectors.create_index([("experiment_id", ASCENDING)])
+    text_dicts.create_index([("id", ASCENDING)], unique=True)
+    exps.create_index([("model", ASCENDING)])
+    for _k in TYPED_METRICS:
+        resps.create_index([(f"metrics.{_k}", ASCENDING)])
+    if SEARCH_INDEX:
+        # texts are stored compressed and Mongo has no contentless text index, so it covers search_terms: each
+        # distinct word of the text once, lowercased. Smaller than a plain copy, but phrases can't be matched
+        # exactly any more (a quoted phrase needs all its words). Only one text index per collection is allowed
+        if "search_text_idx" in resps.index_information():
+            resps.drop_index("search_text_idx")
+        resps.create_index([("search_terms", TEXT)], default_language=SEARCH_LANGUAGE, name="search_terms_idx")
+
+    def _search_terms(text: str) -> str:
+        return " ".join(dict.fromkeys(re.findall(r"\w+", text.lower())))
+
+    def _text_search(q: str) -> str:
+        # search_terms has no word order, so every word of a "quoted phrase" becomes a required term of its own
+        terms = [f'"{w}"' if phrase else w for phrase, bare in re.findall(r'"([^"]*)"|(\S+)', q)
+                 for w in (re.findall(r"\w+", phrase) if phrase else [bare])]
+        if not terms:
+            raise ValueError("empty search query")
+        return " ".join(terms)
+
+    def search_supported() -> bool:
+        return SEARCH_INDEX
 
     def init_storage():
         # No migrations needed for Mongo
-        pass
+        _load_dicts()
+
+    def _load_dicts() -> None:
+        _codec.load({d["id"]: bytes(d["data"]) for d in text_dicts.find({}, {"_id": False})})
+
+    def _maybe_train_dict() -> None:
+        if not _codec.ready_to_train():
+            return
+        data = _codec.train()
+        if not data:
+            return
+        dict_id = int(time.time() * 1000)  # unique enough across processes, and increasing
+        text_dicts.insert_one({"id": dict_id, "data": data, "created_at": datetime.datetime.utcnow()})
+        _codec.add(dict_id, data)
+        logging.info("Trained text dictionary %s (%d bytes)", dict_id, len(data))
+
+    def _decode_doc(d: Dict[str, Any]) -> Dict[str, Any]:
+        blob = d.pop("text_z", None)
+        dict_id = d.pop("zdict_id", None)
+        if blob is not None:
+            try:
+                d["text"] = _codec.decode(bytes(blob), dict_id)
+            except KeyError:
+                _load_dicts()
+                d["text"] = _codec.decode(bytes(blob), dict_id)
+        return d
+
+    def _projection(fields: Tuple[str, ...]) -> Dict[str, Any]:
+        proj: Dict[str, Any] = {"_id": False, "response_id": True}
+        for f in fields:
+            proj[f] = True
+        if "text" in fields:
+            proj["text_z"] = True
+            proj["zdict_id"] = True
+        return proj
+
+    def pool_stats() -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"backend": "mongo", "max_pool_size": DB_POOL_SIZE + DB_MAX_OVERFLOW,
+                                 "checked_out": _pool_listener.checked_out, "timeout": DB_POOL_TIMEOUT}
+        stats.update(_pool_waits.snapshot())
+        return stats
 
     def create_experiment(title: Optional[str], prompt: str, model: str) -> str:
         exp_id = str(uuid.uuid4())
-        exps.insert_one({
-            "id": exp_id,
-            "title": title,
-            "prompt": prompt,
-            "model": model,
-            "created_at": datetime.datetime.utcnow()
-        })
+        exps.insert_one(_exp_doc(exp_id, title, prompt, model))
         return exp_id
 
-    def add_responses(exp_id: str, enriched: List[Dict[str, Any]]) -> None:
-        docs = []
-        for r in enriched:
-            docs.append({
-                "response_id": str(uuid.uuid4()),
-                "experiment_id": exp_id,
-                "param_set": r.get("param_set", {}),
-                "text": r.get("text", ""),
-                "metrics": r.get("metrics", {}),
-                "created_at": datetime.datetime.utcnow()
-            })
-        if docs:
-            resps.insert_many(docs)
+    def _response_doc(exp_id: str, r: Dict[str, Any], response_id: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "response_id": response_id or str(uuid.uuid4()),
+            "experiment_id": exp_id,
+            "param_set": r.get("param_set", {}),
+            # BSON already stores metrics as typed doubles; only the text needs compacting
+            **{k: v for k, v in _encode_text(r.get("text", "") or "").items() if v is not None},
+            **({"search_terms": _search_terms(r.get("text", "") or "")} if SEARCH_INDEX else {}),
+            "metrics": r.get("metrics", {}),
+            "created_at": datetime.datetime.utcnow()
+        }
+
+    def _exp_doc(exp_id: str, title: Optional[str], prompt: str, model: str) -> Dict[str, Any]:
+        return {"id": exp_id, "title": title, "prompt": prompt, "model": model, "created_at": datetime.datetime.utcnow()}
+
+    def _list_query(cursor: Optional[str], model: Optional[str] = None) -> Dict[str, Any]:
+        q: Dict[str, Any] = {"model": model} if model else {}
+        if cursor:
+            ts, last_id = decode_cursor(cursor)
+            q["$or"] = [{"created_at": {"$lt": ts}}, {"created_at": ts, "id": {"$lt": last_id}}]
+        return q
+
+    def add_responses(exp_id: str, enriched: List[Dict[str, Any]], job_done: Optional[int] = None) -> None:
+        """
+        Without multi-document transactions, job chunks (job_done set) get ids derived from
+        their sweep position and are upserted instead: a chunk replayed after a crash only
+        inserts (and counts into the aggregates) the documents that are not stored yet.
+        """
+        if job_done is None:
+            docs = [_response_doc(exp_id, r) for r in enriched]
+            for i in range(0, len(docs), INSERT_BATCH_SIZE):
+                resps.insert_many(docs[i:i + INSERT_BATCH_SIZE], ordered=False)
+            fresh = enriched
+        else:
+            first = job_done - len(enriched)
+            ops = [UpdateOne({"response_id": rid}, {"$setOnInsert": _response_doc(exp_id, r, rid)}, upsert=True)
+                   for rid, r in ((str(uuid.uuid5(uuid.UUID(exp_id), str(first + i))), r) for i, r in enumerate(enriched))]
+            inserted = set()
+            for i in range(0, len(ops), INSERT_BATCH_SIZE):
+                inserted.update(i + k for k in resps.bulk_write(ops[i:i + INSERT_BATCH_SIZE], ordered=False).upserted_ids)
+            fresh = [r for i, r in enumerate(enriched) if i in inserted]
+        _apply_aggregates(exp_id, aggregates.fold(fresh))
+        if job_done is not None:
+            jobs.update_one({"experiment_id": exp_id}, {"$set": {"done": job_done}})
+        exp_cache.invalidate(exp_id)
+        _maybe_train_dict()
+
+    def _aggregate_ops(exp_id: str, partial: Dict[tuple, Dict[str, Any]]) -> List[Any]:
+        # $inc / $min / $max upserts are atomic per document, so concurrent writers can't lose updates
+        ops = []
+        for (cell, metric), st in partial.items():
+            inc = {"count": st["count"], "sum": st["sum"], "sumsq": st["sumsq"]}
+            inc.update({f"hist.{i}": c for i, c in enumerate(st["hist"]) if c})
+            ops.append(UpdateOne(
+                {"experiment_id": exp_id, "cell": cell, "metric": metric},
+                {"$inc": inc, "$min": {"min": st["min"]}, "$max": {"max": st["max"]},
+                 "$setOnInsert": {"param_set": st["param_set"]}},
+                upsert=True,
+            ))
+        return ops
 
-    def list_experiments(skip:int=0, limit:int=50) -> List[Dict[str, Any]]:
-        rows = list(exps.find({}, {"_id": False}).skip(skip).limit(limit))
-        return rows
+    def _apply_aggregates(exp_id: str, partial: Dict[tuple, Dict[str, Any]]) -> None:
+        ops = _aggregate_ops(exp_id, partial)
+        for i in range(0, len(ops), INSERT_BATCH_SIZE):
+            aggs.bulk_write(ops[i:i + INSERT_BATCH_SIZE], ordered=False)
 
-    def get_experiment(exp_id: str) -> Dict[str, Any]:
+    def _agg_doc(d: Dict[str, Any]) -> Dict[str, Any]:
+        # upserted "hist.<i>" increments build a sub-document, not an array
+        h = d.get("hist") or {}
+        d["hist"] = [int(h.get(str(i), 0)) for i in range(aggregates.HIST_BINS)] if isinstance(h, dict) else h
+        return d
+
+    def get_aggregates(exp_id: str, include_cells: bool = True) -> List[Dict[str, Any]]:
+        q: Dict[str, Any] = {"experiment_id": exp_id}
+        if not include_cells:
+            q["cell"] = aggregates.EXPERIMENT_CELL
+        return [_agg_doc(d) for d in aggs.find(q, {"_id": False})]
+
+    def rebuild_aggregates(exp_id: str, page_size: int = 1000) -> None:
+        aggs.delete_many({"experiment_id": exp_id})
+        page: List[Dict[str, Any]] = []
+        for r in iter_experiment_responses(exp_id, page_size, fields=("param_set", "metrics")):
+            page.append(r)
+            if len(page) >= page_size:
+                _apply_aggregates(exp_id, aggregates.fold(page))
+                page = []
+        _apply_aggregates(exp_id, aggregates.fold(page))
+        exp_cache.invalidate(exp_id)
+
+    def list_experiments(skip:int=0, limit:int=50, cursor: Optional[str] = None,
+                         model: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        cur = exps.find(_list_query(cursor, model), {"_id": False}).sort([("created_at", DESCENDING), ("id", DESCENDING)])
+        if skip and not cursor:
+            cur = cur.skip(skip)
+        rows = list(cur.limit(limit))
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if len(rows) == limit else None
+        return rows, next_cursor
+
+    def find_experiments(ids: Optional[List[str]] = None, model: Optional[str] = None) -> List[Dict[str, Any]]:
+        q: Dict[str, Any] = {}
+        if ids:
+            q["id"] = {"$in": ids}
+        if model:
+            q["model"] = model
+        return [{k: e[k] for k in ["id","title","prompt","model"] if k in e}
+                for e in exps.find(q, {"_id": False}).sort("id", ASCENDING)]
+
+    def get_experiment(exp_id: str, fields: Any = None) -> Dict[str, Any]:
+        fields = parse_fields(fields)
         exp = exps.find_one({"id": exp_id}, {"_id": False})
         if not exp: return {}
-        rows = list(resps.find({"experiment_id": exp_id}, {"_id": False}))
+        rows = [_decode_doc(d) for d in resps.find({"experiment_id": exp_id}, _projection(fields)).sort("_id", ASCENDING)]
         return {
             "experiment": {k: exp[k] for k in ["id","title","prompt","model"] if k in exp},
             "responses": rows
         }
+
+    def get_experiment_meta(exp_id: str) -> Dict[str, Any]:
+        exp = exps.find_one({"id": exp_id}, {"_id": False})
+        return {k: exp[k] for k in ["id","title","prompt","model"] if k in exp} if exp else {}
+
+    def iter_experiment_responses(exp_id: str, page_size: int = 500, fields: Any = None) -> Iterator[Dict[str, Any]]:
+        # cursor batches keep only page_size documents in memory at a time; ObjectIds sort in insertion order
+        proj = _projection(parse_fields(fields))
+        cur = resps.find({"experiment_id": exp_id}, proj).sort("_id", ASCENDING).batch_size(page_size)
+        for d in cur:
+            yield _decode_doc(d)
+
+    def iter_response_chunks(after_id: Optional[str] = None, chunk_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        while True:
+            q = {"response_id": {"$gt": after_id}} if after_id is not None else {}
+            proj = {"_id": False, "response_id": True, "experiment_id": True, "text": True, "text_z": True,
+                    "zdict_id": True, "param_set": True, "metrics": True}
+            rows = [_decode_doc(d) for d in resps.find(q, proj).sort("response_id", ASCENDING).limit(chunk_size)]
+            if not rows:
+                return
+            yield rows
+            after_id = rows[-1]["response_id"]
+
+    _FILTER_OPS = {">": "$gt", ">=": "$gte", "<": "$lt", "<=": "$lte", "=": "$eq"}
+
+    def search_responses(text_query: Optional[str] = None, metric_filters: Optional[List[Tuple[str, str, float]]] = None,
+                         model: Optional[str] = None, experiment_ids: Optional[List[str]] = None, limit: int = 50,
+                         cursor: Optional[str] = None, fields: Any = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        fields = parse_fields(fields)
+        q: Dict[str, Any] = {}
+        if text_query:
+            if not SEARCH_INDEX:
+                raise ValueError("text search is disabled (SEARCH_INDEX=0)")
+            q["$text"] = {"$search": _text_search(text_query)}
+        for metric, op, value in metric_filters or []:
+            q.setdefault(f"metrics.{metric}", {})[_FILTER_OPS[op]] = value
+        ids = set(experiment_ids or [])
+        if model:
+            with_model = {e["id"] for e in exps.find({"model": model}, {"_id": False, "id": True})}
+            ids = ids & with_model if experiment_ids else with_model
+        if model or experiment_ids:
+            q["experiment_id"] = {"$in": sorted(ids)}
+        if cursor:
+            q["response_id"] = {"$gt": decode_search_cursor(cursor)}
+        proj = {**_projection(fields), "experiment_id": True}
+        rows = [_decode_doc(d) for d in resps.find(q, proj).sort("response_id", ASCENDING).limit(limit)]
+        next_cursor = encode_search_cursor(rows[-1]["response_id"]) if len(rows) == limit else None
+        return rows, next_cursor
+
+    def reindex_search(chunk_size: int = 1000) -> int:
+        """Fill search_terms for documents written before the text index existed (and drop old plain copies)."""
+        if not SEARCH_INDEX:
+            return 0
+        done = 0
+        for chunk in iter_response_chunks(chunk_size=chunk_size):
+            resps.bulk_write([UpdateOne({"response_id": r["response_id"]},
+                                        {"$set": {"search_terms": _search_terms(r["text"])}, "$unset": {"search_text": ""}})
+                              for r in chunk], ordered=False)
+            done += len(chunk)
+        return done
+
+    def get_prompts(exp_ids: List[str]) -> Dict[str, str]:
+        return {e["id"]: e.get("prompt", "") for e in exps.find({"id": {"$in": exp_ids}}, {"_id": False, "id": True, "prompt": True})}
+
+    def get_vectors(exp_id: str) -> Dict[str, Tuple[int, bytes]]:
+        return {d["response_id"]: (d["dim"], bytes(d["vec"]))
+                for d in vectors.find({"experiment_id": exp_id}, {"_id": False})}
+
+    def put_vectors(exp_id: str, dim: int, vecs: Dict[str, bytes]) -> None:
+        ops = [UpdateOne({"response_id": k}, {"$set": {"experiment_id": exp_id, "dim": dim, "vec": v}}, upsert=True)
+               for k, v in vecs.items()]
+        for i in range(0, len(ops), INSERT_BATCH_SIZE):
+            vectors.bulk_write(ops[i:i + INSERT_BATCH_SIZE], ordered=False)
+
+    def delete_responses(exp_id: str) -> None:
+        resps.delete_many({"experiment_id": exp_id})
+        vectors.delete_many({"experiment_id": exp_id})
+        aggs.delete_many({"experiment_id": exp_id})
+        exp_cache.invalidate(exp_id)
+
+    def update_metrics_bulk(updates: List[Dict[str, Any]]) -> None:
+        if not updates:
+            return
+        resps.bulk_write([UpdateOne({"response_id": u["response_id"]}, {"$set": {"metrics": u["metrics"]}})
+                          for u in updates], ordered=False)
+        for exp_id in {u["experiment_id"] for u in updates}:
+            exp_cache.invalidate(exp_id)
+
+    def compact_responses(chunk_size: int = 1000) -> int:
+        """Compress the text of documents written before compression was enabled."""
+        if not textcodec.enabled():
+            return 0
+        done = 0
+        while True:
+            rows = list(resps.find({"text_z": {"$exists": False}}, {"_id": False, "response_id": True, "text": True})
+                        .limit(chunk_size))
+            if not rows:
+                return done
+            ops = []
+            for d in rows:
+                enc = _encode_text(d.get("text") or "")
+                ops.append(UpdateOne({"response_id": d["response_id"]},
+                                     {"$set": {"text": "", "text_z": enc["text_z"], "zdict_id": enc["zdict_id"]}}))
+            resps.bulk_write(ops, ordered=False)
+            _maybe_train_dict()
+            done += len(rows)
+
+    def vacuum() -> None:
+        db.command("compact", "responses")
+
+    def create_job(exp_id: str, provider: str, model: str, prompt: str, param_sets: List[Dict[str, Any]], total: int,
+                   use_cache: bool = True, mode: str = "job", grid: Optional[Dict[str, Any]] = None,
+                   adaptive: Optional[Dict[str, Any]] = None, metrics: Optional[List[str]] = None,
+                   live: Optional[Dict[str, Any]] = None) -> None:
+        jobs.insert_one({
+            "experiment_id": exp_id,
+            "provider": provider,
+            "model": model,
+            "prompt": prompt,
+            "param_sets": param_sets,
+            "status": "queued",
+            "total": total,
+            "done": 0,
+            "error": None,
+            "use_cache": use_cache,
+            "mode": mode,
+            "batch_id": None,
+            "batch_indices": None,
+            "grid": grid,
+            "adaptive": adaptive,
+            "metrics": metrics,
+            "live": live,
+            "result": None,
+        })
+
+    def update_job(exp_id: str, **fields) -> None:
+        jobs.update_one({"experiment_id": exp_id}, {"$set": fields})
+
+    def get_job(exp_id: str) -> Dict[str, Any]:
+        return jobs.find_one({"experiment_id": exp_id}, {"_id": False}) or {}
+
+    def list_unfinished_jobs() -> List[Dict[str, Any]]:
+        return list(jobs.find({"status": {"$in": ["queued", "running"]}}, {"_id": False}))
+
+
+# ---------------- instrumentation ----------------
+
+def _row_count(result: Any) -> int:
+    if isinstance(result, tuple):  # (rows, next_cursor)
+        result = result[0]
+    if isinstance(result, dict):
+        result = result.get("responses", ())
+    return len(result) if result is not None else 0
+
+
+def _instrument(fn, stage: str):
+    """Time fn into DB_SECONDS / the request trace and count the rows it wrote or returned."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with telemetry.span(stage, telemetry.DB_SECONDS, op=fn.__name__):
+            result = fn(*args, **kwargs)
+        if fn.__name__ == "add_responses":
+            result_rows = _row_count(kwargs.get("enriched", args[1] if len(args) > 1 else None))
+        else:
+            result_rows = _row_count(result)
+        telemetry.DB_ROWS.inc(result_rows, op=fn.__name__)
+        return result
+    return wrapper
+
+
+add_responses = _instrument(add_responses, "db_write")
+get_experiment = _instrument(get_experiment, "db_read")
+list_experiments = _instrument(list_experiments, "db_read")
+search_responses = _instrument(search_responses, "db_read")
@@ -0,0 +1,225 @@
+# storage_async.py (async versions of the request-path storage calls; same shapes as storage.py)
+#
+# SQL goes through SQLAlchemy's async engine (aiosqlite / asyncpg / aiomysql), Mongo through
+# Motor. Models, row mapping, text encoding and aggregate folding are shared with storage.py,
+# so both paths write identical rows. If the async driver isn't installed (or the DB is an
+# in-memory SQLite that only the sync engine can see) the sync functions run in a thread.
+import os
+import uuid
+import asyncio
+import logging
+import functools
+from typing import List, Dict, Any, Optional, Tuple
+
+import aggregates
+import exp_cache
+import storage
+import telemetry
+from storage import DB_KIND, INSERT_BATCH_SIZE, parse_fields, encode_cursor
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "")
+
+# sync driver -> async driver for the same database
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def _async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return _ASYNC_DRIVERS.get(scheme.split("+")[0], scheme) + sep + rest
+
+
+def _fallback(reason: str) -> None:
+    global BACKEND
+    BACKEND = "thread"
+    logging.warning("Async storage unavailable (%s); storage calls will run in worker threads", reason)
+
+
+BACKEND = DB_KIND  # 'sql', 'mongo', or 'thread' when falling back
+
+if DB_KIND == "sql":
+    if storage._in_memory and not ASYNC_DATABASE_URL:
+        _fallback("in-memory SQLite is private to the sync engine")
+    else:
+        try:
+            from sqlalchemy import event, insert
+            from sqlalchemy import select as sa_select
+            from sqlalchemy.ext.asyncio import create_async_engine
+            from sqlmodel.ext.asyncio.session import AsyncSession
+            from storage import Experiment, ResponseRecord
+
+            _url = ASYNC_DATABASE_URL or _async_url(storage.DATABASE_URL)
+            _pool_args: Dict[str, Any] = {} if storage.IS_SQLITE else {
+                "pool_size": storage.DB_POOL_SIZE,
+                "max_overflow": storage.DB_MAX_OVERFLOW,
+                "pool_timeout": storage.DB_POOL_TIMEOUT,
+                "pool_recycle": storage.DB_POOL_RECYCLE,
+            }
+            async_engine = create_async_engine(_url, echo=False, pool_pre_ping=storage.DB_POOL_PRE_PING, **_pool_args)
+            if storage.IS_SQLITE:
+                # same WAL / busy_timeout setup as the sync engine, which writes to the same file
+                event.listen(async_engine.sync_engine, "connect", storage._sqlite_pragmas)
+        except ImportError as e:
+            _fallback(str(e))
+else:
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from pymongo import ASCENDING, DESCENDING
+    except ImportError as e:
+        _fallback(str(e))
+    else:
+        # the client binds to the running loop on first use, so create it lazily
+        _motor = None
+
+        def _db():
+            global _motor
+            if _motor is None:
+                _motor = AsyncIOMotorClient(
+                    storage.MONGO_URL,
+                    maxPoolSize=storage.DB_POOL_SIZE + storage.DB_MAX_OVERFLOW,
+                    waitQueueTimeoutMS=int(storage.DB_POOL_TIMEOUT * 1000),
+                )
+            return _motor[storage.MONGO_DB]
+
+
+async def _train_dict() -> None:
+    # rare and blocking (builds the dictionary, then one insert); keep it off the loop
+    if storage._codec.ready_to_train():
+        await asyncio.to_thread(storage._maybe_train_dict)
+
+
+if BACKEND == "sql":
+    def _session():
+        return AsyncSession(async_engine, expire_on_commit=False)
+
+    async def create_experiment(title: Optional[str], prompt: str, model: str) -> str:
+        exp_id = str(uuid.uuid4())
+        async with _session() as s:
+            s.add(Experiment(id=exp_id, title=title, prompt=prompt, model=model))
+            await s.commit()
+        return exp_id
+
+    async def add_responses(exp_id: str, enriched: List[Dict[str, Any]]) -> None:
+        rows = storage._response_rows(exp_id, enriched)
+        if not rows:
+            return
+        partial = aggregates.fold(enriched)
+        async with _session() as s:
+            for i in range(0, len(rows), INSERT_BATCH_SIZE):
+                await s.execute(insert(ResponseRecord), rows[i:i + INSERT_BATCH_SIZE])
+            params = storage._search_params(rows, enriched)
+            await s.run_sync(lambda sync_s: storage._index_search(sync_s, params))
+            await s.run_sync(lambda sync_s: storage._apply_aggregates(sync_s, exp_id, partial))
+            await s.commit()
+        exp_cache.invalidate(exp_id)
+        await _train_dict()
+
+    async def list_experiments(skip: int = 0, limit: int = 50, cursor: Optional[str] = None,
+                               model: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        async with _session() as s:
+            rows = (await s.exec(storage._list_query(skip, limit, cursor, model))).all()
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if len(rows) == limit else None
+        return [storage._exp_summary(e) for e in rows], next_cursor
+
+    async def get_experiment(exp_id: str, fields: Any = None) -> Dict[str, Any]:
+        fields = parse_fields(fields)
+        async with _session() as s:
+            exp = await s.get(Experiment, exp_id)
+            if not exp:
+                return {}
+            q = sa_select(*storage._response_columns(fields)).where(ResponseRecord.experiment_id == exp_id).order_by(
+                *storage._RESPONSE_ORDER)
+            resp_rows = (await s.execute(q)).all()
+        return {
+            "experiment": {"id": exp.id, "title": exp.title, "prompt": exp.prompt, "model": exp.model},
+            "responses": [storage._response_dict(r, fields) for r in resp_rows],
+        }
+
+    async def close() -> None:
+        await async_engine.dispose()
+
+elif BACKEND == "mongo":
+    async def create_experiment(title: Optional[str], prompt: str, model: str) -> str:
+        exp_id = str(uuid.uuid4())
+        await _db()["experiments"].insert_one(storage._exp_doc(exp_id, title, prompt, model))
+        return exp_id
+
+    async def add_responses(exp_id: str, enriched: List[Dict[str, Any]]) -> None:
+        db = _db()
+        docs = [storage._response_doc(exp_id, r) for r in enriched]
+        for i in range(0, len(docs), INSERT_BATCH_SIZE):
+            await db["responses"].insert_many(docs[i:i + INSERT_BATCH_SIZE], ordered=False)
+        ops = storage._aggregate_ops(exp_id, aggregates.fold(enriched))
+        for i in range(0, len(ops), INSERT_BATCH_SIZE):
+            await db["metric_aggregates"].bulk_write(ops[i:i + INSERT_BATCH_SIZE], ordered=False)
+        exp_cache.invalidate(exp_id)
+        await _train_dict()
+
+    async def list_experiments(skip: int = 0, limit: int = 50, cursor: Optional[str] = None,
+                               model: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        cur = _db()["experiments"].find(storage._list_query(cursor, model), {"_id": False}).sort(
+            [("created_at", DESCENDING), ("id", DESCENDING)])
+        if skip and not cursor:
+            cur = cur.skip(skip)
+        rows = await cur.limit(limit).to_list(length=limit)
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if len(rows) == limit else None
+        return rows, next_cursor
+
+    async def get_experiment(exp_id: str, fields: Any = None) -> Dict[str, Any]:
+        fields = parse_fields(fields)
+        db = _db()
+        exp = await db["experiments"].find_one({"id": exp_id}, {"_id": False})
+        if not exp:
+            return {}
+        rows = [storage._decode_doc(d) async for d in db["responses"].find(
+            {"experiment_id": exp_id}, storage._projection(fields)).sort("_id", ASCENDING)]
+        return {
+            "experiment": {k: exp[k] for k in ["id", "title", "prompt", "model"] if k in exp},
+            "responses": rows,
+        }
+
+    async def close() -> None:
+        if _motor is not None:
+            _motor.close()
+
+else:
+    async def create_experiment(title: Optional[str], prompt: str, model: str) -> str:
+        return await asyncio.to_thread(storage.create_experiment, title, prompt, model)
+
+    async def add_responses(exp_id: str, enriched: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(storage.add_responses, exp_id, enriched)
+
+    async def list_experiments(skip: int = 0, limit: int = 50, cursor: Optional[str] = None,
+                               model: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        return await asyncio.to_thread(storage.list_experiments, skip, limit, cursor, model)
+
+    async def get_experiment(exp_id: str, fields: Any = None) -> Dict[str, Any]:
+        return await asyncio.to_thread(storage.get_experiment, exp_id, fields)
+
+    async def close() -> None:
+        return None
+
+
+def _instrument(fn, stage: str):
+    # same DB_SECONDS / DB_ROWS series as the sync calls; the thread fallback is already counted there
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with telemetry.span(stage, telemetry.DB_SECONDS, op=fn.__name__):
+            result = await fn(*args, **kwargs)
+        if fn.__name__ == "add_responses":
+            result_rows = storage._row_count(kwargs.get("enriched", args[1] if len(args) > 1 else None))
+        else:
+            result_rows = storage._row_count(result)
+        telemetry.DB_ROWS.inc(result_rows, op=fn.__name__)
+        return result
+    return wrapper
+
+
+if BACKEND != "thread":
+    add_responses = _instrument(add_responses, "db_write")
+    get_experiment = _instrument(get_experiment, "db_read")
+    list_experiments = _instrument(list_experiments, "db_read")
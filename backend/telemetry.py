@@ -0,0 +1,229 @@
+# telemetry.py (stage timing spans, Prometheus-style counters/histograms for GET /metrics, sampled logging)
+import os
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# share of high-volume lines (per request / per provider call) that are kept; warnings and errors always are
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+# requests slower than this always get their per-stage breakdown logged, sampled or not
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+# model names come from requests, so the "model" label is bounded: METRICS_MODELS pins the names that get their
+# own series, otherwise the first METRICS_MAX_MODELS distinct ones do. Anything else is counted as "other"
+METRICS_MODELS = {m.strip() for m in os.getenv("METRICS_MODELS", "").split(",") if m.strip()}
+METRICS_MAX_MODELS = int(os.getenv("METRICS_MAX_MODELS", "32"))
+
+
+def configure_logging() -> None:
+    if not logging.getLogger().handlers:
+        logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger().setLevel(LOG_LEVEL)
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"llmlab.{name}")
+
+
+def sampled(logger: logging.Logger, level: int, msg: str, *args) -> None:
+    """Log a high-volume line for roughly LOG_SAMPLE_RATE of the calls."""
+    if logger.isEnabledFor(level) and (LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE):
+        logger.log(level, msg, *args)
+
+
+# ---------------- metrics ----------------
+
+def _escape(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+_seen_models: set = set()
+_models_lock = threading.Lock()
+
+
+def model_label(model: Any) -> str:
+    m = str(model or "")
+    if METRICS_MODELS:
+        return m if m in METRICS_MODELS else "other"
+    if m in _seen_models:
+        return m
+    with _models_lock:
+        if m in _seen_models or len(_seen_models) < METRICS_MAX_MODELS:
+            _seen_models.add(m)
+            return m
+    return "other"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(model_label(labels.get(n)) if n == "model" else str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return super().render() + [f"{self.name}{_labels(self.labelnames, k)} {v:g}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            st = self._values.get(key)
+            if st is None:
+                st = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    st[i] += 1
+                    break
+            st[-2] += value
+            st[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        out = super().render()
+        for key, st in items:
+            cumulative = 0
+            for b, c in zip(self.buckets, st):
+                cumulative += c
+                le = 'le="%g"' % b
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {st[-1]}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {st[-2]:.6f}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {st[-1]}")
+        return out
+
+
+_registry: List[_Metric] = []
+
+
+def render() -> str:
+    """Text exposition format (version 0.0.4) of every metric, for GET /metrics."""
+    lines: List[str] = []
+    for m in list(_registry):
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_SECONDS = Histogram("llmlab_http_request_seconds", "HTTP request latency by route", ["method", "route", "status"])
+PROVIDER_CALL_SECONDS = Histogram("llmlab_provider_call_seconds", "One generate() sweep, all param sets", ["provider", "model"])
+PROVIDER_REQUEST_SECONDS = Histogram("llmlab_provider_request_seconds", "One provider request (one param-set cell)",
+                                     ["provider", "model", "outcome"])
+PROVIDER_CELLS = Counter("llmlab_provider_cells_total", "Cells requested from providers (cache misses)", ["provider", "model"])
+PROVIDER_TOKENS = Counter("llmlab_provider_tokens_total", "Tokens reported (or estimated) per provider", ["provider", "model"])
+PROVIDER_RETRIES = Counter("llmlab_provider_retries_total", "Retried provider requests", ["provider", "model", "reason"])
+PROVIDER_STOPPED = Counter("llmlab_provider_stopped_total", "Generations cut short by live limits", ["provider", "model", "reason"])
+RATE_LIMIT_WAIT_SECONDS = Histogram("llmlab_rate_limit_wait_seconds", "Time queued in the rate limiter", ["provider", "model"])
+SCORING_SECONDS = Histogram("llmlab_scoring_seconds", "analyze_response_batch per batch")
+SCORING_BATCH_SIZE = Histogram("llmlab_scoring_batch_size", "Responses per scoring batch", buckets=SIZE_BUCKETS)
+DB_SECONDS = Histogram("llmlab_db_seconds", "Storage operations", ["op"])
+DB_ROWS = Counter("llmlab_db_rows_total", "Rows written or read", ["op"])
+EXPORT_SECONDS = Histogram("llmlab_export_seconds", "Export serialization, first to last byte", ["format"])
+EXPORT_BYTES = Counter("llmlab_export_bytes_total", "Bytes streamed by exports", ["format"])
+
+
+# ---------------- spans ----------------
+
+# per-request list of (stage, seconds); spans add to it so the request log line can break the time down
+_trace: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("llmlab_trace", default=None)
+
+
+def start_trace() -> contextvars.Token:
+    return _trace.set([])
+
+
+def end_trace(token: contextvars.Token) -> List[Tuple[str, float]]:
+    stages = _trace.get() or []
+    _trace.reset(token)
+    return stages
+
+
+def breakdown(stages: List[Tuple[str, float]]) -> str:
+    totals: Dict[str, float] = {}
+    for stage, seconds in stages:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return " ".join(f"{k}={1000 * v:.1f}ms" for k, v in totals.items())
+
+
+@contextmanager
+def span(stage: str, hist: Histogram, **labels):
+    """
+    Time a block into hist (with labels) and the current request's trace. If hist has
+    an "outcome" label it is ok / error from how the block exits, unless the block set
+    it on the yielded labels dict (e.g. a call that swallows its own errors).
+    """
+    t0 = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield labels
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        if "outcome" in hist.labelnames:
+            labels.setdefault("outcome", outcome)
+        hist.observe(seconds, **labels)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((stage, seconds))  # list.append is atomic, spans may end on worker threads
+
+
+def timed_stream(chunks: Iterator[Any], fmt: str) -> Iterator[Any]:
+    """Wrap an export body: first to last chunk goes to EXPORT_SECONDS, the size to EXPORT_BYTES."""
+    t0 = time.perf_counter()
+    total = 0
+    try:
+        for c in chunks:
+            total += len(c) if isinstance(c, (bytes, bytearray)) else len(c.encode("utf-8"))
+            yield c
+    finally:
+        EXPORT_SECONDS.observe(time.perf_counter() - t0, format=fmt)
+        EXPORT_BYTES.inc(total, format=fmt)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the backend modules import each other by bare name (python main.py / uvicorn main:app from this directory)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,214 @@
+# batch_mode against a local stand-in for the OpenAI files + batches API (OPENAI_BASE_URL)
+import json
+import uuid
+import threading
+from email import message_from_bytes
+from email.policy import default as email_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import batch_mode
+import response_cache
+
+
+class StubBatchAPI(ThreadingHTTPServer):
+    """
+    /v1/files, /v1/batches, /v1/files/{id}/content and /v1/responses, in memory. Each
+    batch reports in_progress on its first poll and completed after that. Request lines
+    whose custom_id is in `fail` go to the error file, those in `drop` are left out.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.files = {}
+        self.batches = {}
+        self.fail = set()
+        self.drop = set()
+        self.live_calls = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def add_file(self, data: bytes) -> str:
+        file_id = f"file-{uuid.uuid4().hex[:8]}"
+        self.files[file_id] = data
+        return file_id
+
+    def finish(self, batch):
+        out, err = [], []
+        for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+            req = json.loads(line)
+            cid = req["custom_id"]
+            if cid in self.drop:
+                continue
+            if cid in self.fail:
+                err.append({"id": f"req-{cid}", "custom_id": cid, "error": None, "response": {
+                    "status_code": 400, "body": {"error": {"message": f"bad request {cid}"}}}})
+                continue
+            out.append({"id": f"req-{cid}", "custom_id": cid, "error": None, "response": {
+                "status_code": 200,
+                "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": f"answer {cid}"}}]}}})
+        batch["status"] = "completed"
+        batch["output_file_id"] = self.add_file("".join(json.dumps(r) + "\n" for r in out).encode()) if out else None
+        batch["error_file_id"] = self.add_file("".join(json.dumps(r) + "\n" for r in err).encode()) if err else None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, status=200, raw=False):
+        data = body if raw else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream" if raw else "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_POST(self):
+        api = self.server
+        if self.path == "/v1/files":
+            msg = message_from_bytes(b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + self._body(),
+                                     policy=email_policy)
+            data = next(p.get_payload(decode=True) for p in msg.iter_parts() if p.get_filename())
+            self._send({"id": api.add_file(data), "object": "file", "bytes": len(data), "created_at": 0,
+                        "filename": "batch.jsonl", "purpose": "batch", "status": "processed"})
+        elif self.path == "/v1/batches":
+            req = json.loads(self._body())
+            batch = {"id": f"batch_{uuid.uuid4().hex[:8]}", "object": "batch", "endpoint": req["endpoint"],
+                     "input_file_id": req["input_file_id"], "completion_window": req["completion_window"],
+                     "status": "validating", "created_at": 0, "polls": 0}
+            with api.lock:
+                api.batches[batch["id"]] = batch
+            self._send(batch)
+        elif self.path == "/v1/responses":
+            req = json.loads(self._body())
+            with api.lock:
+                api.live_calls += 1
+            self._send({"id": "resp_1", "object": "response", "created_at": 0, "model": req["model"], "status": "completed",
+                        "output": [{"type": "message", "id": "msg_1", "role": "assistant", "status": "completed",
+                                    "content": [{"type": "output_text", "text": f"live {req['input']}", "annotations": []}]}],
+                        "usage": {"input_tokens": 1, "output_tokens": 2, "total_tokens": 3}})
+        else:
+            self._send({"error": {"message": "not found"}}, 404)
+
+    def do_GET(self):
+        api = self.server
+        parts = self.path.strip("/").split("/")
+        if parts[:2] == ["v1", "batches"] and parts[2] in api.batches:
+            with api.lock:
+                batch = api.batches[parts[2]]
+                batch["polls"] += 1
+                if batch["status"] in ("validating", "in_progress"):
+                    if batch["polls"] == 1:
+                        batch["status"] = "in_progress"
+                    else:
+                        api.finish(batch)
+                self._send({k: v for k, v in batch.items() if k != "polls"})
+        elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in api.files:
+            self._send(api.files[parts[2]], raw=True)
+        else:
+            self._send({"error": {"message": "not found"}}, 404)
+
+
+@pytest.fixture
+def api(monkeypatch):
+    server = StubBatchAPI()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+    # a fresh key per test, so the client registry builds a client for this server
+    monkeypatch.setenv("OPENAI_API_KEY", f"sk-test-{uuid.uuid4().hex}")
+    monkeypatch.setattr(batch_mode, "BATCH_POLL_SECONDS", 0.0)
+    response_cache.cache.clear()
+    yield server
+    server.shutdown()
+    server.server_close()
+    response_cache.cache.clear()
+
+
+PARAM_SETS = [{"temperature": 0.2, "n": 2}, {"temperature": 0.7}, {"temperature": 1.0, "prompt_override": "Other prompt"}]
+
+
+def test_build_jsonl_one_line_per_cell():
+    lines = [json.loads(l) for l in batch_mode.build_jsonl("Prompt", PARAM_SETS, [0, 2], "gpt-4o-mini").splitlines()]
+    assert [l["custom_id"] for l in lines] == ["set-0-0", "set-0-1", "set-2-0"]
+    assert lines[0]["url"] == batch_mode.BATCH_ENDPOINT
+    assert lines[0]["body"]["messages"][0]["content"] == "Prompt"
+    assert lines[2]["body"]["messages"][0]["content"] == "Other prompt"
+
+
+def test_submit_wait_collect(api):
+    api.fail.add("set-1-0")
+    batch_id = batch_mode.submit("openai", "gpt-4o-mini", "Prompt", PARAM_SETS, [0, 1])
+    batch = batch_mode.wait("openai", batch_id, poll_seconds=0)
+    assert batch.status == "completed"
+    assert api.batches[batch_id]["polls"] == 2
+    rows = batch_mode.collect("openai", batch)
+    assert set(rows) == {"set-0-0", "set-0-1", "set-1-0"}
+    assert batch_mode._text_or_error(rows["set-0-1"]) == ("answer set-0-1", None)
+    assert batch_mode._text_or_error(rows["set-1-0"]) == (None, "bad request set-1-0")
+
+
+def test_wait_gives_up_after_max_wait(api):
+    batch_id = batch_mode.submit("openai", "gpt-4o-mini", "Prompt", PARAM_SETS, [0])
+    with pytest.raises(batch_mode.BatchError):
+        batch_mode.wait("openai", batch_id, poll_seconds=0, max_wait=-1)
+
+
+def test_generate_batch_results_errors_and_missing_lines(api):
+    api.fail.add("set-0-1")
+    api.drop.add("set-2-0")
+    submitted = []
+    out = batch_mode.generate_batch("openai", "Prompt", PARAM_SETS, "gpt-4o-mini",
+                                    on_submit=lambda batch_id, indices: submitted.append((batch_id, indices)))
+    assert len(out) == 4
+    assert [r["param_set"] for r in out] == [PARAM_SETS[0], PARAM_SETS[0], PARAM_SETS[1], PARAM_SETS[2]]
+    assert out[0] == {"param_set": PARAM_SETS[0], "text": "answer set-0-0"}
+    assert out[1]["error"] == "bad request set-0-1" and out[1]["text"] == ""
+    assert out[2]["text"] == "answer set-1-0"
+    assert out[3]["error"] == "missing from batch output"
+    assert [indices for _, indices in submitted] == [[0, 1, 2]]
+    # only the fully successful param set is cached
+    hits, misses = response_cache.lookup("openai", "gpt-4o-mini", "Prompt", PARAM_SETS)
+    assert list(hits) == [1] and misses == [0, 2]
+
+
+def test_generate_batch_submits_only_cache_misses(api):
+    response_cache.store("openai", "gpt-4o-mini", "Prompt", PARAM_SETS[1],
+                         [{"param_set": PARAM_SETS[1], "text": "cached"}])
+    submitted = []
+    out = batch_mode.generate_batch("openai", "Prompt", PARAM_SETS, "gpt-4o-mini",
+                                    on_submit=lambda batch_id, indices: submitted.append(indices))
+    assert submitted == [[0, 2]]
+    assert [r["text"] for r in out] == ["answer set-0-0", "answer set-0-1", "cached", "answer set-2-0"]
+    assert out[2].get("cached") is True
+
+
+def test_generate_batch_resumes_with_submitted_indices(api):
+    response_cache.store("openai", "gpt-4o-mini", "Prompt", PARAM_SETS[1],
+                         [{"param_set": PARAM_SETS[1], "text": "cached"}])
+    batch_id = batch_mode.submit("openai", "gpt-4o-mini", "Prompt", PARAM_SETS, [0, 2])
+    # a restart: the in-memory cache no longer has the hit the batch was submitted around
+    response_cache.cache.clear()
+    submitted = []
+    out = batch_mode.generate_batch("openai", "Prompt", PARAM_SETS, "gpt-4o-mini", batch_id=batch_id,
+                                    batch_indices=[0, 2], on_submit=lambda *a: submitted.append(a))
+    assert submitted == [] and len(api.batches) == 1
+    assert [r["text"] for r in out] == ["answer set-0-0", "answer set-0-1", "live Prompt", "answer set-2-0"]
+    assert not any(r.get("error") for r in out)
+    assert api.live_calls == 1
+
+
+def test_collect_raises_for_failed_batch(api):
+    batch_id = batch_mode.submit("openai", "gpt-4o-mini", "Prompt", PARAM_SETS, [0])
+    api.batches[batch_id].update(status="failed", polls=1)
+    batch = batch_mode.wait("openai", batch_id, poll_seconds=0)
+    with pytest.raises(batch_mode.BatchError):
+        batch_mode.collect("openai", batch)
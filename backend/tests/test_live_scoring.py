@@ -0,0 +1,68 @@
+# live_scoring: the finished IncrementalScorer snapshot must match score_batch on the same text
+import random
+
+import pytest
+
+import live_scoring
+import metrics
+
+TOKEN_METRICS = ["lexical_diversity", "repetition", "length_ok", "keyword_coverage", "clarity_score"]
+PROMPT = "Explain how photosynthesis converts sunlight into chemical energy in plants."
+
+TEXTS = [
+    "Photosynthesis converts sunlight. Plants store chemical energy! Isn't it neat? yes",
+    "the the the the the the the the the the the the",
+    "  Leading space, trailing word without punctuation",
+    "Ends with a period.",
+    "Sentence one.Sentence two?  Three!\n\nFour plants don't sleep; energy flows",
+    "",
+    "...!!! ??? no tokens before this",
+    "Naïve café résumé: photosynthesis, PLANTS, Sunlight. sunlight sunlight sunlight again and again and again",
+]
+
+
+def _chunks(text, rng):
+    out, i = [], 0
+    while i < len(text):
+        n = rng.randint(1, 7)
+        out.append(text[i:i + n])
+        i += n
+    return out
+
+
+def _expected(text):
+    return metrics.score_batch(PROMPT, [text], TOKEN_METRICS)[0]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_finished_snapshot_matches_score_batch(text):
+    rng = random.Random(text)
+    for _ in range(20):
+        sc = live_scoring.IncrementalScorer(PROMPT)
+        for c in _chunks(text, rng):
+            sc.feed(c)
+        snap = sc.finish().snapshot()
+        assert {k: snap[k] for k in TOKEN_METRICS} == _expected(text)
+
+
+def test_unfinished_scorer_misses_the_last_token():
+    sc = live_scoring.IncrementalScorer(PROMPT)
+    sc.feed("plants need sunlight")
+    assert sc.n_tokens == 2
+    assert sc.finish().n_tokens == 3
+
+
+def test_guard_finish_after_stop_matches_score_batch():
+    # a cell cut short by max_words: the partial text is what gets scored and stored
+    text = " ".join(f"word{i % 7} plants." for i in range(40))
+    guard = live_scoring.Guard(live_scoring.Limits(max_words=25, min_words=0), [PROMPT])
+    hook = guard.hook()
+    collected = []
+    with pytest.raises(live_scoring.StopGeneration) as stop:
+        for c in _chunks(text, random.Random(0)):
+            collected.append(c)
+            hook(0, c)
+    assert stop.value.reason == "max_words"
+    snap = guard.finish(0)
+    assert {k: snap[k] for k in TOKEN_METRICS} == _expected("".join(collected).strip())
+    assert guard.finish(1) == {}
@@ -0,0 +1,99 @@
+# textcodec.py (zlib compression of response texts with a per-store preset dictionary)
+import os
+import zlib
+import threading
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
+
+TEXT_COMPRESSION = os.getenv("TEXT_COMPRESSION", "zlib").lower()  # zlib | none
+TEXT_COMPRESSION_LEVEL = int(os.getenv("TEXT_COMPRESSION_LEVEL", "6"))
+ZDICT_SIZE = int(os.getenv("TEXT_ZDICT_SIZE", "32768"))  # zlib only looks back 32 KB
+ZDICT_MIN_SAMPLES = int(os.getenv("TEXT_ZDICT_MIN_SAMPLES", "200"))
+
+NO_DICT = 0
+
+
+def enabled() -> bool:
+    return TEXT_COMPRESSION == "zlib"
+
+
+def build_zdict(samples: List[str], size: int = ZDICT_SIZE) -> bytes:
+    """
+    Preset dictionary from the phrases (1-3 words) that recur across samples, most
+    frequent last: zlib references the end of the dictionary with the shortest distances.
+    """
+    counts: Counter = Counter()
+    for text in samples:
+        words = text.split()
+        for n in (3, 2, 1):
+            counts.update(" ".join(words[i:i + n]) for i in range(len(words) - n + 1))
+    picked: List[bytes] = []
+    used = 0
+    for phrase, c in counts.most_common():
+        if c < 2:
+            break
+        b = (phrase + " ").encode("utf-8")
+        if used + len(b) > size:
+            continue
+        picked.append(b)
+        used += len(b)
+        if used >= size - 8:
+            break
+    return b"".join(reversed(picked))
+
+
+def compress(text: str, zdict: Optional[bytes] = None) -> bytes:
+    c = zlib.compressobj(TEXT_COMPRESSION_LEVEL, zdict=zdict) if zdict else zlib.compressobj(TEXT_COMPRESSION_LEVEL)
+    return c.compress(text.encode("utf-8")) + c.flush()
+
+
+def decompress(blob: bytes, zdict: Optional[bytes] = None) -> str:
+    d = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+    return (d.decompress(blob) + d.flush()).decode("utf-8")
+
+
+class Codec:
+    """
+    Holds the store's dictionaries by id. Until one exists texts are compressed without
+    a dictionary while samples accumulate; once ZDICT_MIN_SAMPLES are seen the caller
+    builds one (ready_to_train / train) and persists it, and new rows use it.
+    """
+
+    def __init__(self):
+        self.dicts: Dict[int, bytes] = {}
+        self.current = NO_DICT
+        self._samples: List[str] = []
+        self._lock = threading.Lock()
+
+    def load(self, dicts: Dict[int, bytes]) -> None:
+        with self._lock:
+            self.dicts.update(dicts)
+            if dicts:
+                self.current = max(self.dicts)
+
+    def encode(self, text: str) -> Tuple[bytes, int]:
+        dict_id = self.current
+        if dict_id == NO_DICT and len(self._samples) < ZDICT_MIN_SAMPLES and text:
+            with self._lock:
+                self._samples.append(text)
+        return compress(text, self.dicts.get(dict_id)), dict_id
+
+    def decode(self, blob: bytes, dict_id: Optional[int]) -> str:
+        dict_id = dict_id or NO_DICT
+        if dict_id != NO_DICT and dict_id not in self.dicts:
+            raise KeyError(dict_id)
+        return decompress(blob, self.dicts.get(dict_id))
+
+    def ready_to_train(self) -> bool:
+        return self.current == NO_DICT and len(self._samples) >= ZDICT_MIN_SAMPLES
+
+    def train(self) -> Optional[bytes]:
+        with self._lock:
+            samples, self._samples = self._samples, []
+        data = build_zdict(samples)
+        return data or None
+
+    def add(self, dict_id: int, data: bytes) -> None:
+        with self._lock:
+            self.dicts[dict_id] = data
+            self.current = max(self.current, dict_id)
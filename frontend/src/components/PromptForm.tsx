@@ -5,7 +5,7 @@ import { createExperiment } from "../lib/api";
 import type {
   CreateExperimentPayload,
   CreateExperimentResponse,
-  ParamSet,
+  GridSpec,
   Provider,
 } from "../lib/types";
 
@@ -22,15 +22,6 @@ function clamp(n: number, lo: number, hi: number): number {
   return Math.max(lo, Math.min(hi, n));
 }
 
-function sweep(min: number, max: number, steps = 3): number[] {
-  if (steps <= 1) return [min];
-  const out: number[] = [];
-  const step = (max - min) / (steps - 1);
-  for (let i = 0; i < steps; i++)
-    out.push(parseFloat((min + i * step).toFixed(2)));
-  return out;
-}
-
 function DualRange({
   value,
   onChange,
@@ -319,21 +310,13 @@ export default function PromptForm({
   // Simple dismiss handler for the modal
   const closeAlert = () => setAlertData(null);
 
-  function buildParamSets(): ParamSet[] {
-    const temps = sweep(tempRange[0], tempRange[1], steps);
-    const topps = sweep(toppRange[0], toppRange[1], steps);
-    const out: ParamSet[] = [];
-    for (const t of temps) {
-      for (const p of topps) {
-        // inside buildParamSets():
-        out.push({
-          temperature: clamp(t, 0, 2),
-          top_p: clamp(p, 0, 1),
-          max_tokens: 256,
-        });
-      }
-    }
-    return out;
+  // the backend expands the grid (temperature x top_p), so one small request covers the sweep
+  function buildGrid(): GridSpec {
+    return {
+      temperature: { min: clamp(tempRange[0], 0, 2), max: clamp(tempRange[1], 0, 2), steps },
+      top_p: { min: clamp(toppRange[0], 0, 1), max: clamp(toppRange[1], 0, 1), steps },
+      max_tokens: 256,
+    };
   }
 
   const applyPreset = (name: keyof typeof PRESETS): void => {
@@ -636,7 +619,8 @@ export default function PromptForm({
               prompt,
               provider,
               model: model || undefined,
-              param_sets: buildParamSets(),
+              grid: buildGrid(),
+              mode: "sync",
             })
           }
         >
@@ -5,6 +5,7 @@ export interface ExperimentSummary {
   title?: string;
   prompt?: string;
   model?: string;
+  created_at?: string;
 }
 
 export interface Metrics {
@@ -32,22 +33,42 @@ export interface ExperimentData {
 
 export interface ExperimentsListResponse {
   experiments: ExperimentSummary[];
+  next_cursor?: string | null;
 }
 
 export interface ParamSet {
   temperature: number;
   top_p: number;
   max_tokens: number;
-  // n: number;
+  n?: number;
   prompt_override?: string;
 }
 
+export interface AxisRange {
+  min: number;
+  max: number;
+  steps: number;
+}
+
+export type AxisSpec = number[] | AxisRange | number;
+
+// compact sweep, expanded (and de-duplicated) by the backend
+export interface GridSpec {
+  temperature?: AxisSpec;
+  top_p?: AxisSpec;
+  max_tokens?: AxisSpec;
+  n?: AxisSpec;
+}
+
 export interface CreateExperimentPayload {
   title: string;
   prompt: string;
+  prompts?: string[];
   provider: Provider;
   model?: string;
-  param_sets: ParamSet[];
+  param_sets?: ParamSet[];
+  grid?: GridSpec;
+  mode?: "sync" | "job" | "batch";
 }
 
 export interface CreateExperimentResponse {